@@ -1,18 +1,25 @@
 import base64
 import binascii
+import logging
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from services import analysis_llm, answer_llm, answer_llm2
+from auth import get_current_user, is_admin
+from config import settings
+from services import analysis_batch, analysis_cache, analysis_jobs, analysis_llm, analysis_sessions, analysis_stream, answer_llm, answer_llm2, history_export, uploads, usage_stats
+from services.single_flight import SingleFlight, normalize_query
 from services.answer_llm import AnswerResponse as AnswerResponseV1
 from services.answer_llm2 import AnswerResponse as AnswerResponseV2
 from services.analysis_llm import AnalysisResult
+from services.analysis_sessions import AnalysisAnswer
+from services.document_extract import SUPPORTED_EXTENSIONS
 from database import (
     get_db,
     log_assistant_history,
@@ -22,6 +29,8 @@ from database import (
     GeneralTaskHistoryDB,
     get_general_task_by_token,
     get_general_history_for_user,
+    get_general_task_payload,
+    set_general_task_payload,
     ensure_credit_available,
     spend_credits_for_task,
     InsufficientCreditsError,
@@ -32,10 +41,16 @@ from models import (
     GeneralResponsePayload,
     GeneralSource,
     HistoryEntry,
+    User,
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/assistant", tags=["assistant"])
 
+# Concurrent identical /query and /query-v2 requests share one pipeline run.
+_query_flights = SingleFlight("assistant_query")
+
 
 class QueryRequest(BaseModel):
     query: str
@@ -45,6 +60,7 @@ class QueryRequest(BaseModel):
     task_name: Optional[str] = "General"
     user_id: Optional[str] = None
     user_email: Optional[str] = None
+    include_timings: Optional[bool] = False
 
 
 class GeneralHistoryCreate(BaseModel):
@@ -62,11 +78,65 @@ class CreditBalanceResponse(BaseModel):
     last_update_time: datetime
 
 
+class StatsBucket(BaseModel):
+    key: Optional[str] = None
+    requests: int
+    avg_ms: Optional[float] = None
+    p50_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+    p99_ms: Optional[float] = None
+    credits_spent: int
+
+
+class StatsResponse(BaseModel):
+    group_by: str
+    since: datetime
+    buckets: List[StatsBucket]
+
+
+class AnalysisJobStatus(BaseModel):
+    token: str
+    status: str
+    stage: str
+    progress: float
+    result: Optional[AnalysisResult] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    @classmethod
+    def from_job(cls, job: dict) -> "AnalysisJobStatus":
+        return cls(
+            token=job["token"],
+            status=job["status"],
+            stage=job["stage"],
+            progress=job["progress"],
+            result=job.get("result"),
+            error=job.get("error"),
+            created_at=datetime.utcfromtimestamp(job["created_at"]),
+            updated_at=datetime.utcfromtimestamp(job["updated_at"]),
+        )
+
+
 class AnalysisRequest(BaseModel):
     text: Optional[str] = None
     pdf_base64: Optional[str] = None
     instructions: Optional[str] = None
     top_points: Optional[int] = 5
+    mode: Optional[str] = "auto"
+
+
+class AnalysisBatchItem(AnalysisRequest):
+    id: Optional[str] = None
+
+
+class AnalysisBatchRequest(BaseModel):
+    documents: List[AnalysisBatchItem]
+
+
+class AnalysisQuestion(BaseModel):
+    question: str
+    top_k: Optional[int] = None
 
 
 def _build_general_response(payload: dict) -> GeneralResponsePayload:
@@ -84,7 +154,7 @@ def _build_general_response(payload: dict) -> GeneralResponsePayload:
 
 
 def _db_record_to_general_task_record(record: GeneralTaskHistoryDB) -> GeneralTaskRecord:
-    response_payload = record.response_payload or {}
+    response_payload = get_general_task_payload(record)
     response = _build_general_response(response_payload)
     return GeneralTaskRecord(
         id=record.id,
@@ -111,6 +181,13 @@ def _resolve_user_id(db: Session, user_id: Optional[str], user_email: Optional[s
     return None
 
 
+def _without_timings(result, include_timings: Optional[bool]):
+    """Stage timings go to history always, to the client only on request (results may be shared)."""
+    if include_timings or result.timings is None:
+        return result
+    return result.model_copy(update={"timings": None})
+
+
 @router.post("/query", response_model=AnswerResponseV1)
 async def run_query(request: QueryRequest, db: Session = Depends(get_db)):
     """
@@ -126,12 +203,16 @@ async def run_query(request: QueryRequest, db: Session = Depends(get_db)):
 
     try:
         start_time = time.perf_counter()
-        result = await run_in_threadpool(
-            answer_llm.answer_query,
-            request.query,
-            top_k=top_k,
-            threshold=threshold,
-            do_validate=do_validate,
+        query = normalize_query(request.query)
+        result = await _query_flights.run(
+            ("v1", query, top_k, threshold, do_validate),
+            lambda: run_in_threadpool(
+                answer_llm.answer_query,
+                query,
+                top_k=top_k,
+                threshold=threshold,
+                do_validate=do_validate,
+            ),
         )
         response_time_ms = int((time.perf_counter() - start_time) * 1000)
     except ValueError as exc:
@@ -154,35 +235,36 @@ async def run_query(request: QueryRequest, db: Session = Depends(get_db)):
                 question=request.query,
                 answer=result.answer,
                 response_time_ms=response_time_ms,
+                stage_timings=result.timings.model_dump() if result.timings else None,
             )
         except Exception:
             # History persistence should not block the response; already logged inside helper.
             pass
 
-    return result
+    return _without_timings(result, request.include_timings)
 
 
-@router.post("/analysis", response_model=AnalysisResult)
-async def analyse_document(request: AnalysisRequest) -> AnalysisResult:
-    """
-    Analyse either plain text or a base64-encoded PDF and return a structured summary.
-    """
+def _analysis_spec(request: AnalysisRequest) -> dict:
+    """Validate an AnalysisRequest into the arguments shared by /analysis and /analysis/jobs."""
     max_points = request.top_points if (request.top_points and request.top_points > 0) else 5
 
     instructions = (request.instructions or "").strip()
-    has_pdf = bool(request.pdf_base64)
-
-    if not has_pdf and request.text and request.text.strip():
-        text = request.text.strip()
-        return await run_in_threadpool(
-            analysis_llm.analyse_text,
-            text,
-            max_tokens=analysis_llm.MAX_INPUT_TOKENS,
-            max_points=max_points,
-            source="text",
+    mode = request.mode or "auto"
+    if mode not in analysis_llm.ANALYSIS_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid mode '{mode}'. Use one of: {', '.join(analysis_llm.ANALYSIS_MODES)}.",
         )
 
+    if not request.pdf_base64 and request.text and request.text.strip():
+        return {"text": request.text.strip(), "max_points": max_points, "mode": mode}
+
     if request.pdf_base64:
+        if len(request.pdf_base64) // 4 * 3 > settings.MAX_UPLOAD_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"PDF exceeds the maximum upload size of {settings.MAX_UPLOAD_SIZE} bytes.",
+            )
         try:
             pdf_bytes = base64.b64decode(request.pdf_base64, validate=True)
         except (binascii.Error, ValueError) as exc:
@@ -191,18 +273,201 @@ async def analyse_document(request: AnalysisRequest) -> AnalysisResult:
         if not pdf_bytes:
             raise HTTPException(status_code=400, detail="Decoded PDF content is empty.")
 
-        result = await run_in_threadpool(
-            analysis_llm.analyse_pdf,
-            pdf_bytes,
-            instructions=instructions or (request.text.strip() if request.text and request.text.strip() else None),
-            max_tokens=analysis_llm.MAX_INPUT_TOKENS,
-            max_points=max_points,
-        )
-        return result
+        return {
+            "pdf": pdf_bytes,
+            "instructions": instructions or (request.text.strip() if request.text and request.text.strip() else None),
+            "max_points": max_points,
+            "mode": mode,
+        }
 
     raise HTTPException(status_code=400, detail="Provide either 'text' or 'pdf_base64' in the request body.")
 
 
+@router.post("/analysis", response_model=AnalysisResult)
+async def analyse_document(request: AnalysisRequest) -> AnalysisResult:
+    """
+    Analyse either plain text or a base64-encoded PDF and return a structured summary.
+    """
+    spec = _analysis_spec(request)
+    return await run_in_threadpool(analysis_cache.analyse_spec, spec)
+
+
+@router.post("/analysis/stream")
+async def stream_document_analysis(request: AnalysisRequest) -> StreamingResponse:
+    """
+    Analyse text or a base64-encoded PDF and stream the result as server-sent events.
+
+    Sections (summary, analysis, key_points, ...) are sent as soon as the model has written
+    them; the final ``result`` event carries the complete AnalysisResult.
+    """
+    spec = _analysis_spec(request)
+    return StreamingResponse(
+        analysis_stream.stream_analysis(spec),
+        media_type="text/event-stream",
+        headers=analysis_stream.SSE_HEADERS,
+    )
+
+
+@router.post("/analysis/jobs", response_model=AnalysisJobStatus, status_code=202)
+async def create_analysis_job(request: AnalysisRequest) -> AnalysisJobStatus:
+    """
+    Queue an analysis and return its token immediately; poll GET /analysis/jobs/{token}.
+    """
+    spec = _analysis_spec(request)
+    try:
+        job = await analysis_jobs.get_backend().submit(spec)
+    except analysis_jobs.JobQueueFullError as exc:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many analysis jobs are waiting; try again shortly.",
+            headers={"Retry-After": "30"},
+        ) from exc
+    except Exception as exc:
+        logger.exception("Failed to queue analysis job")
+        raise HTTPException(status_code=503, detail="Analysis job queue is unavailable.") from exc
+    return AnalysisJobStatus.from_job(job)
+
+
+@router.post("/analysis/batch")
+async def analyse_batch(request: AnalysisBatchRequest) -> StreamingResponse:
+    """
+    Analyse several documents concurrently and stream one NDJSON line per document as it finishes.
+
+    A document that fails validation or analysis gets a "failed" line with the reason; the rest
+    of the batch carries on. The last line summarises the batch. Batches over
+    ANALYSIS_BATCH_MAX_DOCUMENTS documents or ANALYSIS_BATCH_MAX_BYTES in total get 413.
+    """
+    if not request.documents:
+        raise HTTPException(status_code=400, detail="Provide at least one document.")
+    if len(request.documents) > analysis_batch.ANALYSIS_BATCH_MAX_DOCUMENTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch may contain at most {analysis_batch.ANALYSIS_BATCH_MAX_DOCUMENTS} documents.",
+        )
+    # Decoded PDF size plus text length, checked before any document is decoded.
+    total_bytes = sum(
+        len(document.pdf_base64 or "") // 4 * 3 + len(document.text or "") for document in request.documents
+    )
+    if total_bytes > analysis_batch.ANALYSIS_BATCH_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch may carry at most {analysis_batch.ANALYSIS_BATCH_MAX_BYTES} bytes of documents in total.",
+        )
+
+    entries = []
+    for index, document in enumerate(request.documents):
+        entry = analysis_batch.BatchEntry(index=index, id=document.id)
+        try:
+            entry.spec = _analysis_spec(document)
+        except HTTPException as exc:
+            entry.error = str(exc.detail)
+        entries.append(entry)
+
+    return StreamingResponse(analysis_batch.stream_batch(entries), media_type="application/x-ndjson")
+
+
+@router.get("/analysis/jobs/{token}", response_model=AnalysisJobStatus)
+async def get_analysis_job(token: str) -> AnalysisJobStatus:
+    """
+    Return the status, stage and progress of an analysis job, plus its result once finished.
+    """
+    try:
+        job = await run_in_threadpool(analysis_jobs.get_backend().get, token)
+    except Exception as exc:
+        logger.exception("Failed to read analysis job %s", token)
+        raise HTTPException(status_code=503, detail="Analysis job store is unavailable.") from exc
+    if job is None:
+        raise HTTPException(status_code=404, detail="Analysis job not found or expired.")
+    return AnalysisJobStatus.from_job(job)
+
+
+def _form_int(fields: dict, name: str, default: int) -> int:
+    value = (fields.get(name) or "").strip()
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"'{name}' must be an integer.") from exc
+
+
+@router.post("/analysis/upload", response_model=AnalysisResult)
+async def analyse_uploaded_document(request: Request) -> AnalysisResult:
+    """
+    Analyse a PDF, DOCX or TXT file sent as multipart/form-data (field
+    ``file``), with optional ``instructions``, ``top_points`` and ``mode`` form fields.
+
+    The file is streamed to a spooled temp file and rejected with 413 as soon
+    as it grows past MAX_UPLOAD_SIZE.
+    """
+    try:
+        upload, fields = await uploads.receive_upload(request, max_bytes=settings.MAX_UPLOAD_SIZE)
+    except uploads.UploadTooLargeError as exc:
+        raise HTTPException(status_code=413, detail=str(exc)) from exc
+    except uploads.InvalidUploadError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    try:
+        allowed = {ext.strip().lower() for ext in settings.ALLOWED_EXTENSIONS}
+        accepted = [ext for ext in SUPPORTED_EXTENSIONS if ext in allowed]
+        if upload.extension not in accepted:
+            raise HTTPException(
+                status_code=415,
+                detail=f"Unsupported file type. Upload one of: {', '.join(accepted)}.",
+            )
+        if not upload.size:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+
+        top_points = _form_int(fields, "top_points", 5)
+        max_points = top_points if top_points > 0 else 5
+        mode = (fields.get("mode") or "auto").strip()
+        if mode not in analysis_llm.ANALYSIS_MODES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid mode '{mode}'. Use one of: {', '.join(analysis_llm.ANALYSIS_MODES)}.",
+            )
+        instructions = (fields.get("instructions") or "").strip() or None
+
+        def _run() -> AnalysisResult:
+            with upload.open_buffer() as data:
+                return analysis_cache.analyse_document(
+                    data,
+                    extension=upload.extension,
+                    instructions=instructions,
+                    max_tokens=analysis_llm.MAX_INPUT_TOKENS,
+                    max_points=max_points,
+                    mode=mode,
+                    path=upload.path,
+                )
+
+        return await run_in_threadpool(_run)
+    finally:
+        upload.close()
+
+
+@router.post("/analysis/{token}/ask", response_model=AnalysisAnswer)
+async def ask_about_analysis(token: str, request: AnalysisQuestion) -> AnalysisAnswer:
+    """
+    Answer a follow-up question about an analysed document from its most
+    relevant chunks. The document is chunked and embedded on the first question.
+    """
+    question = request.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question cannot be empty.")
+    top_k = request.top_k if request.top_k and request.top_k > 0 else analysis_sessions.ANALYSIS_ASK_TOP_K
+    try:
+        answer = await run_in_threadpool(analysis_cache.ask, token, question, top_k=min(top_k, 20))
+    except Exception as exc:
+        logger.exception("Follow-up question on analysis %s failed", token)
+        raise HTTPException(status_code=503, detail="Could not answer the question right now.") from exc
+    if answer is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Analysis session not found or expired; analyse the document again.",
+        )
+    return answer
+
+
 @router.post("/query-v2", response_model=AnswerResponseV2)
 async def run_query_v2(request: QueryRequest, db: Session = Depends(get_db)):
     """
@@ -228,12 +493,16 @@ async def run_query_v2(request: QueryRequest, db: Session = Depends(get_db)):
 
     try:
         start_time = time.perf_counter()
-        result = await run_in_threadpool(
-            answer_llm2.answer_query,
-            request.query,
-            top_k=top_k,
-            threshold=threshold,
-            validate=do_validate,
+        query = normalize_query(request.query)
+        result = await _query_flights.run(
+            ("v2", query, top_k, threshold, do_validate),
+            lambda: run_in_threadpool(
+                answer_llm2.answer_query,
+                query,
+                top_k=top_k,
+                threshold=threshold,
+                validate=do_validate,
+            ),
         )
         response_time_ms = int((time.perf_counter() - start_time) * 1000)
     except ValueError as exc:
@@ -263,11 +532,12 @@ async def run_query_v2(request: QueryRequest, db: Session = Depends(get_db)):
                 question=request.query,
                 answer=result.answer,
                 response_time_ms=response_time_ms,
+                stage_timings=result.timings.model_dump() if result.timings else None,
             )
         except Exception:
             pass
 
-    return result
+    return _without_timings(result, request.include_timings)
 
 
 @router.post("/general-history", response_model=GeneralTaskRecord)
@@ -296,7 +566,7 @@ async def create_general_history_entry(request: GeneralHistoryCreate, db: Sessio
         existing.task_name = request.task_name or existing.task_name
         existing.query = request.query
         existing.answer = request.response.answer
-        existing.response_payload = payload_dict
+        set_general_task_payload(db, existing, payload_dict)
         existing.created_at = created_at
         db.commit()
         db.refresh(existing)
@@ -405,6 +675,85 @@ async def get_history(
     return combined[:limit]
 
 
+@router.get("/history/export")
+async def export_history(
+    user_id: Optional[str] = None,
+    user_email: Optional[str] = None,
+    format: str = "ndjson",
+    gzip: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Stream the user's full assistant and general task history as NDJSON or CSV.
+    Defaults to the caller's own history; only admins may export another user's.
+    """
+    if format not in history_export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'.")
+
+    canonical_user_id = current_user.id
+    if user_id or user_email:
+        canonical_user_id = _resolve_user_id(db, user_id, user_email)
+        if not canonical_user_id:
+            raise HTTPException(status_code=404, detail="User not found.")
+    if canonical_user_id != current_user.id and not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Only admins can export other users' history.")
+
+    filename = history_export.export_filename(format, gzip)
+    return StreamingResponse(
+        history_export.iter_history_export(canonical_user_id, fmt=format, compress=gzip),
+        media_type=history_export.export_media_type(format, gzip),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/stats", response_model=StatsResponse)
+async def get_usage_stats(
+    group_by: str = "hour",
+    hours: int = 24,
+    user_id: Optional[str] = None,
+    user_email: Optional[str] = None,
+    task_name: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Return request counts, latency percentiles and credit spend from the hourly rollups.
+    Admins see every user; everyone else only their own usage.
+    """
+    if group_by not in usage_stats.GROUP_BY_OPTIONS:
+        raise HTTPException(status_code=400, detail="group_by must be 'hour', 'task' or 'user'.")
+    if hours <= 0 or hours > 24 * 90:
+        raise HTTPException(status_code=400, detail="hours must be between 1 and 2160.")
+
+    canonical_user_id: Optional[str] = None
+    if user_id or user_email:
+        canonical_user_id = _resolve_user_id(db, user_id, user_email)
+        if not canonical_user_id:
+            raise HTTPException(status_code=404, detail="User not found.")
+    if not is_admin(current_user):
+        if canonical_user_id and canonical_user_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Only admins can read other users' stats.")
+        canonical_user_id = current_user.id
+
+    try:
+        await run_in_threadpool(usage_stats.maybe_refresh, db)
+    except Exception as exc:
+        # Serve the last rollup state rather than failing the request.
+        logger.error("Failed to refresh usage stats: %s", exc)
+
+    since = datetime.utcnow() - timedelta(hours=hours)
+    buckets = await run_in_threadpool(
+        usage_stats.get_stats,
+        db,
+        since=since,
+        group_by=group_by,
+        user_id=canonical_user_id,
+        task_name=task_name,
+    )
+    return StatsResponse(group_by=group_by, since=since, buckets=buckets)
+
+
 @router.get("/credits", response_model=CreditBalanceResponse)
 async def get_credit_balance_endpoint(
     user_id: Optional[str] = None,
@@ -0,0 +1,55 @@
+"""
+Bearer-token authentication dependencies shared by the app and the assistant router.
+
+``ADMIN_EMAILS`` (comma-separated) lists the accounts allowed on admin
+endpoints; with it unset nobody is an admin.
+"""
+
+import logging
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from jose import JWTError, jwt
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import get_db, UserDB
+from models import User
+
+logger = logging.getLogger(__name__)
+
+security = HTTPBearer()
+
+
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    try:
+        payload = jwt.decode(credentials.credentials, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        email: str = payload.get("sub")
+        if email is None:
+            logger.warning("Token verification failed: No email in payload")
+            raise HTTPException(status_code=401, detail="Invalid token")
+        logger.info(f"✓ Token verified for: {email}")
+        return email
+    except JWTError as e:
+        logger.error(f"✗ JWT Error: {str(e)}")
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def get_current_user(email: str = Depends(verify_token), db: Session = Depends(get_db)) -> User:
+    user = db.query(UserDB).filter(UserDB.email == email).first()
+    if user is None:
+        logger.warning(f"User not found: {email}")
+        raise HTTPException(status_code=404, detail="User not found")
+    logger.info(f"✓ Current user retrieved: {email}")
+    return User.model_validate(user)
+
+
+def is_admin(user: User) -> bool:
+    return user.email.strip().lower() in settings.ADMIN_EMAILS
+
+
+def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    if not is_admin(current_user):
+        logger.warning(f"Admin access denied for: {current_user.email}")
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
@@ -0,0 +1,377 @@
+"""
+Micro-benchmarks for the pure-Python work done on every assistant query.
+
+Each case times a pipeline helper against a reference implementation, over
+synthetic hits at the sizes a request sees: 40 hits for a v2 search, 120
+for the widest v1 search. The cases are ``answer_llm``'s tokenizer, overlap,
+act priors, layer detection, heuristic rerank, context split and layer blend,
+and ``answer_llm2``'s source conversion.
+
+The references compile their regexes once, lower-case text before
+tokenizing, cache token sets by text and make a single pass over the hits.
+They are the baseline the pipeline code should beat. Before timing, every
+reference is checked to return the same result as the code it stands in for.
+References, and current code that caches token sets, are timed with the
+caches cleared before every call. Cached references are timed again warm,
+as when popular chunks recur across queries.
+
+Times are best-of-``--repeat`` per call, in microseconds. ``--json`` writes
+them out and ``--compare`` reads an earlier file. The run fails if any
+current implementation got slower than ``--tolerance`` allows, so CI can
+track the numbers across commits.
+
+Example:
+    python benchmarks/bench_hot_paths.py --json hot_paths.json
+    python benchmarks/bench_hot_paths.py --compare hot_paths.json --tolerance 0.25
+"""
+
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import re
+import sys
+import timeit
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from services import answer_llm, answer_llm2  # noqa: E402
+
+SIZES = (40, 120)
+# Cases whose reference reads the token-set cache; they are also timed warm.
+CACHED = {"jaccard_like_overlap", "heuristic_rerank", "vector_rerank"}
+QUERIES = [
+    "Is an electronic record admissible without a 65B certificate?",
+    "Can the High Court quash an FIR under section 482 after arrest?",
+    "Does section 188 need board approval for a related party transaction?",
+    "Who is the PIO and can personal information be refused under 8(1)(j)?",
+]
+ACTS = [
+    "Indian Evidence Act, 1872",
+    "Information Technology Act, 2000",
+    "Code of Criminal Procedure, 1973",
+    "Companies Act, 2013",
+    "Insolvency and Bankruptcy Code, 2016",
+    "Right to Information Act, 2005",
+    "Indian Penal Code, 1860",
+]
+SENTENCES = [
+    "Whoever commits the offence shall be punished with imprisonment which may extend to three years.",
+    "The certificate under sub-section (4) shall identify the electronic record containing the statement.",
+    "Nothing in this Code shall be deemed to limit or affect the inherent powers of the High Court.",
+    "No company shall enter into any contract with a related party except with the consent of the Board.",
+    "The resolution applicant shall not be eligible if it is an undischarged insolvent.",
+    "Information which relates to personal information the disclosure of which has no relationship to any public activity.",
+    "Explanation.--For the purposes of this section, the expression (a) includes the transfer of property.",
+]
+
+
+# ---------------------------------------------------------------------------
+# Synthetic hits
+# ---------------------------------------------------------------------------
+
+def _payload(rng: random.Random, i: int) -> dict:
+    act = rng.choice(ACTS)
+    section = str(rng.randint(1, 500))
+    layer = rng.choice(["L1", "L2", "L3", None])
+    text = " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(8, 14)))
+    payload = {
+        "doc_title": act,
+        "act_title": act,
+        "section_number": section if layer != "L1" else None,
+        "section_heading": f"Heading of section {section}",
+        "heading": f"Heading of section {section}",
+        "breadcrumbs": f"{act} > Chapter {int(section) // 50 + 1}",
+        "context_path": f"{act} > Chapter {int(section) // 50 + 1} > Section {section}",
+        "unit_id": f"u-{i}",
+        "search_text": text,
+        "page_content": text,
+    }
+    if layer:
+        payload["layer"] = layer
+    if rng.random() < 0.2:
+        payload["sub_section"] = "(2)"
+    return payload
+
+
+def v1_hits(size: int, seed: int = 3) -> List[answer_llm.Hit]:
+    rng = random.Random(seed)
+    return [answer_llm.Hit(score=rng.uniform(0.3, 0.9), payload=_payload(rng, i)) for i in range(size)]
+
+
+def v2_hits(size: int, seed: int = 3) -> List[answer_llm2.Hit]:
+    rng = random.Random(seed)
+    return [
+        answer_llm2.Hit(score=rng.uniform(0.3, 0.9), collection=rng.choice(answer_llm2.COLLECTIONS), payload=_payload(rng, i))
+        for i in range(size)
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Reference implementations
+# ---------------------------------------------------------------------------
+
+_WORD_RE = re.compile(r"[A-Za-z0-9\-\(\)\/\.]+")
+_CLAUSE_RE = re.compile(r"\(\w+\)")
+_PRIOR_RULES = [
+    (("admissible", "certificate", "65b", "electronic record"), re.compile(r"indian evidence act", re.I), 0.22),
+    (("intermediary", "safe-harbour", "69a", "79"), re.compile(r"information technology act", re.I), 0.20),
+    (("arrest", "482", "fir quash"), re.compile(r"code of criminal procedure", re.I), 0.18),
+    (("related party", "section 188", "board approval"), re.compile(r"companies act", re.I), 0.16),
+    (("29a", "resolution applicant", "coc", "cirp"), re.compile(r"insolvency and bankruptcy code", re.I), 0.16),
+    (("8(1)", "personal information", "pio"), re.compile(r"right to information act", re.I), 0.16),
+]
+
+
+def ref_simple_tokens(s: str) -> List[str]:
+    # Lower-casing first is safe: the character class is case-symmetric.
+    return _WORD_RE.findall((s or "").lower())
+
+
+@functools.lru_cache(maxsize=8192)
+def _token_set(text: str) -> frozenset:
+    return frozenset(_WORD_RE.findall(text.lower()))
+
+
+def ref_jaccard_like_overlap(q_set: frozenset, text: str) -> float:
+    t_tokens = _token_set(text)
+    if not t_tokens:
+        return 0.0
+    return len(q_set & t_tokens) / max(1, len(q_set))
+
+
+def ref_build_act_priors(query: str) -> List[Tuple["re.Pattern", float]]:
+    q = query.lower()
+    return [(pattern, value) for keywords, pattern, value in _PRIOR_RULES if any(k in q for k in keywords)]
+
+
+def ref_prior_boost_for_hit(priors, payload: dict) -> float:
+    act = (payload or {}).get("doc_title", "") or ""
+    return min(sum(value for pattern, value in priors if pattern.search(act)), 0.35)
+
+
+def ref_detect_layer(p: Dict) -> str:
+    for key in ("layer", "level", "chunk_level"):
+        if key in p:
+            val = str(p.get(key)).strip().upper()
+            if val in {"L1", "L2", "L3"}:
+                return val
+    if p.get("clause") or p.get("sub_section") or _CLAUSE_RE.search(p.get("search_text") or ""):
+        return "L3"
+    if p.get("section_number") or p.get("section_number_norm"):
+        return "L2"
+    return "L1"
+
+
+def _overlap_text(p: dict) -> str:
+    parts = (
+        p.get("doc_title", ""),
+        p.get("section_heading", ""),
+        p.get("section_number_norm") or p.get("section_number") or "",
+        p.get("breadcrumbs", ""),
+        p.get("search_text", ""),
+    )
+    return " | ".join(x for x in parts if x)
+
+
+def ref_heuristic_rerank(query: str, hits, alpha=0.65, beta=0.25, gamma=0.10):
+    if not hits:
+        return []
+    q_set = frozenset(ref_simple_tokens(query))
+    q_len = max(1, len(q_set))
+    max_vec = max((h.score or 0.0) for h in hits) or 1.0
+    priors = ref_build_act_priors(query)
+    scored = []
+    for index, h in enumerate(hits):
+        payload = h.payload or {}
+        tokens = _token_set(_overlap_text(payload))
+        overlap = len(q_set & tokens) / q_len if tokens else 0.0
+        boost = ref_prior_boost_for_hit(priors, payload) if priors else 0.0
+        # -index keeps the stable order of equal scores, as list.sort does.
+        scored.append((alpha * (h.score or 0.0) / max_vec + beta * overlap + gamma * boost, -index, h))
+    scored.sort(key=lambda row: (row[0], row[1]), reverse=True)
+    return [h for _, _, h in scored]
+
+
+def ref_split_context_by_layer(hits, max_chars=7500):
+    buckets = {"L1": [], "L2": [], "L3": []}
+    total = 0
+    for h in hits:
+        p = h.payload or {}
+        sec_no = p.get("section_number_norm") or p.get("section_number")
+        meta = " | ".join(
+            x for x in (p.get("doc_title"), f"Section {sec_no}" if sec_no else None, p.get("section_heading"), p.get("breadcrumbs")) if x
+        )
+        block = f"[[META]] {meta}\n[[TEXT]] {p.get('search_text') or ''}\n"
+        if total + len(block) > max_chars:
+            break
+        buckets[ref_detect_layer(p)].append(block)
+        total += len(block)
+    return "\n---\n".join(buckets["L1"]), "\n---\n".join(buckets["L2"]), "\n---\n".join(buckets["L3"])
+
+
+def ref_weighted_blend(hits_with_scores, top_k: int):
+    if not hits_with_scores:
+        return []
+    buckets = {"L1": [], "L2": [], "L3": []}
+    for _, h in hits_with_scores:
+        buckets[ref_detect_layer(h.payload or {})].append(h)
+    total = max(1, top_k)
+    l1n = max(0, int(round(total * answer_llm.LAYER_WEIGHTS["L1"])))
+    l2n = max(0, int(round(total * answer_llm.LAYER_WEIGHTS["L2"])))
+    quota = {"L3": max(0, total - l1n - l2n), "L2": l2n, "L1": l1n}
+    blended = buckets["L3"][:quota["L3"]] + buckets["L2"][:quota["L2"]] + buckets["L1"][:quota["L1"]]
+    for layer in ("L3", "L2", "L1"):
+        if len(blended) >= total:
+            break
+        blended.extend(buckets[layer][quota[layer]:quota[layer] + total - len(blended)])
+    return blended[:total]
+
+
+def ref_hit_to_source(hit):
+    payload = hit.payload or {}
+    snippet = (payload.get("page_content") or payload.get("content") or "").strip()[:600]
+    # Validated construction stays: model_construct runs in Python and is slower.
+    return answer_llm2.Source(
+        collection=hit.collection,
+        score=float(hit.score or 0.0),
+        layer=answer_llm2._resolve_layer(payload, hit.collection),
+        act_title=payload.get("act_title"),
+        context_path=payload.get("context_path"),
+        heading=payload.get("heading"),
+        unit_id=payload.get("unit_id"),
+        snippet=snippet or None,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Cases
+# ---------------------------------------------------------------------------
+
+def _ids(hits) -> List[str]:
+    return [h.payload["unit_id"] for h in hits]
+
+
+def cases(size: int) -> List[Tuple[str, Callable[[], object], Callable[[], object], Callable[[object], object]]]:
+    """(name, current, reference, normalize) for one hit count; normalize maps results to comparable values."""
+    hits = v1_hits(size)
+    hits2 = v2_hits(size)
+    query = QUERIES[1]
+    q_tokens = answer_llm.simple_tokens(query)
+    q_set = frozenset(q_tokens)
+    blobs = [answer_llm.gather_text_for_overlap(h.payload) for h in hits]
+    priors = answer_llm.build_act_priors(query)
+    ref_priors = ref_build_act_priors(query)
+    scored = [(h.score, h) for h in hits]
+    identity = lambda value: value  # noqa: E731
+    return [
+        ("simple_tokens", lambda: [answer_llm.simple_tokens(b) for b in blobs], lambda: [ref_simple_tokens(b) for b in blobs], identity),
+        (
+            "jaccard_like_overlap",
+            lambda: [answer_llm.jaccard_like_overlap(q_tokens, b) for b in blobs],
+            lambda: [ref_jaccard_like_overlap(q_set, b) for b in blobs],
+            identity,
+        ),
+        ("build_act_priors", lambda: [answer_llm.build_act_priors(q) for q in QUERIES], lambda: [ref_build_act_priors(q) for q in QUERIES], lambda r: [[v for _, v in p] for p in r]),
+        (
+            "prior_boost_for_hit",
+            lambda: [answer_llm.prior_boost_for_hit(priors, h.payload) for h in hits],
+            lambda: [ref_prior_boost_for_hit(ref_priors, h.payload) for h in hits],
+            identity,
+        ),
+        ("detect_layer", lambda: [answer_llm.detect_layer(h.payload) for h in hits], lambda: [ref_detect_layer(h.payload) for h in hits], identity),
+        ("heuristic_rerank", lambda: answer_llm.heuristic_rerank(query, hits), lambda: ref_heuristic_rerank(query, hits), _ids),
+        ("vector_rerank", lambda: answer_llm.vector_rerank(query, hits), lambda: ref_heuristic_rerank(query, hits), _ids),
+        ("split_context_by_layer", lambda: answer_llm.split_context_by_layer(hits), lambda: ref_split_context_by_layer(hits), identity),
+        ("weighted_blend", lambda: answer_llm.weighted_blend(scored, 10), lambda: ref_weighted_blend(scored, 10), _ids),
+        (
+            "_hit_to_source (v2)",
+            lambda: [answer_llm2._hit_to_source(h) for h in hits2],
+            lambda: [ref_hit_to_source(h) for h in hits2],
+            lambda r: [s.model_dump() for s in r],
+        ),
+    ]
+
+
+def best_per_call(fn: Callable[[], object], repeat: int, cold: Optional[Callable[[], None]] = None) -> float:
+    """Best seconds per call; ``cold`` runs untimed before every call (e.g. to clear caches)."""
+    if cold is not None:
+        timings = []
+        for _ in range(repeat * 20):
+            cold()
+            timings.append(timeit.timeit(fn, number=1))
+        return min(timings)
+    number = 1
+    while timeit.timeit(fn, number=number) < 0.05:
+        number *= 2
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def _clear_caches() -> None:
+    _token_set.cache_clear()
+    answer_llm._overlap_tokens.cache_clear()
+
+
+def run(repeat: int) -> List[dict]:
+    results = []
+    for size in SIZES:
+        for name, current, reference, normalize in cases(size):
+            _token_set.cache_clear()
+            if normalize(current()) != normalize(reference()):
+                sys.exit(f"reference for {name} ({size} hits) returns a different result")
+            cold = _clear_caches if name in CACHED else None
+            row = {"name": name, "hits": size, "current_us": best_per_call(current, repeat, cold=cold) * 1e6}
+            row["reference_us"] = best_per_call(reference, repeat, cold=_clear_caches) * 1e6
+            if name in CACHED:
+                row["reference_warm_us"] = best_per_call(reference, repeat) * 1e6
+            results.append(row)
+    return results
+
+
+def report(results: List[dict], previous: Optional[Dict[Tuple[str, int], dict]]) -> None:
+    """Print the table, adding each case's change against ``previous``."""
+    print(f"{'case':<24} {'hits':>4} {'current us':>11} {'reference us':>13} {'warm us':>9} {'ratio':>6}" + ("  vs previous" if previous else ""))
+    for row in results:
+        warm = f"{row['reference_warm_us']:9.1f}" if "reference_warm_us" in row else f"{'-':>9}"
+        line = (
+            f"{row['name']:<24} {row['hits']:>4} {row['current_us']:11.1f} {row['reference_us']:13.1f} "
+            f"{warm} {row['current_us'] / row['reference_us']:5.1f}x"
+        )
+        before = (previous or {}).get((row["name"], row["hits"]))
+        if before:
+            change = row["current_us"] / before["current_us"] - 1
+            line += f"  {change:+7.1%}"
+            row["change"] = change
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> List[dict]:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the RAG pipeline hot paths")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    parser.add_argument("--compare", help="results file from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against --compare")
+    args = parser.parse_args(argv)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            previous = {(row["name"], row["hits"]): row for row in json.load(handle)["results"]}
+
+    results = run(args.repeat)
+    report(results, previous)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as handle:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results}, handle, indent=2)
+
+    regressed = [f"{row['name']} ({row['hits']} hits) {row['change']:+.1%}" for row in results if row.get("change", 0) > args.tolerance]
+    if regressed:
+        sys.exit("slower than the previous run: " + ", ".join(regressed))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare the original per-character ``clean_text`` with ``text_normalize.normalize_text``.
+
+Builds a synthetic judgment the way PDF extraction returns it (wrapped lines,
+numbered paragraphs, citations, tabs, non-breaking spaces, form feeds and soft
+hyphens) and checks that both implementations give the same output. Reports
+best-of-N times for one pass over the whole document, and for the analysis
+path with instructions: previously the extracted text was cleaned once after
+extraction, again when the instructions were prepended and a third time in
+``analyse_text``; now each page is normalized once during extraction.
+
+Example:
+    python benchmarks/bench_normalize.py --pages 300
+"""
+
+import argparse
+import os
+import random
+import textwrap
+import re
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from services.text_normalize import normalize_text  # noqa: E402
+
+SENTENCES = [
+    "The appellant challenged the order of the High Court dated 14 March 2019.",
+    "Learned counsel for the respondent relied upon\tState of Punjab v. Singh, (2004) 3 SCC 12.",
+    "Section 482 of the Code of Criminal Procedure saves the inherent powers of the court.",
+    "Those powers must be exercised sparingly and only in the rarest of cases.",
+    "The Tribunal’s finding that the “dominant purpose” test applied cannot be faulted.",
+    "Costs of ₹50,000 shall be paid within eight weeks; see also § 12(3) of the Act.",
+]
+# A word split across lines and re-joined by the extractor, leaving a soft hyphen.
+HYPHENATED = "The finding was reached with\u00a0circum\u00adspection."
+INSTRUCTIONS = "Summarise the holding and list the authorities relied upon."
+HEADINGS = ["JUDGMENT", "FACTS OF THE CASE", "SUBMISSIONS", "ANALYSIS", "CONCLUSION"]
+
+
+def legacy_clean_text(text: str) -> str:
+    """The implementation normalize_text replaced, kept here as the baseline."""
+    if not text:
+        return ""
+    sanitized = text.replace("\u00a0", " ")
+    sanitized = "".join(ch for ch in sanitized if ch.isprintable() or ch in "\n\r\t")
+    sanitized = re.sub(r"[ \t]+", " ", sanitized)
+    sanitized = re.sub(r"\r\n?", "\n", sanitized)
+    sanitized = re.sub(r"\n{3,}", "\n\n", sanitized)
+    return sanitized.strip()
+
+
+def synthetic_judgment(pages: int, seed: int = 7) -> List[str]:
+    """Pages roughly as PyPDF2 returns them for a reported judgment: wrapped lines, a running header."""
+    rng = random.Random(seed)
+    out = []
+    paragraph = 1
+    for page in range(pages):
+        parts = [f"\x0c{rng.choice(HEADINGS).title()}  \u00a0 Page {page + 1} of {pages}\n\n"]
+        if page % 25 == 0:
+            parts.append(f"{HEADINGS[(page // 25) % len(HEADINGS)]}\n\n\n")
+        for _ in range(6):
+            body = " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(3, 6)))
+            if paragraph % 10 == 0:
+                body = f"{body} {HYPHENATED}"
+            lines = textwrap.wrap(f"{paragraph}.\t{body}", width=90, expand_tabs=False, replace_whitespace=False)
+            parts.append("\n".join(lines) + "\n \n")
+            paragraph += 1
+        out.append("".join(parts))
+    return out
+
+
+def legacy_analysis_path(pages: List[str]) -> str:
+    text = legacy_clean_text("\n".join(pages))
+    text = legacy_clean_text(f"User instructions:\n{INSTRUCTIONS}\n\nDocument:\n{text}")
+    return legacy_clean_text(text)
+
+
+def analysis_path(pages: List[str]) -> str:
+    text = "\n\n".join(normalize_text(page) for page in pages)
+    return f"User instructions:\n{normalize_text(INSTRUCTIONS)}\n\nDocument:\n{text}"
+
+
+def best_of(fn, arg, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark text normalization on a synthetic judgment")
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    pages = synthetic_judgment(args.pages)
+    text = "".join(pages)
+    if legacy_clean_text(text) != normalize_text(text):
+        sys.exit("normalize_text output differs from the legacy implementation")
+
+    legacy = best_of(legacy_clean_text, text, args.repeat)
+    fast = best_of(normalize_text, text, args.repeat)
+    legacy_path = best_of(legacy_analysis_path, pages, args.repeat)
+    fast_path = best_of(analysis_path, pages, args.repeat)
+
+    print(f"document             {len(text) / 1e6:8.2f} M chars ({args.pages} pages)")
+    print(f"whole document       {legacy * 1000:8.1f} ms -> {fast * 1000:6.1f} ms  ({legacy / fast:.1f}x)")
+    print(f"analysis path        {legacy_path * 1000:8.1f} ms -> {fast_path * 1000:6.1f} ms  ({legacy_path / fast_path:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Compare query latency on plain vs monthly-partitioned auth_logs / assistant_history.
+
+Loads the same synthetic dataset into two schemas of a local PostgreSQL
+database (``bench_plain`` and ``bench_part``), converts the second one with
+``migrations.partition_table`` and times the queries the API actually runs.
+
+Example:
+    python benchmarks/bench_partitions.py \
+        --dsn postgresql://postgres@localhost:5432/postgres --rows 10000000
+
+Never point this at the production database.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import migrations  # noqa: E402
+from database import Base  # noqa: E402
+
+SCHEMAS = ("bench_plain", "bench_part")
+BENCH_TABLES = ("users", "auth_logs", "assistant_history", "auth_log_monthly", "assistant_history_monthly")
+BATCH_ROWS = 1_000_000
+
+QUERIES = {
+    "auth_logs_latest_50": (
+        'SELECT id, email, action, status, ip_address, "timestamp" '
+        'FROM auth_logs ORDER BY "timestamp" DESC LIMIT 50'
+    ),
+    "user_history_latest_50": (
+        "SELECT id, task_name, question, answer, created_at, response_time_ms "
+        "FROM assistant_history WHERE user_id = :user_id ORDER BY created_at DESC LIMIT 50"
+    ),
+    "history_last_7_days_count": (
+        "SELECT count(*) FROM assistant_history WHERE created_at >= now() - interval '7 days'"
+    ),
+    "auth_logs_last_month_failures": (
+        "SELECT count(*) FROM auth_logs WHERE status = 'failed' "
+        "AND \"timestamp\" >= date_trunc('month', now()) - interval '1 month'"
+    ),
+}
+
+
+def _engine_for(dsn: str, schema: str):
+    return create_engine(dsn, connect_args={"options": f"-c search_path={schema}"})
+
+
+def _load_schema(dsn: str, schema: str, rows: int, users: int, months: int) -> None:
+    admin = create_engine(dsn)
+    with admin.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    admin.dispose()
+
+    engine = _engine_for(dsn, schema)
+    with engine.begin() as conn:
+        for name in BENCH_TABLES:
+            Base.metadata.tables[name].create(conn)
+        conn.execute(
+            text(
+                "INSERT INTO users (id, email, name, verified_email, created_at, last_login) "
+                "SELECT 'bench-user-' || g, 'bench' || g || '@example.com', 'Bench ' || g, true, now(), now() "
+                "FROM generate_series(0, :users - 1) g"
+            ),
+            {"users": users},
+        )
+
+    loaded = 0
+    while loaded < rows:
+        batch = min(BATCH_ROWS, rows - loaded)
+        params = {"start": loaded, "stop": loaded + batch - 1, "users": users, "months": months}
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    'INSERT INTO auth_logs (user_id, email, action, status, ip_address, user_agent, "timestamp") '
+                    "SELECT 'bench-user-' || (g % :users), 'bench' || (g % :users) || '@example.com', "
+                    "CASE WHEN g % 2 = 0 THEN 'login' ELSE 'logout' END, "
+                    "CASE WHEN g % 97 = 0 THEN 'failed' ELSE 'success' END, "
+                    "'127.0.0.1', 'bench', now() - random() * (:months * interval '30 days') "
+                    "FROM generate_series(:start, :stop) g"
+                ),
+                params,
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO assistant_history (user_id, task_name, question, answer, response_time_ms, created_at) "
+                    "SELECT 'bench-user-' || (g % :users), 'General', 'Synthetic question ' || g, "
+                    "repeat('Synthetic answer text. ', 20), (random() * 8000)::int, "
+                    "now() - random() * (:months * interval '30 days') "
+                    "FROM generate_series(:start, :stop) g"
+                ),
+                params,
+            )
+        loaded += batch
+        print(f"  [{schema}] loaded {loaded:,}/{rows:,} rows per table")
+
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    engine.dispose()
+
+
+def _time_query(engine, sql: str, params: Dict, repeat: int) -> List[float]:
+    samples = []
+    with engine.connect() as conn:
+        conn.execute(text(sql), params).fetchall()  # warm-up
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(text(sql), params).fetchall()
+            samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def _time_call(fn: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark monthly partitioning on a local PostgreSQL")
+    parser.add_argument(
+        "--dsn",
+        default=os.getenv("BENCH_DATABASE_URL", "postgresql://postgres@localhost:5432/postgres"),
+    )
+    parser.add_argument("--rows", type=int, default=10_000_000, help="rows per table")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--months", type=int, default=24, help="spread rows over this many months")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--skip-load", action="store_true", help="reuse schemas from a previous run")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark schemas afterwards")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("Partitioning benchmark")
+    print("=" * 80)
+
+    if not args.skip_load:
+        for schema in SCHEMAS:
+            print(f"\nLoading {args.rows:,} rows per table into {schema}...")
+            _load_schema(args.dsn, schema, args.rows, args.users, args.months)
+
+        part_engine = _engine_for(args.dsn, "bench_part")
+        for table in ("auth_logs", "assistant_history"):
+            elapsed = _time_call(lambda: migrations.partition_table(part_engine, table))
+            print(f"  partitioned {table} in {elapsed / 1000:.1f}s")
+        with part_engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        part_engine.dispose()
+
+    engines = {schema: _engine_for(args.dsn, schema) for schema in SCHEMAS}
+    params = {"user_id": "bench-user-42"}
+
+    print(f"\n{'query':<32}{'plain p50':>12}{'plain p95':>12}{'part p50':>12}{'part p95':>12}")
+    for name, sql in QUERIES.items():
+        plain = _time_query(engines["bench_plain"], sql, params, args.repeat)
+        part = _time_query(engines["bench_part"], sql, params, args.repeat)
+        print(
+            f"{name:<32}"
+            f"{statistics.median(plain):>10.2f}ms{_percentile(plain, 95):>10.2f}ms"
+            f"{statistics.median(part):>10.2f}ms{_percentile(part, 95):>10.2f}ms"
+        )
+
+    print("\nRetention (rollup + remove rows older than 12 months):")
+    for schema, engine in engines.items():
+        elapsed = _time_call(lambda: migrations.apply_retention(engine, "assistant_history", 12))
+        print(f"  {schema:<12} {elapsed / 1000:.2f}s")
+
+    for engine in engines.values():
+        engine.dispose()
+
+    if not args.keep:
+        admin = create_engine(args.dsn)
+        with admin.begin() as conn:
+            for schema in SCHEMAS:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        admin.dispose()
+
+
+if __name__ == "__main__":
+    main()
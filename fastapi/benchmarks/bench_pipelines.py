@@ -0,0 +1,237 @@
+"""
+End-to-end latency and throughput of the assistant pipelines, fully offline.
+
+Starts ``fake_azure.FakeAzureServer`` (chat and embeddings with modelled
+latency and token rates) and an in-memory Qdrant seeded by
+``synthetic_qdrant`` with the L1/L2/L3 collections, points both pipelines'
+module-level ``llm`` and ``qdrant`` clients at them, and drives each target
+at each concurrency level:
+
+    v1       answer_llm.answer_query from a thread pool
+    v2       answer_llm2.answer_query from a thread pool
+    http-v1  POST /api/assistant/query over ASGI (httpx.ASGITransport)
+    http-v2  POST /api/assistant/query-v2 over ASGI
+
+Every request uses a distinct query, so single-flight never shares a run
+unless ``--distinct`` is lowered. For each configuration the script prints
+throughput, p50/p95/p99 latency, errors and the calls the fake Azure server
+received; ``--json`` also writes the rows to a file for comparing runs.
+
+``--live`` keeps the configured Azure and Qdrant clients. ``--record PATH``
+captures every client call into a fixture file, and ``--replay PATH`` answers
+them from it (see ``record_replay``). ``--latency-scale 0`` then measures only
+the pipelines' own Python work, the same way on every run.
+
+Example:
+    python benchmarks/bench_pipelines.py --targets v2,http-v2 --concurrency 1,16,64 --requests 200
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx  # noqa: E402
+
+import record_replay  # noqa: E402
+import synthetic_qdrant  # noqa: E402
+from fake_azure import FakeAzureServer, add_latency_arguments, config_from_arguments  # noqa: E402
+
+TARGETS = ("v1", "v2", "http-v1", "http-v2")
+HTTP_PATHS = {"http-v1": "/api/assistant/query", "http-v2": "/api/assistant/query-v2"}
+
+
+@dataclass
+class Row:
+    target: str
+    concurrency: int
+    requests: int
+    errors: int
+    wall_s: float
+    throughput_rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    chat_calls: int
+    embedding_calls: int
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def run_threads(call: Callable[[str], object], queries: List[str], concurrency: int):
+    latencies: List[float] = []
+    errors = 0
+
+    def one(query: str) -> None:
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            call(query)
+        except Exception:
+            errors += 1
+            return
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, queries))
+    return time.perf_counter() - started, sorted(latencies), errors
+
+
+async def run_http(app, path: str, queries: List[str], concurrency: int):
+    latencies: List[float] = []
+    errors = 0
+    gate = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def one(query: str) -> None:
+            nonlocal errors
+            async with gate:
+                started = time.perf_counter()
+                response = await client.post(path, json={"query": query})
+                if response.status_code != 200:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(query) for query in queries))
+    return time.perf_counter() - started, sorted(latencies), errors
+
+
+def import_pipelines():
+    """Import both pipelines and an app serving the assistant router."""
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "fake")
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "http://127.0.0.1:9")
+
+    from fastapi import FastAPI
+
+    from api_assistant import router
+    from services import answer_llm, answer_llm2
+
+    # database.py configures INFO logging on import; keep per-request lines out of the report.
+    logging.getLogger().setLevel(logging.WARNING)
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    return answer_llm, answer_llm2, app
+
+
+def use_fakes(server: FakeAzureServer, points_per_layer: int) -> None:
+    """Point both pipelines' clients at the fake Azure server and a synthetic Qdrant."""
+    from services import answer_llm, answer_llm2
+
+    qdrant = synthetic_qdrant.build(
+        layered_collection=answer_llm.QDRANT_COLLECTION,
+        layer_collections=answer_llm2.COLLECTIONS,
+        points_per_layer=points_per_layer,
+        dimensions=server.config.dimensions,
+    )
+    for module in (answer_llm, answer_llm2):
+        module.llm = server.client()
+        module.qdrant = qdrant
+
+
+def report(row: Row) -> None:
+    print(
+        f"{row.target:<8} c={row.concurrency:<4d} {row.requests:5d} req  {row.errors:3d} err  "
+        f"{row.throughput_rps:7.2f} req/s  p50 {row.p50_ms:8.1f}  p95 {row.p95_ms:8.1f}  p99 {row.p99_ms:8.1f} ms  "
+        f"azure: {row.chat_calls} chat, {row.embedding_calls} embed"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> List[Row]:
+    parser = argparse.ArgumentParser(description="Benchmark the assistant pipelines against fake Azure and Qdrant")
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--distinct", type=int, default=0, help="distinct queries in the mix (0 = one per request)")
+    parser.add_argument("--points-per-layer", type=int, default=1000)
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--live", action="store_true", help="use the configured Azure and Qdrant instead of fakes")
+    parser.add_argument("--record", metavar="PATH", help="write the client calls to a fixture file")
+    parser.add_argument("--replay", metavar="PATH", help="answer client calls from a fixture file")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="replayed latency multiplier (0 = none)")
+    add_latency_arguments(parser)
+    args = parser.parse_args(argv)
+
+    targets = [target.strip() for target in args.targets.split(",") if target.strip()]
+    unknown = sorted(set(targets) - set(TARGETS))
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(unknown)}")
+    if args.record and args.replay:
+        parser.error("--record and --replay are mutually exclusive")
+    levels = [int(level) for level in args.concurrency.split(",")]
+    bank = synthetic_qdrant.sample_queries(args.distinct or args.requests)
+    queries = [bank[i % len(bank)] for i in range(args.requests)]
+
+    rows: List[Row] = []
+    answer_llm, answer_llm2, app = import_pipelines()
+    calls = {"v1": answer_llm.answer_query, "v2": answer_llm2.answer_query}
+    with contextlib.ExitStack() as stack:
+        server = session = None
+        if not (args.live or args.replay):
+            server = stack.enter_context(FakeAzureServer(config_from_arguments(args)))
+            use_fakes(server, args.points_per_layer)
+        if args.record or args.replay:
+            mode = "record" if args.record else "replay"
+            session = stack.enter_context(
+                record_replay.fixtures(args.record or args.replay, mode, latency_scale=args.latency_scale)
+            )
+
+        def counts():
+            if session is not None:
+                return session.calls["chat"], session.calls["embeddings"]
+            if server is not None:
+                return server.stats.chat, server.stats.embeddings
+            return 0, 0
+
+        for target in targets:
+            for concurrency in levels:
+                before = counts()
+                if target in HTTP_PATHS:
+                    wall, latencies, errors = asyncio.run(run_http(app, HTTP_PATHS[target], queries, concurrency))
+                else:
+                    wall, latencies, errors = run_threads(calls[target], queries, concurrency)
+                after = counts()
+                row = Row(
+                    target=target,
+                    concurrency=concurrency,
+                    requests=len(queries),
+                    errors=errors,
+                    wall_s=round(wall, 3),
+                    throughput_rps=round(len(latencies) / wall, 2) if wall else 0.0,
+                    p50_ms=round(percentile(latencies, 0.50) * 1000, 1),
+                    p95_ms=round(percentile(latencies, 0.95) * 1000, 1),
+                    p99_ms=round(percentile(latencies, 0.99) * 1000, 1),
+                    chat_calls=after[0] - before[0],
+                    embedding_calls=after[1] - before[1],
+                )
+                report(row)
+                rows.append(row)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as handle:
+            json.dump({"config": vars(args), "results": [asdict(row) for row in rows]}, handle, indent=2)
+    return rows
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Compare per-request Qdrant searches with the per-collection SearchBatcher.
+
+Searches run against an in-memory Qdrant (``QdrantClient(":memory:")``)
+behind a stub that adds a fixed round trip per HTTP call and lets only
+``--server-slots`` calls through at once, as a small remote cluster would.
+A burst of ``--requests`` searches is issued from ``--concurrency`` threads,
+first one call each, then through the batcher; the script reports calls
+made, wall time and per-search latency percentiles.
+
+Example:
+    python benchmarks/bench_search_batching.py --requests 400 --concurrency 64
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qdrant_client import QdrantClient, models  # noqa: E402
+
+from services.search_batcher import SearchBatcher  # noqa: E402
+
+COLLECTION = "central_acts_v2"
+
+
+class RemoteStub:
+    """In-memory Qdrant with a per-call round trip and a bounded number of server slots."""
+
+    def __init__(self, client: QdrantClient, rtt: float, slots: int) -> None:
+        self.client = client
+        self.rtt = rtt
+        self.slots = threading.Semaphore(slots)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _remote(self, fn):
+        with self._lock:
+            self.calls += 1
+        with self.slots:
+            time.sleep(self.rtt)
+            return fn()
+
+    def search(self, collection_name, query_vector, limit):
+        return self._remote(lambda: self.client.query_points(collection_name, query=query_vector, limit=limit).points)
+
+    def search_batch(self, collection_name, requests):
+        return self._remote(lambda: self.client.search_batch(collection_name=collection_name, requests=requests))
+
+
+def build_client(points: int, dimensions: int) -> QdrantClient:
+    rng = random.Random(1)
+    client = QdrantClient(":memory:")
+    client.create_collection(COLLECTION, vectors_config=models.VectorParams(size=dimensions, distance=models.Distance.COSINE))
+    batch = []
+    for i in range(points):
+        batch.append(models.PointStruct(id=i, vector=[rng.gauss(0, 1) for _ in range(dimensions)], payload={"n": i}))
+        if len(batch) == 500:
+            client.upsert(COLLECTION, points=batch)
+            batch = []
+    if batch:
+        client.upsert(COLLECTION, points=batch)
+    return client
+
+
+def run(search, queries, concurrency: int):
+    latencies = []
+
+    def one(vector):
+        started = time.perf_counter()
+        search(vector)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, queries))
+    return time.perf_counter() - started, sorted(latencies)
+
+
+def report(label: str, calls: int, wall: float, latencies) -> None:
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{label:<12} {calls:5d} calls  {wall * 1000:8.1f} ms wall  "
+        f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark coalesced Qdrant searches")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--points", type=int, default=1000)
+    parser.add_argument("--dimensions", type=int, default=128)
+    parser.add_argument("--limit", type=int, default=40)
+    parser.add_argument("--rtt-ms", type=float, default=15.0)
+    parser.add_argument("--server-slots", type=int, default=8)
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    client = build_client(args.points, args.dimensions)
+    rng = random.Random(2)
+    queries = [[rng.gauss(0, 1) for _ in range(args.dimensions)] for _ in range(args.requests)]
+
+    direct = RemoteStub(client, args.rtt_ms / 1000, args.server_slots)
+    wall, latencies = run(lambda vector: direct.search(COLLECTION, vector, args.limit), queries, args.concurrency)
+    report("per-request", direct.calls, wall, latencies)
+
+    coalesced = RemoteStub(client, args.rtt_ms / 1000, args.server_slots)
+    batcher = SearchBatcher(lambda: coalesced, name="bench", window_ms=args.window_ms)
+    wall, latencies = run(lambda vector: batcher.search(COLLECTION, vector, args.limit), queries, args.concurrency)
+    report("batched", coalesced.calls, wall, latencies)
+
+
+if __name__ == "__main__":
+    main()
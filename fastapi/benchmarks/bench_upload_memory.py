@@ -0,0 +1,119 @@
+"""
+Compare peak Python heap per upload: base64-in-JSON vs streamed multipart.
+
+Both paths are driven the way the API drives them: the JSON path parses the
+body into ``AnalysisRequest`` and base64-decodes the PDF, and the multipart path
+runs ``uploads.receive_upload`` over a chunked body and opens the mmap view.
+Client-side encoding happens before tracing starts.
+
+Example:
+    python benchmarks/bench_upload_memory.py --size-mb 8
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from starlette.requests import Request  # noqa: E402
+
+from api_assistant import AnalysisRequest  # noqa: E402
+from services import uploads  # noqa: E402
+
+BOUNDARY = "bench-boundary"
+CHUNK_BYTES = 64 * 1024
+
+
+def _fake_pdf(size: int) -> bytes:
+    body = os.urandom(size)
+    return b"%PDF-1.4\n" + body + b"\n%%EOF\n"
+
+
+def _json_ingest(body: bytes) -> int:
+    request = AnalysisRequest.model_validate_json(body)
+    pdf_bytes = base64.b64decode(request.pdf_base64, validate=True)
+    return len(pdf_bytes)
+
+
+def _multipart_request(path: str, size: int) -> Request:
+    head = (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"bench.pdf\"\r\n"
+        "Content-Type: application/pdf\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+
+    async def receive():
+        yield {"type": "http.request", "body": head, "more_body": True}
+        with open(path, "rb") as handle:
+            while True:
+                chunk = handle.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield {"type": "http.request", "body": chunk, "more_body": True}
+        yield {"type": "http.request", "body": tail, "more_body": False}
+
+    messages = receive()
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/assistant/analysis/upload",
+        "headers": [
+            (b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()),
+            (b"content-length", str(len(head) + size + len(tail)).encode()),
+        ],
+    }
+    return Request(scope, messages.__anext__)
+
+
+def _multipart_ingest(path: str, size: int) -> int:
+    async def run() -> int:
+        upload, _ = await uploads.receive_upload(_multipart_request(path, size), max_bytes=size * 2)
+        try:
+            with upload.open_buffer() as view:
+                return len(view)
+        finally:
+            upload.close()
+
+    return asyncio.run(run())
+
+
+def _peak(fn, *args) -> int:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Peak memory per upload: JSON/base64 vs multipart")
+    parser.add_argument("--size-mb", type=float, default=8.0)
+    args = parser.parse_args()
+
+    pdf = _fake_pdf(int(args.size_mb * 1024 * 1024))
+    body = json.dumps({"pdf_base64": base64.b64encode(pdf).decode()}).encode()
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".bench_upload.pdf")
+    with open(path, "wb") as handle:
+        handle.write(pdf)
+
+    try:
+        json_peak = _peak(_json_ingest, body)
+        multipart_peak = _peak(_multipart_ingest, path, len(pdf))
+    finally:
+        os.remove(path)
+
+    mb = 1024 * 1024
+    print(f"file size          {len(pdf) / mb:8.2f} MB")
+    print(f"json + base64 peak {json_peak / mb:8.2f} MB (+ {len(body) / mb:.2f} MB request body)")
+    print(f"multipart peak     {multipart_peak / mb:8.2f} MB")
+    print(f"reduction          {(json_peak + len(body)) / max(multipart_peak, 1):8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
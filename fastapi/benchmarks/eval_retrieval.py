@@ -0,0 +1,285 @@
+"""
+Retrieval quality against latency for pipeline configurations.
+
+Runs every question of a versioned golden set (``golden/queries_v1.jsonl``)
+through ``answer_llm`` and/or ``answer_llm2`` under each configuration and
+scores the returned sources. A source is relevant to an expected entry if
+its ``unit_id`` matches, when the entry gives one. Otherwise its act title
+and section number must both match (the section is read from
+``section_number`` or ``Section N`` in ``context_path``/``heading``).
+
+Reported per pipeline and configuration:
+    R@k      share of expected provisions among the first k sources, averaged over questions
+    MRR      mean reciprocal rank of the first relevant source
+    p50/p95  pipeline latency (``timings.total_ms``)
+    tok/q    LLM tokens per question, from the response timings
+
+Configurations are patches applied around the pipeline modules:
+    full           as deployed
+    no-rewrite     skip the query-rewrite LLM call
+    no-llm-rerank  skip the LLM reranker (v1 falls back to the heuristic, v2 to vector order)
+    candidates-N   search N candidates (per collection in v2) instead of max(15, top_k * 8)
+    vector-rerank  v1 only: RERANK_MODE=vector, scoring returned vectors against the rewrites
+
+Backends:
+    standin  fake Azure (lexical embeddings and reranker) with an in-memory Qdrant
+             holding ``golden/statutes_v1.jsonl`` among synthetic distractors
+    replay   ``--fixtures PATH`` recorded with ``--backend live --record PATH``
+    live     the configured Azure OpenAI and Qdrant
+
+Stand-in numbers show how the configurations relate, not the production
+quality; use live or replayed runs for that.
+
+Example:
+    python benchmarks/eval_retrieval.py --pipelines v2 --configs full,no-llm-rerank,candidates-8 --json eval.json
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import Callable, ContextManager, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import record_replay  # noqa: E402
+import synthetic_qdrant  # noqa: E402
+from fake_azure import FakeAzureServer, add_latency_arguments, config_from_arguments  # noqa: E402
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+PIPELINES = ("v1", "v2")
+DEFAULT_CONFIGS = "full,no-rewrite,no-llm-rerank,candidates-16"
+_SECTION = re.compile(r"\bSection\s+([0-9]+[A-Z]*)", re.IGNORECASE)
+
+
+@dataclass
+class Score:
+    pipeline: str
+    config: str
+    questions: int
+    errors: int
+    recall: Dict[int, float]
+    mrr: float
+    p50_ms: float
+    p95_ms: float
+    tokens_per_question: float
+    ranks: Dict[str, Optional[int]] = field(default_factory=dict)
+
+
+def load_jsonl(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def _norm_title(title: Optional[str]) -> str:
+    words = re.sub(r"[^a-z0-9 ]", " ", (title or "").lower()).split()
+    return " ".join(words[1:] if words[:1] == ["the"] else words)
+
+
+def _section_of(source: dict) -> Optional[str]:
+    if source.get("section_number"):
+        return str(source["section_number"]).strip().upper()
+    for text in (source.get("context_path"), source.get("heading")):
+        match = _SECTION.search(text or "")
+        if match:
+            return match.group(1).upper()
+    return None
+
+
+def is_relevant(source: dict, expected: dict) -> bool:
+    if expected.get("unit_id") and source.get("unit_id"):
+        return source["unit_id"] == expected["unit_id"]
+    if _norm_title(source.get("act_title") or source.get("doc_title")) != _norm_title(expected["act_title"]):
+        return False
+    return not expected.get("section") or _section_of(source) == str(expected["section"]).upper()
+
+
+def score_sources(sources: List[dict], expected: List[dict], ks: List[int]):
+    """Recall at each k and the 1-based rank of the first relevant source (None if absent)."""
+    hits = [next((rank for rank, source in enumerate(sources, 1) if is_relevant(source, item)), None) for item in expected]
+    recall = {k: sum(1 for rank in hits if rank is not None and rank <= k) / len(expected) for k in ks}
+    found = [rank for rank in hits if rank is not None]
+    return recall, (min(found) if found else None)
+
+
+def _patched(module, name: str, value) -> ContextManager:
+    @contextlib.contextmanager
+    def patch():
+        original = getattr(module, name)
+        setattr(module, name, value)
+        try:
+            yield
+        finally:
+            setattr(module, name, original)
+
+    return patch()
+
+
+def configuration(name: str, pipeline) -> ContextManager:
+    """Context manager applying configuration ``name`` to a pipeline module."""
+    if name == "full":
+        return contextlib.nullcontext()
+    if name == "no-rewrite":
+        return _patched(pipeline, "rewrite_queries", lambda query: [query])
+    if name == "no-llm-rerank":
+        return _patched(pipeline, "llm_rerank", lambda query, hits: None)
+    if name == "vector-rerank":
+        return _patched(pipeline.vr, "RERANK_MODE", "vector")
+    if name.startswith("candidates-"):
+        candidates = int(name.split("-", 1)[1])
+        if hasattr(pipeline, "multi_search"):
+            search = pipeline.multi_search
+            return _patched(pipeline, "multi_search", lambda vector, top_k=15: search(vector, top_k=candidates))
+        search = pipeline.qdrant_search
+        # qdrant_search asks for max(15, top_k * 8); bypass it to search exactly N.
+        return _patched(
+            pipeline,
+            "qdrant_search",
+            lambda vector, top_k=15, with_vectors=False: [
+                pipeline.Hit(score=r.score or 0.0, payload=r.payload, vector=r.vector if with_vectors else None)
+                for r in pipeline._search_batcher.search(pipeline.QDRANT_COLLECTION, vector, candidates, with_vectors)
+            ],
+        )
+    raise ValueError(f"unknown configuration {name!r}")
+
+
+def evaluate(pipeline_name: str, answer: Callable, pipeline, config: str, questions: List[dict], ks: List[int]) -> Score:
+    recalls: Dict[int, List[float]] = {k: [] for k in ks}
+    reciprocal: List[float] = []
+    latencies: List[float] = []
+    tokens: List[int] = []
+    ranks: Dict[str, Optional[int]] = {}
+    errors = 0
+    with configuration(config, pipeline):
+        for item in questions:
+            try:
+                response = answer(item["question"], top_k=max(ks), threshold=0.0)
+            except Exception as exc:
+                logging.getLogger(__name__).warning("%s/%s %s failed: %s", pipeline_name, config, item["id"], exc)
+                errors += 1
+                for k in ks:
+                    recalls[k].append(0.0)
+                reciprocal.append(0.0)
+                ranks[item["id"]] = None
+                continue
+            sources = [source.model_dump() for source in response.sources]
+            recall, rank = score_sources(sources, item["expected"], ks)
+            for k in ks:
+                recalls[k].append(recall[k])
+            reciprocal.append(1.0 / rank if rank else 0.0)
+            ranks[item["id"]] = rank
+            if response.timings:
+                latencies.append(response.timings.total_ms)
+                tokens.append(sum(usage.prompt + usage.completion for usage in response.timings.tokens.values()))
+    latencies.sort()
+    return Score(
+        pipeline=pipeline_name,
+        config=config,
+        questions=len(questions),
+        errors=errors,
+        recall={k: round(statistics.fmean(values), 3) for k, values in recalls.items()},
+        mrr=round(statistics.fmean(reciprocal), 3),
+        p50_ms=round(latencies[len(latencies) // 2], 1) if latencies else float("nan"),
+        p95_ms=round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1) if latencies else float("nan"),
+        tokens_per_question=round(statistics.fmean(tokens), 1) if tokens else 0.0,
+        ranks=ranks,
+    )
+
+
+def report(scores: List[Score], ks: List[int]) -> None:
+    header = f"{'pipeline':<8} {'config':<16} " + " ".join(f"{'R@' + str(k):>6}" for k in ks)
+    print(f"\n{header} {'MRR':>6} {'p50 ms':>8} {'p95 ms':>8} {'tok/q':>7}  {'errors':>6}  vs full")
+    baseline = {score.pipeline: score for score in scores if score.config == "full"}
+    for score in scores:
+        base = baseline.get(score.pipeline)
+        delta = ""
+        if base is not None and score is not base:
+            delta = f"MRR {score.mrr - base.mrr:+.3f}, p50 {score.p50_ms - base.p50_ms:+.0f} ms"
+        recalls = " ".join(f"{score.recall[k]:6.3f}" for k in ks)
+        print(
+            f"{score.pipeline:<8} {score.config:<16} {recalls} {score.mrr:6.3f} {score.p50_ms:8.1f} "
+            f"{score.p95_ms:8.1f} {score.tokens_per_question:7.0f}  {score.errors:6d}  {delta}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> List[Score]:
+    parser = argparse.ArgumentParser(description="Golden-query retrieval quality and latency per pipeline configuration")
+    parser.add_argument("--golden", default=os.path.join(GOLDEN_DIR, "queries_v1.jsonl"))
+    parser.add_argument("--corpus", default=os.path.join(GOLDEN_DIR, "statutes_v1.jsonl"), help="stand-in provisions")
+    parser.add_argument("--pipelines", default=",".join(PIPELINES))
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS)
+    parser.add_argument("--k", default="1,3,5")
+    parser.add_argument("--backend", choices=("standin", "replay", "live"), default="standin")
+    parser.add_argument("--fixtures", help="fixture file for --backend replay")
+    parser.add_argument("--record", metavar="PATH", help="with --backend live, record the client calls")
+    parser.add_argument("--points-per-layer", type=int, default=300)
+    parser.add_argument("--json", dest="json_path")
+    add_latency_arguments(parser)
+    parser.set_defaults(chat_median_ms=60.0, chat_p95_ms=150.0, tokens_per_second=400.0)
+    args = parser.parse_args(argv)
+
+    if args.backend == "replay" and not args.fixtures:
+        parser.error("--backend replay needs --fixtures")
+    if args.record and args.backend != "live":
+        parser.error("--record only applies to --backend live")
+    ks = sorted(int(k) for k in args.k.split(","))
+    pipelines = [name.strip() for name in args.pipelines.split(",") if name.strip()]
+    configs = [name.strip() for name in args.configs.split(",") if name.strip()]
+    questions = load_jsonl(args.golden)
+    with open(args.golden, "rb") as handle:
+        golden_digest = hashlib.sha1(handle.read()).hexdigest()[:12]
+    print(f"golden set {os.path.basename(args.golden)} ({len(questions)} questions, sha1 {golden_digest}), backend {args.backend}")
+
+    from bench_pipelines import import_pipelines
+
+    answer_llm, answer_llm2, _ = import_pipelines()
+    modules = {"v1": answer_llm, "v2": answer_llm2}
+    scores: List[Score] = []
+    with contextlib.ExitStack() as stack:
+        if args.backend == "standin":
+            server = stack.enter_context(FakeAzureServer(config_from_arguments(args)))
+            qdrant = synthetic_qdrant.build(
+                layered_collection=answer_llm.QDRANT_COLLECTION,
+                layer_collections=answer_llm2.COLLECTIONS,
+                points_per_layer=args.points_per_layer,
+                dimensions=server.config.dimensions,
+                provisions=load_jsonl(args.corpus),
+            )
+            for module in modules.values():
+                module.llm = server.client()
+                module.qdrant = qdrant
+        elif args.backend == "replay":
+            stack.enter_context(record_replay.fixtures(args.fixtures, "replay", latency_scale=1.0))
+        elif args.record:
+            stack.enter_context(record_replay.fixtures(args.record, "record"))
+
+        for pipeline_name in pipelines:
+            module = modules[pipeline_name]
+            for config in configs:
+                if config == "vector-rerank" and not hasattr(module, "vector_rerank"):
+                    continue
+                score = evaluate(pipeline_name, module.answer_query, module, config, questions, ks)
+                print(f"  {pipeline_name} {config}: MRR {score.mrr:.3f}, p50 {score.p50_ms:.0f} ms")
+                scores.append(score)
+
+    report(scores, ks)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as handle:
+            json.dump(
+                {"golden": os.path.basename(args.golden), "golden_sha1": golden_digest, "backend": args.backend,
+                 "scores": [asdict(score) for score in scores]},
+                handle,
+                indent=2,
+            )
+    return scores
+
+
+if __name__ == "__main__":
+    main()
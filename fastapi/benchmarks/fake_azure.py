@@ -0,0 +1,304 @@
+"""
+Local stand-in for the Azure OpenAI chat and embeddings endpoints.
+
+Serves the deployment-scoped Azure paths the ``openai`` SDK calls
+(``/openai/deployments/<name>/chat/completions`` and ``.../embeddings``) from
+a threaded stdlib HTTP server, so ``AzureOpenAI(azure_endpoint=server.url)``
+works unchanged. Every response reports ``usage``.
+
+Latency is modelled, not real: each call waits for a time-to-first-token
+drawn from a log-normal distribution given by its median and p95, plus the
+completion tokens divided by ``tokens_per_second``. Chat replies are shaped
+after the prompt they answer (rewriter, reranker, validator, generator,
+document analysis). Embeddings are deterministic, lexical hashed bags of
+words (see ``embedding_for``).
+
+Run standalone to point a dev server at it:
+    python benchmarks/fake_azure.py --port 8765 --chat-median-ms 400
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import numpy as np
+
+_PATH = re.compile(r"^/openai/deployments/(?P<deployment>[^/]+)/(?P<operation>chat/completions|embeddings)$")
+_RERANK_ITEMS = re.compile(r'"id"\s*:\s*(\d+)')
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("a an and any as at be by for from in is it of on or shall such that the to under what which who with".split())
+
+FILLER = (
+    "The provision applies to every person who dishonestly induces delivery of property. "
+    "Sub-section (2) lays down the procedure and the penalty that follows on conviction. "
+)
+
+
+@dataclass
+class LatencyModel:
+    """Log-normal latency given its median and 95th percentile, in milliseconds."""
+
+    median_ms: float
+    p95_ms: float
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        sigma = math.log(max(self.p95_ms, self.median_ms) / self.median_ms) / 1.645
+        return rng.lognormvariate(math.log(self.median_ms), sigma) / 1000.0
+
+
+@dataclass
+class FakeAzureConfig:
+    chat_latency: LatencyModel = field(default_factory=lambda: LatencyModel(250, 600))
+    embedding_latency: LatencyModel = field(default_factory=lambda: LatencyModel(40, 120))
+    tokens_per_second: float = 80.0
+    answer_tokens: int = 350
+    dimensions: int = 256
+    seed: int = 0
+
+
+@dataclass
+class CallStats:
+    chat: int = 0
+    embeddings: int = 0
+    embedding_inputs: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def embedding_for(text: str, dimensions: int) -> List[float]:
+    """
+    Deterministic unit vector for ``text``: a feature-hashed bag of words plus a
+    small per-text component. Texts sharing words land close together, so
+    searches over fake embeddings rank by lexical overlap.
+    """
+    vector = np.zeros(dimensions)
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        digest = zlib.crc32(token.encode("utf-8"))
+        vector[digest % dimensions] += 1.0 if (digest >> 16) & 1 else -1.0
+    noise = np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(dimensions)
+    vector = vector / (np.linalg.norm(vector) or 1.0) + 0.05 * noise / np.linalg.norm(noise)
+    return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+
+def _words(text: str) -> set:
+    return {token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS}
+
+
+def _rerank(user: str) -> List[dict]:
+    """Score chunks by the share of question words found in their meta and text."""
+    try:
+        if user.startswith("Question:"):  # answer_llm: "Question:\n<q>\n\nChunks:\n<json>"
+            head, _, chunks = user.partition("\n\nChunks:\n")
+            question, items = head[len("Question:"):], json.loads(chunks)
+        else:  # answer_llm2: {"q": ..., "chunks": [...]}
+            payload = json.loads(user)
+            question, items = payload["q"], payload["chunks"]
+    except (ValueError, KeyError):
+        ids = sorted({int(match) for match in _RERANK_ITEMS.findall(user)})
+        return [{"layer": "L3", "id": i, "score": round(0.95 - 0.03 * rank, 2), "reason": "states the rule"} for rank, i in enumerate(ids)]
+    wanted = _words(question) or {""}
+    scored = [
+        {
+            "layer": item.get("layer", "L2"),
+            "id": item["id"],
+            "score": round(len(wanted & _words(f"{item.get('meta', '')} {item.get('text', '')}")) / len(wanted), 3),
+            "reason": "shares terms with the question",
+        }
+        for item in items
+    ]
+    return sorted(scored, key=lambda row: row["score"], reverse=True)
+
+
+def _chat_reply(messages: List[Dict[str, str]], config: FakeAzureConfig, max_tokens: Optional[int]) -> str:
+    system = (messages[0].get("content") or "") if messages else ""
+    user = (messages[-1].get("content") or "") if messages else ""
+    if "rewriter" in system:
+        topic = " ".join(user.split()[:6])
+        return json.dumps([f"{topic} section", f"{topic} penalty", f"{topic} definition"])
+    if "reranker" in system:
+        return json.dumps(_rerank(user))
+    if "validator" in system:
+        return "✅ Verified"
+    if "respond ONLY with JSON" in system:
+        # Document analysis (analysis_llm): the structured object it asks for.
+        return json.dumps(
+            {
+                "summary": FILLER * 2,
+                "analysis": FILLER * 6,
+                "key_points": ["The appeal was dismissed.", "Costs were imposed."],
+                "keywords": ["cheating", "Section 420", "inherent powers"],
+                "comparisons": [],
+                "table_markdown": "",
+            }
+        )
+    budget = min(config.answer_tokens, max_tokens or config.answer_tokens)
+    words = (FILLER * (budget // 30 + 1)).split()
+    return "1️⃣ Section 420, Indian Penal Code, 1860\n" + " ".join(words[: int(budget * 0.75)])
+
+
+class FakeAzureServer:
+    """Threaded HTTP server emulating Azure OpenAI; use as a context manager."""
+
+    def __init__(self, config: Optional[FakeAzureConfig] = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.config = config or FakeAzureConfig()
+        self.stats = CallStats()
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _sample(self, model: LatencyModel) -> float:
+        with self._lock:
+            return model.sample(self._rng)
+
+    def _chat(self, body: dict) -> dict:
+        messages = body.get("messages") or []
+        content = _chat_reply(messages, self.config, body.get("max_tokens"))
+        prompt_tokens = sum(_tokens(message.get("content") or "") for message in messages)
+        completion_tokens = _tokens(content)
+        time.sleep(self._sample(self.config.chat_latency) + completion_tokens / self.config.tokens_per_second)
+        with self._lock:
+            self.stats.chat += 1
+            self.stats.prompt_tokens += prompt_tokens
+            self.stats.completion_tokens += completion_tokens
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _embeddings(self, body: dict) -> dict:
+        inputs = body.get("input")
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs or [])
+        time.sleep(self._sample(self.config.embedding_latency))
+        prompt_tokens = sum(_tokens(text) for text in inputs)
+        with self._lock:
+            self.stats.embeddings += 1
+            self.stats.embedding_inputs += len(inputs)
+            self.stats.prompt_tokens += prompt_tokens
+        return {
+            "object": "list",
+            "model": body.get("model", "fake"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": embedding_for(text, self.config.dimensions)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):  # noqa: A002 - keep benchmark output clean
+                pass
+
+            def _send(self, status: int, payload: dict) -> None:
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                match = _PATH.match(self.path.split("?", 1)[0])
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if match is None:
+                    self._send(404, {"error": {"code": "NotFound", "message": self.path}})
+                elif match.group("operation") == "embeddings":
+                    self._send(200, server._embeddings(body))
+                else:
+                    self._send(200, server._chat(body))
+
+        return Handler
+
+    def start(self) -> "FakeAzureServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-azure", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeAzureServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def client(self):
+        """An ``AzureOpenAI`` client pointed at this server."""
+        from openai import AzureOpenAI
+
+        return AzureOpenAI(api_key="fake", api_version="2024-12-01-preview", azure_endpoint=self.url, max_retries=0)
+
+
+def add_latency_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--chat-median-ms", type=float, default=250.0)
+    parser.add_argument("--chat-p95-ms", type=float, default=600.0)
+    parser.add_argument("--embed-median-ms", type=float, default=40.0)
+    parser.add_argument("--embed-p95-ms", type=float, default=120.0)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--answer-tokens", type=int, default=350)
+    parser.add_argument("--dimensions", type=int, default=256)
+
+
+def config_from_arguments(args: argparse.Namespace) -> FakeAzureConfig:
+    return FakeAzureConfig(
+        chat_latency=LatencyModel(args.chat_median_ms, args.chat_p95_ms),
+        embedding_latency=LatencyModel(args.embed_median_ms, args.embed_p95_ms),
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        dimensions=args.dimensions,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a fake Azure OpenAI endpoint")
+    parser.add_argument("--port", type=int, default=8765)
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+    server = FakeAzureServer(config_from_arguments(args), port=args.port)
+    print(f"Fake Azure OpenAI on {server.url} (set AZURE_OPENAI_ENDPOINT to this URL)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Mixed-traffic load test of the whole app, for capacity planning.
+
+Runs ``main.app`` in process over ``httpx.ASGITransport``: one event loop and
+one thread pool, as in one uvicorn worker or Vercel function. Its upstreams
+are local fakes:
+
+* Google OAuth token and userinfo are served by a small local HTTP server.
+  ``settings.GOOGLE_TOKEN_URL`` and ``GOOGLE_USER_INFO_URL`` point at it, so
+  the callback still makes its blocking ``requests`` calls.
+* Azure OpenAI is ``fake_azure.FakeAzureServer``.
+* Qdrant is ``synthetic_qdrant`` in memory.
+
+The database is a fresh SQLite file unless ``--database-url`` names another
+one, e.g. a local Postgres. Users are seeded with history rows and enough
+credits.
+
+For each ``--users`` level, that many virtual users run a closed loop for
+``--duration`` seconds. Each picks a flow by the ``--mix`` weights and sends
+the next request as soon as the previous one answers. The flows are:
+
+    login     GET  /auth/google/callback (code exchange, userinfo, user upsert, auth log)
+    me        GET  /me with a bearer JWT
+    query-v2  POST /api/assistant/query-v2 (credits check/spend, pipeline, history)
+    history   GET  /api/assistant/history
+    credits   GET  /api/assistant/credits
+    analysis  POST /api/assistant/analysis with a distinct document
+
+Each level reports throughput, p50/p99 latency and errors. It also reports
+the occupancy of the event loop's thread pool (anyio's default limiter,
+``--threadpool-size``) and of the SQLAlchemy pool, sampled every 10 ms. The
+per-flow p99 table shows which flow saturates first. Throughput against p99
+across the levels is the saturation curve.
+
+Example:
+    python benchmarks/load_test.py --users 1,8,32,128 --duration 15 --json load.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx  # noqa: E402
+
+from fake_azure import FakeAzureServer, LatencyModel, add_latency_arguments, config_from_arguments  # noqa: E402
+
+FLOWS = ("login", "me", "query-v2", "history", "credits", "analysis")
+DEFAULT_MIX = "login=2,me=25,query-v2=15,history=20,credits=30,analysis=8"
+USER_PREFIX = "load-user-"
+
+DOCUMENT = (
+    "IN THE HIGH COURT OF DELHI. Criminal Revision Petition {n}. The petitioner challenges the order of the "
+    "learned Magistrate taking cognizance under Section 420 of the Indian Penal Code. The complaint alleges that "
+    "the petitioner induced the complainant to part with money on the promise of a supply that never came. "
+)
+
+
+class FakeGoogle:
+    """Serves the OAuth token exchange and userinfo endpoints with modelled latency."""
+
+    def __init__(self, latency: LatencyModel) -> None:
+        self.latency = latency
+        self._rng = random.Random(7)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _wait(self) -> None:
+        with self._lock:
+            delay = self.latency.sample(self._rng)
+        time.sleep(delay)
+
+    def _handler(self):
+        google = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):  # noqa: A002 - keep load test output clean
+                pass
+
+            def _send(self, payload: dict) -> None:
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):  # token exchange: the code names the user
+                body = parse_qs(self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode())
+                google._wait()
+                self._send({"access_token": body.get("code", ["0"])[0].split(":")[0], "token_type": "Bearer"})
+
+            def do_GET(self):  # userinfo
+                index = self.headers.get("Authorization", "").rsplit(" ", 1)[-1]
+                google._wait()
+                self._send(
+                    {
+                        "id": f"{USER_PREFIX}{index}",
+                        "email": f"{USER_PREFIX}{index}@example.com",
+                        "verified_email": True,
+                        "name": f"Load User {index}",
+                    }
+                )
+
+        return Handler
+
+    def __enter__(self) -> "FakeGoogle":
+        threading.Thread(target=self._server.serve_forever, name="fake-google", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@dataclass
+class Level:
+    users: int
+    requests: int
+    errors: int
+    throughput_rps: float
+    p50_ms: float
+    p99_ms: float
+    threadpool_size: int
+    threadpool_max: int
+    threadpool_mean: float
+    db_pool_capacity: int
+    db_pool_max: int
+    db_pool_mean: float
+    flows: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix: Dict[str, float] = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in FLOWS:
+            raise argparse.ArgumentTypeError(f"unknown flow {name!r}; expected one of {', '.join(FLOWS)}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def prepare(args: argparse.Namespace, server: FakeAzureServer, google: FakeGoogle):
+    """Import the app against the fakes, create the schema and seed users; returns (app, tokens)."""
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "fake")
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", server.url)
+
+    import database
+    import main
+    from bench_pipelines import use_fakes
+    from config import settings
+    from services import analysis_llm
+
+    # main.py and database.py configure INFO logging on import; keep per-request lines out of the report.
+    logging.getLogger().setLevel(logging.WARNING)
+
+    settings.GOOGLE_TOKEN_URL = f"{google.url}/token"
+    settings.GOOGLE_USER_INFO_URL = f"{google.url}/userinfo"
+    use_fakes(server, args.points_per_layer)
+    analysis_llm._llm_client = server.client()
+
+    database.init_db()
+    db = database.SessionLocal()
+    try:
+        for index in range(args.seed_users):
+            user_id = f"{USER_PREFIX}{index}"
+            if db.get(database.UserDB, user_id) is None:
+                db.add(database.UserDB(id=user_id, email=f"{user_id}@example.com", name=f"Load User {index}"))
+                db.flush()
+                db.add_all(
+                    database.AssistantHistoryDB(user_id=user_id, task_name="General", question=f"q{i}", answer="a" * 400)
+                    for i in range(args.history_rows)
+                )
+                db.commit()
+            database.ensure_credit_balance(db, user_id, initial_credits=10**9)
+    finally:
+        db.close()
+    tokens = [main.create_access_token({"sub": f"{USER_PREFIX}{i}@example.com"}, expires_delta=None) for i in range(args.seed_users)]
+    return main.app, tokens, database.engine
+
+
+def _request(flow: str, user: int, n: int, tokens: List[str]) -> Tuple[str, str, dict]:
+    user_id = f"{USER_PREFIX}{user}"
+    if flow == "login":
+        return "GET", "/auth/google/callback", {"params": {"code": f"{user}:{n}"}}
+    if flow == "me":
+        return "GET", "/me", {"headers": {"Authorization": f"Bearer {tokens[user]}"}}
+    if flow == "query-v2":
+        return "POST", "/api/assistant/query-v2", {"json": {"query": f"What is the punishment for cheating? ({n})", "user_id": user_id}}
+    if flow == "history":
+        return "GET", "/api/assistant/history", {"params": {"user_id": user_id, "limit": 20}}
+    if flow == "credits":
+        return "GET", "/api/assistant/credits", {"params": {"user_id": user_id}}
+    return "POST", "/api/assistant/analysis", {"json": {"text": DOCUMENT.format(n=n) * 6}}
+
+
+async def run_level(app, engine, tokens: List[str], users: int, args: argparse.Namespace, mix: Dict[str, float]) -> Level:
+    import anyio.to_thread
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = args.threadpool_size
+    pool = engine.pool
+    capacity = pool.size() + max(0, getattr(pool, "_max_overflow", 0))
+
+    results: List[Tuple[str, float, bool]] = []
+    samples: List[Tuple[int, int]] = []
+    counter = iter(range(10**9))
+    names, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + args.duration
+
+    async def sampler() -> None:
+        while time.perf_counter() < deadline:
+            samples.append((limiter.borrowed_tokens, pool.checkedout()))
+            await asyncio.sleep(0.01)
+
+    async def virtual_user(client: httpx.AsyncClient, seed: int) -> None:
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            flow = rng.choices(names, weights)[0]
+            method, path, kwargs = _request(flow, rng.randrange(len(tokens)), next(counter), tokens)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            results.append((flow, time.perf_counter() - started, ok))
+
+    transport = httpx.ASGITransport(app=app)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=None) as client:
+        await asyncio.gather(sampler(), *(virtual_user(client, seed) for seed in range(users)))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency, ok in results if ok)
+    by_flow: Dict[str, List[float]] = defaultdict(list)
+    for flow, latency, ok in results:
+        if ok:
+            by_flow[flow].append(latency)
+    return Level(
+        users=users,
+        requests=len(results),
+        errors=sum(1 for _, _, ok in results if not ok),
+        throughput_rps=round(len(latencies) / wall, 2),
+        p50_ms=round(percentile(latencies, 0.50) * 1000, 1),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 1),
+        threadpool_size=args.threadpool_size,
+        threadpool_max=max((s[0] for s in samples), default=0),
+        threadpool_mean=round(sum(s[0] for s in samples) / max(1, len(samples)), 1),
+        db_pool_capacity=capacity,
+        db_pool_max=max((s[1] for s in samples), default=0),
+        db_pool_mean=round(sum(s[1] for s in samples) / max(1, len(samples)), 1),
+        flows={
+            flow: {"requests": len(values), "p50_ms": round(percentile(sorted(values), 0.5) * 1000, 1), "p99_ms": round(percentile(sorted(values), 0.99) * 1000, 1)}
+            for flow, values in sorted(by_flow.items())
+        },
+    )
+
+
+def report(levels: List[Level]) -> None:
+    print(f"\n{'users':>5} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}  {'threads max/mean':>18}  {'db pool max/mean':>18}")
+    for level in levels:
+        print(
+            f"{level.users:5d} {level.throughput_rps:8.2f} {level.p50_ms:9.1f} {level.p99_ms:9.1f} {level.errors:7d}  "
+            f"{level.threadpool_max:4d}/{level.threadpool_mean:5.1f} of {level.threadpool_size:<4d}  "
+            f"{level.db_pool_max:4d}/{level.db_pool_mean:5.1f} of {level.db_pool_capacity:<4d}"
+        )
+    flows = sorted({flow for level in levels for flow in level.flows})
+    print(f"\np99 ms by flow\n{'users':>5} " + " ".join(f"{flow:>10}" for flow in flows))
+    for level in levels:
+        cells = [level.flows.get(flow, {}).get("p99_ms", float("nan")) for flow in flows]
+        print(f"{level.users:5d} " + " ".join(f"{cell:10.1f}" for cell in cells))
+
+
+def main(argv: Optional[List[str]] = None) -> List[Level]:
+    parser = argparse.ArgumentParser(description="Mixed-traffic load test against fake upstreams")
+    parser.add_argument("--users", default="1,8,32,64", help="concurrency levels (virtual users)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--seed-users", type=int, default=50)
+    parser.add_argument("--history-rows", type=int, default=50)
+    parser.add_argument("--threadpool-size", type=int, default=40, help="anyio default thread limiter tokens")
+    parser.add_argument("--google-median-ms", type=float, default=80.0)
+    parser.add_argument("--google-p95-ms", type=float, default=200.0)
+    parser.add_argument("--points-per-layer", type=int, default=500)
+    parser.add_argument("--json", dest="json_path")
+    add_latency_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix="advotac-load-"), "load.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+    levels: List[Level] = []
+    google = FakeGoogle(LatencyModel(args.google_median_ms, args.google_p95_ms))
+    with FakeAzureServer(config_from_arguments(args)) as server, google:
+        app, tokens, engine = prepare(args, server, google)
+        for users in (int(level) for level in args.users.split(",")):
+            level = asyncio.run(run_level(app, engine, tokens, users, args, args.mix))
+            print(f"  {users:4d} users: {level.throughput_rps:7.2f} req/s, p99 {level.p99_ms:.1f} ms, {level.errors} errors")
+            levels.append(level)
+
+    report(levels)
+    if args.json_path:
+        config = {key: value for key, value in vars(args).items() if key != "mix"}
+        with open(args.json_path, "w", encoding="utf-8") as handle:
+            json.dump({"config": {**config, "mix": args.mix}, "levels": [asdict(level) for level in levels]}, handle, indent=2)
+    return levels
+
+
+if __name__ == "__main__":
+    main()
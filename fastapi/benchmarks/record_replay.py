@@ -0,0 +1,235 @@
+"""
+Record/replay fixtures for the Azure OpenAI and Qdrant clients.
+
+``fixtures(path, "record")`` wraps the clients the services call:
+``answer_llm.llm``, ``answer_llm2.llm``, their ``qdrant`` and
+``analysis_llm._llm_client``. Each request and response pair is written,
+with its latency, to a gzip-compressed JSON-lines file. ``fixtures(path,
+"replay")`` puts stand-ins in their place. They return the recorded
+responses without any network and wait ``latency_scale`` times the recorded
+latency; ``latency_scale=0`` leaves only the Python work of the pipelines.
+
+The micro-batchers group calls differently from run to run. So embeddings
+are keyed per input text and searches per ``SearchRequest``, and a batched
+call is rebuilt from its parts; its latency on replay is the slowest part's.
+Streamed chat completions keep each chunk's offset.
+
+Keys are a hash of the request without the deployment name, so fixtures
+recorded against one deployment replay under another. A replay miss raises
+``FixtureMiss``, because a changed prompt or retrieval result should fail a
+regression run, not go unnoticed. Identical requests recorded several times
+are replayed in turn.
+
+Record against the live services once, then replay in CI:
+    python benchmarks/bench_pipelines.py --live --record fixtures/pipelines.jsonl.gz --concurrency 1
+    python benchmarks/bench_pipelines.py --replay fixtures/pipelines.jsonl.gz --latency-scale 0
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List
+
+from openai.types import CreateEmbeddingResponse
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from qdrant_client import models
+
+MODES = ("record", "replay")
+
+
+class FixtureMiss(KeyError):
+    """A replayed request has no recorded response."""
+
+
+def _key(kind: str, request: Dict[str, Any]) -> str:
+    canonical = json.dumps([kind, request], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def _dump(value: Any) -> Any:
+    return value.model_dump(mode="json", exclude_none=True) if hasattr(value, "model_dump") else value
+
+
+class FixtureSession:
+    """Recorded request/response pairs and the mode they are used in."""
+
+    def __init__(self, path: str, mode: str, *, latency_scale: float = 1.0) -> None:
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.calls: Counter = Counter()
+        self._records: Dict[str, List[dict]] = {}
+        self._cursor: Counter = Counter()
+        self._lock = threading.Lock()
+        if mode == "replay":
+            with gzip.open(path, "rt", encoding="utf-8") as handle:
+                for line in handle:
+                    record = json.loads(line)
+                    self._records.setdefault(record["key"], []).append(record)
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    def __len__(self) -> int:
+        return sum(len(records) for records in self._records.values())
+
+    def add(self, kind: str, request: Dict[str, Any], latency_s: float, **fields: Any) -> None:
+        record = {"kind": kind, "key": _key(kind, request), "request": request, "latency_s": round(latency_s, 6), **fields}
+        with self._lock:
+            self._records.setdefault(record["key"], []).append(record)
+
+    def take(self, kind: str, request: Dict[str, Any]) -> dict:
+        key = _key(kind, request)
+        with self._lock:
+            records = self._records.get(key)
+            if not records:
+                raise FixtureMiss(f"no recorded {kind} response for request {key}")
+            record = records[self._cursor[key] % len(records)]
+            self._cursor[key] += 1
+        return record
+
+    def wait(self, latency_s: float) -> None:
+        if self.latency_scale > 0 and latency_s > 0:
+            time.sleep(latency_s * self.latency_scale)
+
+    def save(self) -> None:
+        with gzip.open(self.path, "wt", encoding="utf-8") as handle:
+            for records in self._records.values():
+                for record in records:
+                    handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class FixtureOpenAI:
+    """Stand-in for ``AzureOpenAI`` exposing ``chat.completions.create`` and ``embeddings.create``."""
+
+    def __init__(self, session: FixtureSession, inner: Any = None) -> None:
+        if session.recording and inner is None:
+            raise ValueError("recording needs a real client to wrap")
+        self.session = session
+        self.inner = inner
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.embeddings = SimpleNamespace(create=self._embeddings)
+
+    def _chat(self, **kwargs: Any) -> Any:
+        self.session.calls["chat"] += 1
+        request = {name: value for name, value in kwargs.items() if name != "model"}
+        if kwargs.get("stream"):
+            return self._record_stream(request, kwargs) if self.session.recording else self._replay_stream(request)
+        if self.session.recording:
+            started = time.perf_counter()
+            response = self.inner.chat.completions.create(**kwargs)
+            self.session.add("chat", request, time.perf_counter() - started, response=_dump(response))
+            return response
+        record = self.session.take("chat", request)
+        self.session.wait(record["latency_s"])
+        return ChatCompletion.model_validate(record["response"])
+
+    def _record_stream(self, request: Dict[str, Any], kwargs: Dict[str, Any]) -> Iterator[Any]:
+        started = time.perf_counter()
+        chunks = []
+        for chunk in self.inner.chat.completions.create(**kwargs):
+            chunks.append([round(time.perf_counter() - started, 6), _dump(chunk)])
+            yield chunk
+        self.session.add("chat", request, time.perf_counter() - started, chunks=chunks)
+
+    def _replay_stream(self, request: Dict[str, Any]) -> Iterator[Any]:
+        record = self.session.take("chat", request)
+        elapsed = 0.0
+        for offset, chunk in record["chunks"]:
+            self.session.wait(offset - elapsed)
+            elapsed = offset
+            yield ChatCompletionChunk.model_validate(chunk)
+
+    def _embeddings(self, *, model: str, input: Any, **kwargs: Any) -> Any:  # noqa: A002 - SDK keyword
+        self.session.calls["embeddings"] += 1
+        texts = [input] if isinstance(input, str) else list(input)
+        if self.session.recording:
+            started = time.perf_counter()
+            response = self.inner.embeddings.create(model=model, input=input, **kwargs)
+            latency = time.perf_counter() - started
+            prompt_tokens = response.usage.prompt_tokens // max(1, len(texts)) if response.usage else 0
+            for item in response.data:
+                self.session.add(
+                    "embedding", {"input": texts[item.index], **kwargs}, latency,
+                    embedding=list(item.embedding), prompt_tokens=prompt_tokens,
+                )
+            return response
+        records = [self.session.take("embedding", {"input": text, **kwargs}) for text in texts]
+        self.session.wait(max(record["latency_s"] for record in records))
+        prompt_tokens = sum(record["prompt_tokens"] for record in records)
+        return CreateEmbeddingResponse.model_validate(
+            {
+                "object": "list",
+                "model": model,
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": record["embedding"]} for i, record in enumerate(records)
+                ],
+                "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+            }
+        )
+
+
+class FixtureQdrant:
+    """Stand-in for ``QdrantClient`` covering ``search_batch``, the call the search batchers make."""
+
+    def __init__(self, session: FixtureSession, inner: Any = None) -> None:
+        if session.recording and inner is None:
+            raise ValueError("recording needs a real client to wrap")
+        self.session = session
+        self.inner = inner
+
+    def search_batch(self, collection_name: str, requests: List[models.SearchRequest], **kwargs: Any):
+        self.session.calls["search_batch"] += 1
+        keyed = [{"collection": collection_name, "request": _dump(request)} for request in requests]
+        if self.session.recording:
+            started = time.perf_counter()
+            results = self.inner.search_batch(collection_name=collection_name, requests=requests, **kwargs)
+            latency = time.perf_counter() - started
+            for request, points in zip(keyed, results):
+                self.session.add("search", request, latency, points=[_dump(point) for point in points])
+            return results
+        records = [self.session.take("search", request) for request in keyed]
+        self.session.wait(max((record["latency_s"] for record in records), default=0.0))
+        return [[models.ScoredPoint.model_validate(point) for point in record["points"]] for record in records]
+
+
+@contextmanager
+def fixtures(path: str, mode: str, *, latency_scale: float = 1.0) -> Iterator[FixtureSession]:
+    """
+    Swap the service clients for recording or replaying stand-ins.
+
+    The original clients are put back on exit. A recording is written then,
+    and it is written even if the block raised.
+    """
+    from services import analysis_llm, answer_llm, answer_llm2
+
+    session = FixtureSession(path, mode, latency_scale=latency_scale)
+    targets = [(answer_llm, "llm"), (answer_llm2, "llm"), (analysis_llm, "_llm_client"), (answer_llm, "qdrant"), (answer_llm2, "qdrant")]
+    originals = [(module, name, getattr(module, name)) for module, name in targets]
+    wrapped: Dict[tuple, Any] = {}
+    for module, name, client in originals:
+        if session.recording and client is None:
+            continue
+        factory = FixtureQdrant if name == "qdrant" else FixtureOpenAI
+        # One wrapper per underlying client, so modules sharing a client share its wrapper.
+        wrapper = wrapped.get((factory, id(client))) or factory(session, client if session.recording else None)
+        wrapped[(factory, id(client))] = wrapper
+        setattr(module, name, wrapper)
+    try:
+        yield session
+    finally:
+        for module, name, client in originals:
+            setattr(module, name, client)
+        if session.recording:
+            session.save()
+
+
+__all__ = ["FixtureMiss", "FixtureOpenAI", "FixtureQdrant", "FixtureSession", "fixtures"]
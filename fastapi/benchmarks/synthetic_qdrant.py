@@ -0,0 +1,122 @@
+"""
+In-memory Qdrant seeded with synthetic L1/L2/L3 statute chunks.
+
+Builds ``QdrantClient(":memory:")`` with the collections both pipelines
+search: the single layered ``QDRANT_COLLECTION`` used by ``answer_llm`` and
+the three ``advotac_acts_L1/L2/L3`` collections used by ``answer_llm2``.
+Payloads carry the fields each pipeline reads (titles, headings, section
+numbers, page_content/search_text, layer). Vectors come from
+``fake_azure.embedding_for`` over the chunk text, so they live in the same
+space as the fake embeddings of queries.
+"""
+
+import random
+from typing import Dict, Iterable, List
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from fake_azure import embedding_for
+
+ACTS = [
+    ("Indian Penal Code", 1860),
+    ("Code of Criminal Procedure", 1973),
+    ("Indian Contract Act", 1872),
+    ("Hindu Marriage Act", 1955),
+    ("Companies Act", 2013),
+    ("Central Goods and Services Tax Act", 2017),
+]
+TOPICS = ["cheating", "criminal breach of trust", "bail", "void agreements", "valid marriage", "supply", "penalty", "definitions"]
+LAYERS = {"L1": "Chapter", "L2": "Section", "L3": "Clause"}
+
+
+def _chunk(rng: random.Random, index: int, layer: str) -> Dict[str, object]:
+    act, year = rng.choice(ACTS)
+    topic = rng.choice(TOPICS)
+    section = rng.randint(1, 500)
+    heading = f"{topic.title()} under the {act}"
+    text = (
+        f"{LAYERS[layer]} {index}. Section {section} of the {act}, {year}: {topic}. "
+        f"Whoever commits {topic} shall be liable as provided in this {LAYERS[layer].lower()}."
+    )
+    return {
+        "layer": layer,
+        "act_title": f"{act}, {year}",
+        "doc_title": f"{act}, {year}",
+        "context_path": f"{act} > Chapter {section // 50 + 1} > Section {section}",
+        "breadcrumbs": f"{act} > Chapter {section // 50 + 1}",
+        "heading": heading,
+        "section_heading": heading,
+        "section_number": str(section),
+        "unit_id": f"{layer}-{index}",
+        "page_content": text,
+        "search_text": text,
+    }
+
+
+def _upsert(client: QdrantClient, collection: str, payloads: List[Dict[str, object]], dimensions: int) -> None:
+    client.create_collection(collection, vectors_config=models.VectorParams(size=dimensions, distance=models.Distance.COSINE))
+    vectors = np.asarray([embedding_for(str(p["search_text"]), dimensions) for p in payloads], dtype=np.float32)
+    for start in range(0, len(payloads), 500):
+        client.upsert(
+            collection,
+            points=models.Batch(
+                ids=list(range(start, min(start + 500, len(payloads)))),
+                vectors=vectors[start:start + 500].tolist(),
+                payloads=payloads[start:start + 500],
+            ),
+        )
+
+
+def provision_payload(provision: Dict[str, str]) -> Dict[str, object]:
+    """Payload for a known provision ({act_title, section, heading, text, unit_id, layer})."""
+    act_title, section = provision["act_title"], str(provision["section"])
+    return {
+        "layer": provision.get("layer", "L2"),
+        "act_title": act_title,
+        "doc_title": act_title,
+        "context_path": f"{act_title} > Section {section}",
+        "breadcrumbs": act_title,
+        "heading": provision["heading"],
+        "section_heading": provision["heading"],
+        "section_number": section,
+        "unit_id": provision["unit_id"],
+        "page_content": f"Section {section}. {provision['heading']}. {provision['text']}",
+        "search_text": f"Section {section}. {provision['heading']}. {provision['text']}",
+    }
+
+
+def build(
+    *,
+    layered_collection: str,
+    layer_collections: Iterable[str],
+    points_per_layer: int = 1000,
+    dimensions: int = 256,
+    seed: int = 0,
+    provisions: Iterable[Dict[str, str]] = (),
+) -> QdrantClient:
+    """
+    In-memory client with one mixed-layer collection plus one collection per layer.
+
+    ``provisions`` are real statute sections (see ``provision_payload``) added
+    among the generated chunks of their layer, for retrieval evaluation.
+    """
+    rng = random.Random(seed)
+    client = QdrantClient(":memory:")
+    by_layer = {layer: [_chunk(rng, i, layer) for i in range(points_per_layer)] for layer in LAYERS}
+    for provision in provisions:
+        payload = provision_payload(provision)
+        by_layer[str(payload["layer"])].append(payload)
+    _upsert(client, layered_collection, [p for layer in LAYERS for p in by_layer[layer]], dimensions)
+    for collection in layer_collections:
+        _upsert(client, collection, by_layer[collection.rsplit("_", 1)[-1].upper()], dimensions)
+    return client
+
+
+def sample_queries(count: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        f"What is the {rng.choice(['punishment', 'procedure', 'definition'])} for {rng.choice(TOPICS)} "
+        f"under the {rng.choice(ACTS)[0]}? ({i})"
+        for i in range(count)
+    ]
@@ -48,6 +48,9 @@ class Settings:
     ALGORITHM: str = _clean_env("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(_clean_env("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     
+    # Accounts allowed on admin endpoints (comma-separated); empty means no admins
+    ADMIN_EMAILS: List[str] = [e.strip().lower() for e in _clean_env("ADMIN_EMAILS").split(",") if e.strip()]
+
     # URLs
     FRONTEND_URL: str = _clean_env("FRONTEND_URL", "https://advotac.com/")
     BACKEND_URL: str = _clean_env("BACKEND_URL", "https://apiadvotac.com/")
@@ -80,6 +83,11 @@ class Settings:
     QDRANT_API_KEY: str = _clean_env("QDRANT_API_KEY", "")
     QDRANT_COLLECTION: str = _clean_env("QDRANT_COLLECTION", "central_acts_v2")
 
+    # Monthly partitions and retention for auth_logs / assistant_history
+    PARTITION_MONTHS_AHEAD: int = int(_clean_env("PARTITION_MONTHS_AHEAD", "3"))
+    AUTH_LOG_RETENTION_MONTHS: int = int(_clean_env("AUTH_LOG_RETENTION_MONTHS", "12"))
+    ASSISTANT_HISTORY_RETENTION_MONTHS: int = int(_clean_env("ASSISTANT_HISTORY_RETENTION_MONTHS", "24"))
+
     # File uploads
     MAX_UPLOAD_SIZE: int = int(_clean_env("MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))
     ALLOWED_EXTENSIONS: List[str] = _clean_env("ALLOWED_EXTENSIONS", "pdf,doc,docx,txt").split(",")
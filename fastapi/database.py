@@ -1,10 +1,13 @@
-from sqlalchemy import create_engine, Column, String, Boolean, DateTime, Text, Integer, ForeignKey, Enum, JSON
+from sqlalchemy import create_engine, event, exists, insert, Column, String, Boolean, DateTime, Text, Integer, BigInteger, ForeignKey, Enum, JSON, LargeBinary, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, object_session
 from datetime import datetime
+import hashlib
+import json
 import logging
 import enum
-from typing import Optional, List
+import zlib
+from typing import Optional, List, Dict, Tuple
 
 from config import settings
 import os
@@ -32,8 +35,28 @@ logger.info(f"Connecting to database: {settings.PGDATABASE} at {settings.PGHOST}
 
 # Serverless-optimized connection pool settings
 is_serverless = os.environ.get('VERCEL') == '1'
+is_sqlite = settings.DATABASE_URL.startswith("sqlite")
 
-if is_serverless:
+if is_sqlite:
+    # Local SQLite file (load tests, offline development). Sessions move between
+    # threadpool workers, so the same-thread check is off; WAL and a busy timeout
+    # let concurrent readers and one writer proceed instead of failing on locks.
+    engine = create_engine(
+        settings.DATABASE_URL,
+        echo=False,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=30,
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _configure_sqlite(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+elif is_serverless:
     # For serverless (Vercel), use minimal pooling with aggressive timeouts
     engine = create_engine(
         settings.DATABASE_URL,
@@ -139,23 +162,38 @@ class UserDB(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     last_login = Column(DateTime, default=datetime.utcnow)
     
-    # Relationship to user_info
-    user_info = relationship("UserInfoDB", back_populates="user", uselist=False, cascade="all, delete-orphan")
-    assistant_history = relationship("AssistantHistoryDB", back_populates="user", cascade="all, delete-orphan")
+    # Child rows are removed by the ON DELETE CASCADE foreign keys; passive_deletes
+    # keeps the ORM from loading and deleting them one by one when a user is deleted.
+    user_info = relationship(
+        "UserInfoDB",
+        back_populates="user",
+        uselist=False,
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    assistant_history = relationship(
+        "AssistantHistoryDB",
+        back_populates="user",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
     general_task_history = relationship(
         "GeneralTaskHistoryDB",
         back_populates="user",
         cascade="all, delete-orphan",
+        passive_deletes=True,
     )
     credit_balances = relationship(
         "CreditBalanceDB",
         back_populates="user",
         cascade="all, delete-orphan",
+        passive_deletes=True,
     )
     credit_usage = relationship(
         "CreditUsageDB",
         back_populates="user",
         cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
 class UserInfoDB(Base):
@@ -188,7 +226,8 @@ class AuthLogDB(Base):
     ip_address = Column(String, nullable=True)
     user_agent = Column(String, nullable=True)
     error_message = Column(Text, nullable=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    # Range partition key by month once migrations.partition_table has run
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
 
 class DocumentAnalysisDB(Base):
     __tablename__ = "document_analyses"
@@ -201,9 +240,25 @@ class DocumentAnalysisDB(Base):
     source_excerpt = Column(Text, nullable=True)
     result = Column(Text, nullable=False)
     model = Column(String, nullable=True)
+    # sha256 of the cleaned text + analysis parameters; see services.analysis_cache
+    content_hash = Column(String(64), index=True, nullable=True)
+    # sha256 of the raw uploaded bytes + analysis parameters, so repeat uploads skip parsing
+    source_hash = Column(String(64), index=True, nullable=True)
+    # zlib-compressed analysed text, so any worker can reopen the follow-up session
+    text_blob = Column(LargeBinary, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+
+class DocumentAnalysisSourceDB(Base):
+    __tablename__ = "document_analysis_sources"
+
+    # Another upload whose extracted text matched an existing analysis; points at that row
+    source_hash = Column(String(64), primary_key=True)
+    analysis_id = Column(Integer, ForeignKey('document_analyses.id', ondelete='CASCADE'), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 class AssistantHistoryDB(Base):
     __tablename__ = "assistant_history"
 
@@ -213,10 +268,48 @@ class AssistantHistoryDB(Base):
     question = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
     response_time_ms = Column(Integer, nullable=True)
+    # Per-stage milliseconds and token usage of the pipeline run (instrumentation.PipelineTimings)
+    stage_timings = Column(JSON, nullable=True)
+    # Range partition key by month once migrations.partition_table has run
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     user = relationship("UserDB", back_populates="assistant_history")
 
+    __table_args__ = (
+        Index("ix_assistant_history_user_id_created_at", "user_id", "created_at"),
+    )
+
+
+class AuthLogMonthlyDB(Base):
+    __tablename__ = "auth_log_monthly"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    month = Column(DateTime, nullable=False)
+    action = Column(String, nullable=True)
+    status = Column(String, nullable=True)
+    events = Column(BigInteger, nullable=False, default=0)
+    distinct_users = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("month", "action", "status", name="uq_auth_log_monthly_key"),
+    )
+
+
+class AssistantHistoryMonthlyDB(Base):
+    __tablename__ = "assistant_history_monthly"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    month = Column(DateTime, nullable=False)
+    user_id = Column(String, nullable=False, index=True)
+    task_name = Column(String(100), nullable=False)
+    queries = Column(BigInteger, nullable=False, default=0)
+    total_response_time_ms = Column(BigInteger, nullable=False, default=0)
+    max_response_time_ms = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("month", "user_id", "task_name", name="uq_assistant_history_monthly_key"),
+    )
+
 
 class GeneralTaskHistoryDB(Base):
     __tablename__ = "general_task_history"
@@ -227,12 +320,34 @@ class GeneralTaskHistoryDB(Base):
     task_name = Column(String(100), nullable=False, default="General")
     query = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
-    response_payload = Column(JSON, nullable=False)
+    # Legacy rows keep the raw JSON here; new rows store a compressed payload in
+    # payload_blob with snippets moved to source_snippets (see pack_general_payload).
+    response_payload = Column(JSON, nullable=True)
+    payload_blob = Column(LargeBinary, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     user = relationship("UserDB", back_populates="general_task_history")
 
 
+class SourceSnippetDB(Base):
+    __tablename__ = "source_snippets"
+
+    # sha256 over collection, unit_id and snippet text so identical chunks are stored once
+    digest = Column(String(64), primary_key=True)
+    collection = Column(String, nullable=True)
+    unit_id = Column(String, nullable=True)
+    snippet = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class GeneralTaskSnippetDB(Base):
+    __tablename__ = "general_task_snippets"
+
+    # Snippets a stored general task payload refers to, so unreferenced ones can be purged
+    task_id = Column(Integer, ForeignKey('general_task_history.id', ondelete='CASCADE'), primary_key=True)
+    digest = Column(String(64), ForeignKey('source_snippets.digest'), primary_key=True, index=True)
+
+
 class CreditPlanDB(Base):
     __tablename__ = "credit_plan"
 
@@ -282,6 +397,33 @@ class CreditUsageDB(Base):
     plan = relationship("CreditPlanDB", back_populates="credit_usage")
 
 
+class AssistantStatsHourlyDB(Base):
+    __tablename__ = "assistant_stats_hourly"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    hour = Column(DateTime, nullable=False, index=True)
+    user_id = Column(String, nullable=False, index=True)
+    task_name = Column(String(100), nullable=False)
+    requests = Column(BigInteger, nullable=False, default=0)
+    timed_requests = Column(BigInteger, nullable=False, default=0)
+    total_response_time_ms = Column(BigInteger, nullable=False, default=0)
+    # Counts per services.usage_stats.LATENCY_BUCKETS_MS bucket; mergeable across rows
+    latency_histogram = Column(JSON, nullable=False, default=list)
+    credits_spent = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("hour", "user_id", "task_name", name="uq_assistant_stats_hourly_key"),
+    )
+
+
+class StatsWatermarkDB(Base):
+    __tablename__ = "stats_watermarks"
+
+    source = Column(String(64), primary_key=True)
+    last_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class InsufficientCreditsError(Exception):
     """Raised when a user attempts to use more credits than available."""
 
@@ -437,6 +579,9 @@ def init_db():
         logger.info("Initializing database...")
         Base.metadata.create_all(bind=engine)
         logger.info("Database tables created successfully!")
+
+        from migrations import apply_schema_upgrades
+        apply_schema_upgrades(engine)
         
         # Log table info
         from sqlalchemy import inspect
@@ -496,6 +641,7 @@ def log_assistant_history(
     question: str,
     answer: str,
     response_time_ms: Optional[int] = None,
+    stage_timings: Optional[dict] = None,
 ):
     """Persist assistant responses for history tracking."""
     try:
@@ -505,6 +651,7 @@ def log_assistant_history(
             question=question,
             answer=answer,
             response_time_ms=response_time_ms,
+            stage_timings=stage_timings,
         )
         db.add(record)
         db.commit()
@@ -536,9 +683,9 @@ def log_general_task_history(
             task_name=task_name,
             query=query,
             answer=answer,
-            response_payload=response_payload,
             created_at=created_at or datetime.utcnow(),
         )
+        set_general_task_payload(db, record, response_payload)
         db.add(record)
         db.commit()
         db.refresh(record)
@@ -550,6 +697,163 @@ def log_general_task_history(
         raise
 
 
+PAYLOAD_FORMAT_ZLIB = b"\x01"
+
+
+def _snippet_digest(collection: Optional[str], unit_id: Optional[str], snippet: str) -> str:
+    """Content address for a source snippet."""
+    key = "\x00".join([collection or "", unit_id or "", snippet])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _store_snippets(db, snippets: Dict[str, Tuple[Optional[str], Optional[str], str]]) -> None:
+    """Insert snippets that are not yet known; existing digests are left untouched."""
+    if not snippets:
+        return
+    rows = [
+        {"digest": digest, "collection": collection, "unit_id": unit_id, "snippet": snippet}
+        for digest, (collection, unit_id, snippet) in snippets.items()
+    ]
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        existing = {
+            digest
+            for (digest,) in db.query(SourceSnippetDB.digest).filter(SourceSnippetDB.digest.in_(list(snippets)))
+        }
+        for row in rows:
+            if row["digest"] not in existing:
+                db.add(SourceSnippetDB(**row))
+        return
+    while rows:
+        db.execute(insert(SourceSnippetDB).values(rows).on_conflict_do_nothing(index_elements=["digest"]))
+        if dialect != "postgresql":
+            return
+        # Hold the snippets until commit so purge_orphan_snippets skips the ones this payload reuses;
+        # one it deleted in between is missing from the result and inserted again.
+        locked = {
+            digest
+            for (digest,) in db.query(SourceSnippetDB.digest)
+            .filter(SourceSnippetDB.digest.in_([row["digest"] for row in rows]))
+            .with_for_update(read=True, key_share=True)
+        }
+        rows = [row for row in rows if row["digest"] not in locked]
+
+
+def _renamed(source: dict, old: str, new: str, value) -> dict:
+    """Copy ``source`` with key ``old`` replaced by ``new`` at the same position."""
+    return {(new if key == old else key): (value if key == old else item) for key, item in source.items()}
+
+
+def _pack_general_payload(db, payload: dict) -> Tuple[bytes, List[str]]:
+    compact = dict(payload or {})
+    snippets: Dict[str, Tuple[Optional[str], Optional[str], str]] = {}
+    if isinstance(compact.get("sources"), list):
+        sources = []
+        for source in compact["sources"]:
+            snippet = source.get("snippet") if isinstance(source, dict) else None
+            if isinstance(snippet, str) and snippet:
+                digest = _snippet_digest(source.get("collection"), source.get("unit_id"), snippet)
+                snippets[digest] = (source.get("collection"), source.get("unit_id"), snippet)
+                source = _renamed(source, "snippet", "snippet_ref", digest)
+            sources.append(source)
+        compact["sources"] = sources
+
+    _store_snippets(db, snippets)
+    raw = json.dumps(compact, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return PAYLOAD_FORMAT_ZLIB + zlib.compress(raw, 6), list(snippets)
+
+
+def pack_general_payload(db, payload: dict) -> bytes:
+    """
+    Compress a general task payload for storage.
+
+    Non-empty source snippets are moved into the shared source_snippets table
+    and replaced in place by a ``snippet_ref`` digest; everything else,
+    including a missing or empty ``snippet``, is kept as it was. The JSON is
+    zlib-compressed.
+    """
+    return _pack_general_payload(db, payload)[0]
+
+
+def unpack_general_payload(db, blob: bytes) -> dict:
+    """Decompress a stored payload and rehydrate snippets from source_snippets."""
+    if not blob:
+        return {}
+    blob = bytes(blob)
+    if blob[:1] != PAYLOAD_FORMAT_ZLIB:
+        raise ValueError("Unknown general task payload format.")
+    payload = json.loads(zlib.decompress(blob[1:]).decode("utf-8"))
+
+    sources = payload.get("sources")
+    if not isinstance(sources, list):
+        return payload
+    refs = {source["snippet_ref"] for source in sources if isinstance(source, dict) and source.get("snippet_ref")}
+    snippets: Dict[str, str] = {}
+    if refs and db is not None:
+        snippets = dict(
+            db.query(SourceSnippetDB.digest, SourceSnippetDB.snippet).filter(SourceSnippetDB.digest.in_(list(refs)))
+        )
+    payload["sources"] = [
+        _renamed(source, "snippet_ref", "snippet", snippets.get(source["snippet_ref"]))
+        if isinstance(source, dict) and "snippet_ref" in source
+        else source
+        for source in sources
+    ]
+    return payload
+
+
+def set_general_task_payload(db, record: GeneralTaskHistoryDB, payload: dict) -> None:
+    """Store a payload on a record in the compressed format and record which snippets it uses."""
+    record.payload_blob, digests = _pack_general_payload(db, payload)
+    record.response_payload = None
+    if record.id is None:
+        db.add(record)
+        db.flush()
+    else:
+        db.query(GeneralTaskSnippetDB).filter(GeneralTaskSnippetDB.task_id == record.id).delete(
+            synchronize_session=False
+        )
+    if digests:
+        db.execute(insert(GeneralTaskSnippetDB), [{"task_id": record.id, "digest": digest} for digest in digests])
+
+
+def purge_orphan_snippets(db) -> int:
+    """
+    Delete source snippets that no stored general task payload refers to; the caller commits.
+
+    On PostgreSQL the orphans are locked first with SKIP LOCKED, so snippets a
+    concurrent writer is about to link (see ``_store_snippets``) are left for
+    the next run instead of being deleted under it.
+    """
+    unreferenced = ~exists().where(GeneralTaskSnippetDB.digest == SourceSnippetDB.digest)
+    if db.get_bind().dialect.name != "postgresql":
+        return db.query(SourceSnippetDB).filter(unreferenced).delete(synchronize_session=False)
+    digests = [
+        digest
+        for (digest,) in db.query(SourceSnippetDB.digest)
+        .filter(unreferenced)
+        .with_for_update(skip_locked=True)
+    ]
+    if not digests:
+        return 0
+    return (
+        db.query(SourceSnippetDB)
+        .filter(SourceSnippetDB.digest.in_(digests), unreferenced)
+        .delete(synchronize_session=False)
+    )
+
+
+def get_general_task_payload(record: GeneralTaskHistoryDB) -> dict:
+    """Return the full payload for a record regardless of the format it was stored in."""
+    if record.payload_blob is None:
+        return record.response_payload or {}
+    return unpack_general_payload(object_session(record), record.payload_blob)
+
+
 def get_general_task_by_token(db, token: str) -> Optional[GeneralTaskHistoryDB]:
     """Fetch a stored general task record via token."""
     return db.query(GeneralTaskHistoryDB).filter(GeneralTaskHistoryDB.token == token).first()
@@ -564,3 +868,37 @@ def get_general_history_for_user(db, user_id: str, limit: int) -> List[GeneralTa
         .limit(limit)
         .all()
     )
+
+
+def purge_user(db, user_id: str) -> Dict[str, int]:
+    """
+    Delete a user account and everything keyed to it with a fixed number of
+    bulk statements, independent of how much history the user has.
+
+    Rows with a foreign key to ``users`` go through ON DELETE CASCADE in the
+    database; tables that only carry the user id are cleared explicitly.
+    Source snippets no longer referenced by any general task are removed
+    last. Auth logs are kept for auditing and age out via retention.
+    Document analyses are left alone: they are keyed by document content,
+    shared by everyone who uploads the same file, and never tied to a user.
+    """
+    if db.query(UserDB.id).filter(UserDB.id == user_id).scalar() is None:
+        return {}
+
+    try:
+        purged = {
+            "assistant_stats_hourly": db.query(AssistantStatsHourlyDB)
+            .filter(AssistantStatsHourlyDB.user_id == user_id)
+            .delete(synchronize_session=False),
+            "assistant_history_monthly": db.query(AssistantHistoryMonthlyDB)
+            .filter(AssistantHistoryMonthlyDB.user_id == user_id)
+            .delete(synchronize_session=False),
+            "users": db.query(UserDB).filter(UserDB.id == user_id).delete(synchronize_session=False),
+            "source_snippets": purge_orphan_snippets(db),
+        }
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    logger.info("Purged user %s: %s", user_id, purged)
+    return purged
@@ -1,12 +1,11 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
-from fastapi.responses import RedirectResponse, HTMLResponse, FileResponse
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import RedirectResponse, HTMLResponse, FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
 import requests
 import urllib.parse
-from jose import JWTError, jwt
+from jose import jwt
 from datetime import datetime, timedelta
 from typing import Optional
 import json
@@ -16,9 +15,11 @@ import time
 
 from config import settings
 from models import User, Token, GoogleUserInfo, UserCreate, UserInfo, UserInfoCreate, UserInfoUpdate
-from database import get_db, UserDB, UserInfoDB, init_db, test_connection, log_auth_event
+from database import get_db, UserDB, UserInfoDB, init_db, test_connection, log_auth_event, purge_user
+from auth import get_current_user, get_admin_user
 import os
 from api_assistant import router as assistant_router
+from services import metrics
 
 # Configure logging for serverless environment (Vercel)
 # Only log to stdout/stderr since filesystem is read-only except /tmp
@@ -53,9 +54,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Security
-security = HTTPBearer()
-
 # Assistant API routes
 app.include_router(assistant_router, prefix="/api")
 
@@ -85,6 +83,15 @@ async def startup_event():
         logger.error(f"✗ Startup failed: {str(e)}")
         raise
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers"""
+    from services import analysis_batch, analysis_jobs, document_extract
+    await analysis_jobs.shutdown_backend()
+    document_extract.shutdown_pool()
+    analysis_batch.shutdown_executor()
+
 # JWT token functions
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -96,27 +103,6 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            logger.warning("Token verification failed: No email in payload")
-            raise HTTPException(status_code=401, detail="Invalid token")
-        logger.info(f"✓ Token verified for: {email}")
-        return email
-    except JWTError as e:
-        logger.error(f"✗ JWT Error: {str(e)}")
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-def get_current_user(email: str = Depends(verify_token), db: Session = Depends(get_db)) -> User:
-    user = db.query(UserDB).filter(UserDB.email == email).first()
-    if user is None:
-        logger.warning(f"User not found: {email}")
-        raise HTTPException(status_code=404, detail="User not found")
-    logger.info(f"✓ Current user retrieved: {email}")
-    return User.model_validate(user)
-
 # Google OAuth functions
 def get_google_auth_url(state: str = None) -> str:
     params = {
@@ -276,6 +262,11 @@ async def health_check():
             "hint": "Check Azure PostgreSQL firewall settings - see AZURE_VERCEL_CONNECTION_FIX.md"
         }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Per-worker service metrics (embedding batch sizes, ...) in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/login", response_class=HTMLResponse)
 @app.get("/login/", response_class=HTMLResponse)
 async def login_page():
@@ -847,6 +838,26 @@ async def get_auth_logs(current_user: User = Depends(get_current_user), db: Sess
         "total": len(logs)
     }
 
+@app.get("/admin/history/export")
+async def export_all_history(
+    format: str = "ndjson",
+    gzip: bool = False,
+    current_user: User = Depends(get_admin_user),
+):
+    """Stream every user's assistant history (admins listed in ADMIN_EMAILS only)"""
+    from services import history_export
+
+    if format not in history_export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'.")
+
+    logger.info(f"Full history export requested by: {current_user.email}")
+    filename = history_export.export_filename(format, gzip, prefix="history-all")
+    return StreamingResponse(
+        history_export.iter_history_export(None, fmt=format, compress=gzip),
+        media_type=history_export.export_media_type(format, gzip),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 @app.post("/logout")
 async def logout(
     current_user: User = Depends(get_current_user),
@@ -1014,6 +1025,37 @@ async def delete_user_info(
         raise HTTPException(status_code=500, detail=f"Failed to delete user info: {str(e)}")
 
 
+@app.delete("/account")
+async def delete_account(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Permanently delete the authenticated user's account and all associated data"""
+    logger.info(f"Deleting account for: {current_user.email}")
+    
+    try:
+        purged = purge_user(db, current_user.id)
+    except Exception as e:
+        logger.error(f"Error deleting account: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to delete account: {str(e)}")
+    
+    if not purged:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    log_auth_event(
+        db=db,
+        user_id=current_user.id,
+        email=current_user.email,
+        action="account_delete",
+        status="success",
+        ip_address=request.client.host if request.client else None,
+        user_agent=request.headers.get("user-agent"),
+    )
+    logger.info(f"Account deleted successfully for: {current_user.email}")
+    return {"message": "Account deleted successfully"}
+
+
 @app.get("/user-info-list")
 async def list_all_user_info(
     current_user: User = Depends(get_current_user),
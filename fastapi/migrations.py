@@ -0,0 +1,505 @@
+"""
+Idempotent schema upgrades applied after ``Base.metadata.create_all``.
+
+``create_all`` only creates missing tables, so column changes on existing
+tables are listed here as plain PostgreSQL DDL. Every statement must be safe
+to run on each startup. Indexes on the large tables are not built at
+startup: ``upgrade`` builds INDEX_UPGRADES with CREATE INDEX CONCURRENTLY so
+writes carry on while they build.
+
+auth_logs and assistant_history can be converted to monthly range partitions
+(``partition``). Once partitioned, startup keeps the upcoming months created
+and the ``retention`` job rolls old months up into auth_log_monthly /
+assistant_history_monthly before dropping them. A ``<table>_default``
+partition catches rows outside the monthly ranges and retention trims it
+like the monthly ones. A month that already has rows in the default
+partition can only be created by moving them out, which locks the table;
+startup leaves such months alone and the ``retention`` job creates them.
+Unpartitioned tables get the same rollup followed by a batched DELETE.
+Retention also deletes source snippets that no general task refers to.
+
+Maintenance commands:
+    python migrations.py upgrade
+    python migrations.py compact-general-history --batch-size 500
+    python migrations.py partition --table auth_logs
+    python migrations.py retention
+"""
+
+import argparse
+import logging
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_UPGRADES = [
+    # Compressed general task payloads (snippets live in source_snippets)
+    "ALTER TABLE general_task_history ADD COLUMN IF NOT EXISTS payload_blob BYTEA",
+    "ALTER TABLE general_task_history ALTER COLUMN response_payload DROP NOT NULL",
+    # Content-hash cache keys for document analyses
+    "ALTER TABLE document_analyses ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "ALTER TABLE document_analyses ADD COLUMN IF NOT EXISTS source_hash VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_document_analyses_content_hash ON document_analyses (content_hash)",
+    "CREATE INDEX IF NOT EXISTS ix_document_analyses_source_hash ON document_analyses (source_hash)",
+    # Analysed text for reopening follow-up sessions on any worker
+    "ALTER TABLE document_analyses ADD COLUMN IF NOT EXISTS text_blob BYTEA",
+    # Per-stage pipeline timings and token usage
+    "ALTER TABLE assistant_history ADD COLUMN IF NOT EXISTS stage_timings JSON",
+]
+
+# Indexes backing /auth-logs and per-user history ordering: (name, table, columns).
+# Built concurrently by ``python migrations.py upgrade``, never at startup.
+INDEX_UPGRADES: List[Tuple[str, str, str]] = [
+    ("ix_auth_logs_timestamp", "auth_logs", '"timestamp"'),
+    ("ix_assistant_history_user_id_created_at", "assistant_history", "user_id, created_at"),
+]
+
+# table -> partition key, extra constraints re-created on the partitioned parent
+PARTITIONED_TABLES: Dict[str, Dict[str, object]] = {
+    "auth_logs": {
+        "column": "timestamp",
+        "constraints": [],
+    },
+    "assistant_history": {
+        "column": "created_at",
+        "constraints": [
+            "FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE",
+        ],
+    },
+}
+
+_PARTITION_NAME_RE = re.compile(r"_y(\d{4})m(\d{2})$")
+
+
+def apply_schema_upgrades(engine) -> None:
+    """Run the idempotent upgrade statements (PostgreSQL only)."""
+    if engine.dialect.name != "postgresql":
+        logger.info("Skipping schema upgrades for dialect %s", engine.dialect.name)
+        return
+    from config import settings
+
+    with engine.begin() as conn:
+        for statement in SCHEMA_UPGRADES:
+            conn.execute(text(statement))
+        for table in PARTITIONED_TABLES:
+            if is_partitioned(conn, table):
+                ensure_default_partition(conn, table)
+                ensure_monthly_partitions(conn, table, months_ahead=settings.PARTITION_MONTHS_AHEAD)
+    logger.info("Applied %s schema upgrade statements", len(SCHEMA_UPGRADES))
+
+
+def create_indexes(engine) -> int:
+    """
+    Build missing INDEX_UPGRADES with CREATE INDEX CONCURRENTLY (PostgreSQL only).
+
+    Runs in autocommit mode, as concurrent builds cannot run in a transaction.
+    An index left invalid by an interrupted build is dropped and rebuilt.
+    Partitioned tables are skipped: ``partition_table`` creates their indexes.
+    Returns the number of indexes built.
+    """
+    if engine.dialect.name != "postgresql":
+        logger.info("Skipping index upgrades for dialect %s", engine.dialect.name)
+        return 0
+    built = 0
+    with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+        for name, table, columns in INDEX_UPGRADES:
+            if is_partitioned(conn, table):
+                continue
+            valid = conn.execute(
+                text(
+                    "SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                    "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+                ),
+                {"name": name},
+            ).scalar()
+            if valid:
+                continue
+            if valid is not None:
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+            logger.info("Building index %s on %s", name, table)
+            conn.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON "{table}" ({columns})'))
+            built += 1
+    return built
+
+
+# ---------------------------------------------------------------------------
+# Monthly partitions
+# ---------------------------------------------------------------------------
+
+def _month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + (value.month - 1) + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def _relation_exists(conn, name: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:name)"), {"name": f'"{name}"'}).scalar() is not None
+
+
+def ensure_default_partition(conn, table: str) -> None:
+    """Create the DEFAULT partition so rows outside every monthly range are still accepted."""
+    conn.execute(
+        text(f'CREATE TABLE IF NOT EXISTS "{default_partition_name(table)}" PARTITION OF "{table}" DEFAULT')
+    )
+
+
+def is_partitioned(conn, table: str) -> bool:
+    row = conn.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+        ),
+        {"table": table},
+    ).first()
+    return row is not None
+
+
+def list_partitions(conn, table: str) -> List[Tuple[str, datetime]]:
+    """Return (partition name, month start) for the monthly partitions of a table."""
+    rows = conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = :table AND pg_table_is_visible(parent.oid)"
+        ),
+        {"table": table},
+    ).fetchall()
+    partitions = []
+    for (name,) in rows:
+        match = _PARTITION_NAME_RE.search(name)
+        if match:
+            partitions.append((name, datetime(int(match.group(1)), int(match.group(2)), 1)))
+    partitions.sort(key=lambda item: item[1])
+    return partitions
+
+
+def ensure_monthly_partitions(
+    conn,
+    table: str,
+    *,
+    months_ahead: int = 3,
+    start: Optional[datetime] = None,
+    move_default_rows: bool = False,
+) -> int:
+    """
+    Create monthly partitions from ``start`` (default: this month) through ``months_ahead``.
+
+    A month with rows already in the default partition needs the default
+    detached while they move, under an ACCESS EXCLUSIVE lock on the table.
+    That only happens with ``move_default_rows``; otherwise the month is
+    skipped and its rows stay in the default partition. Returns the number
+    of months ensured.
+    """
+    column = PARTITIONED_TABLES[table]["column"]
+    default = default_partition_name(table)
+    has_default = _relation_exists(conn, default)
+    first = _month_start(start or datetime.utcnow())
+    last = _add_months(_month_start(datetime.utcnow()), months_ahead)
+    created = 0
+    month = first
+    while month <= last:
+        upper = _add_months(month, 1)
+        name = partition_name(table, month)
+        create = (
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+        )
+        window = {"start": month, "end": upper}
+        in_default = False
+        if has_default and not _relation_exists(conn, name):
+            in_default = conn.execute(
+                text(f'SELECT 1 FROM "{default}" WHERE "{column}" >= :start AND "{column}" < :end LIMIT 1'), window
+            ).first() is not None
+        if in_default and not move_default_rows:
+            logger.warning("%s rows for %s are in %s; leaving the month to retention", table, f"{month:%Y-%m}", default)
+            month = upper
+            continue
+        if in_default:
+            # The new range may not overlap rows in the default partition, so move them across.
+            conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{default}"'))
+            conn.execute(text(create))
+            conn.execute(
+                text(f'INSERT INTO "{name}" SELECT * FROM "{default}" WHERE "{column}" >= :start AND "{column}" < :end'),
+                window,
+            )
+            conn.execute(text(f'DELETE FROM "{default}" WHERE "{column}" >= :start AND "{column}" < :end'), window)
+            conn.execute(text(f'ALTER TABLE "{table}" ATTACH PARTITION "{default}" DEFAULT'))
+            logger.info("Moved %s rows for %s out of %s", table, f"{month:%Y-%m}", default)
+        else:
+            conn.execute(text(create))
+        created += 1
+        month = upper
+    return created
+
+
+def partition_table(engine, table: str, *, months_ahead: int = 3) -> bool:
+    """
+    Convert an existing table to monthly range partitions in one transaction.
+
+    The table is renamed, a partitioned copy is created with a composite
+    (id, partition key) primary key, rows are copied into their months and the
+    original is dropped. Indexes come from the SQLAlchemy model definitions.
+    Returns False when the table is already partitioned.
+    """
+    from database import Base
+
+    spec = PARTITIONED_TABLES[table]
+    column = spec["column"]
+    legacy = f"{table}_unpartitioned"
+
+    with engine.begin() as conn:
+        if is_partitioned(conn, table):
+            logger.info("%s is already partitioned", table)
+            return False
+
+        conn.execute(text(f'UPDATE "{table}" SET "{column}" = now() WHERE "{column}" IS NULL'))
+        bounds = conn.execute(text(f'SELECT min("{column}") FROM "{table}"')).first()
+        for index in Base.metadata.tables[table].indexes:
+            conn.execute(text(f'ALTER INDEX IF EXISTS "{index.name}" RENAME TO "{index.name}_unpartitioned"'))
+        conn.execute(text(f'ALTER TABLE "{table}" RENAME CONSTRAINT "{table}_pkey" TO "{legacy}_pkey"'))
+        conn.execute(text(f'ALTER TABLE "{table}" RENAME TO "{legacy}"'))
+        conn.execute(
+            text(
+                f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) '
+                f'PARTITION BY RANGE ("{column}")'
+            )
+        )
+        conn.execute(text(f'ALTER TABLE "{table}" ALTER COLUMN "{column}" SET NOT NULL'))
+        conn.execute(text(f'ALTER TABLE "{table}" ADD PRIMARY KEY (id, "{column}")'))
+        for constraint in spec["constraints"]:
+            conn.execute(text(f'ALTER TABLE "{table}" ADD {constraint}'))
+        # The id sequence belongs to the legacy column; move it before the legacy table is dropped.
+        conn.execute(text(f"ALTER SEQUENCE IF EXISTS \"{table}_id_seq\" OWNED BY \"{table}\".id"))
+
+        ensure_monthly_partitions(conn, table, months_ahead=months_ahead, start=bounds[0])
+        ensure_default_partition(conn, table)
+        conn.execute(text(f'INSERT INTO "{table}" SELECT * FROM "{legacy}"'))
+        conn.execute(text(f'DROP TABLE "{legacy}"'))
+        for index in Base.metadata.tables[table].indexes:
+            conn.execute(CreateIndex(index))
+
+    logger.info("Converted %s to monthly partitions", table)
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Retention and rollups
+# ---------------------------------------------------------------------------
+
+def _rollup_auth_logs(conn, source: str, start: Optional[datetime], end: datetime) -> None:
+    conn.execute(
+        text(
+            "INSERT INTO auth_log_monthly (month, action, status, events, distinct_users) "
+            "SELECT date_trunc('month', \"timestamp\"), coalesce(action, ''), coalesce(status, ''), "
+            "count(*), count(DISTINCT user_id) "
+            f'FROM "{source}" WHERE "timestamp" < :end AND (CAST(:start AS timestamp) IS NULL OR "timestamp" >= :start) '
+            "GROUP BY 1, 2, 3 "
+            "ON CONFLICT (month, action, status) DO UPDATE SET "
+            "events = auth_log_monthly.events + EXCLUDED.events, "
+            "distinct_users = GREATEST(auth_log_monthly.distinct_users, EXCLUDED.distinct_users)"
+        ),
+        {"start": start, "end": end},
+    )
+
+
+def _rollup_assistant_history(conn, source: str, start: Optional[datetime], end: datetime) -> None:
+    conn.execute(
+        text(
+            "INSERT INTO assistant_history_monthly "
+            "(month, user_id, task_name, queries, total_response_time_ms, max_response_time_ms) "
+            "SELECT date_trunc('month', created_at), user_id, task_name, count(*), "
+            "coalesce(sum(response_time_ms), 0), max(response_time_ms) "
+            f'FROM "{source}" WHERE created_at < :end AND (CAST(:start AS timestamp) IS NULL OR created_at >= :start) '
+            "GROUP BY 1, 2, 3 "
+            "ON CONFLICT (month, user_id, task_name) DO UPDATE SET "
+            "queries = assistant_history_monthly.queries + EXCLUDED.queries, "
+            "total_response_time_ms = assistant_history_monthly.total_response_time_ms + EXCLUDED.total_response_time_ms, "
+            "max_response_time_ms = GREATEST(assistant_history_monthly.max_response_time_ms, EXCLUDED.max_response_time_ms)"
+        ),
+        {"start": start, "end": end},
+    )
+
+
+_ROLLUPS = {
+    "auth_logs": _rollup_auth_logs,
+    "assistant_history": _rollup_assistant_history,
+}
+
+
+def apply_retention(engine, table: str, keep_months: int, *, batch_size: int = 50000) -> int:
+    """
+    Roll up and remove rows older than ``keep_months`` full months.
+
+    Partitioned tables drop whole monthly partitions (one transaction each)
+    and delete expired rows from the default partition; unpartitioned tables
+    are rolled up once and deleted in batches. Returns the number of
+    partitions dropped or rows deleted.
+    """
+    column = PARTITIONED_TABLES[table]["column"]
+    cutoff = _add_months(_month_start(datetime.utcnow()), -keep_months)
+    rollup = _ROLLUPS[table]
+
+    with engine.begin() as conn:
+        partitioned = is_partitioned(conn, table)
+        partitions = list_partitions(conn, table) if partitioned else []
+
+    if partitioned:
+        dropped = 0
+        for name, month in partitions:
+            if _add_months(month, 1) > cutoff:
+                continue
+            with engine.begin() as conn:
+                rollup(conn, name, None, _add_months(month, 1))
+                conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+                conn.execute(text(f'DROP TABLE "{name}"'))
+            dropped += 1
+            logger.info("Rolled up and dropped partition %s", name)
+        default = default_partition_name(table)
+        with engine.begin() as conn:
+            if _relation_exists(conn, default):
+                rollup(conn, default, None, cutoff)
+                result = conn.execute(text(f'DELETE FROM "{default}" WHERE "{column}" < :end'), {"end": cutoff})
+                logger.info("Deleted %s expired rows from %s", result.rowcount or 0, default)
+        return dropped
+
+    with engine.begin() as conn:
+        oldest = conn.execute(text(f'SELECT min("{column}") FROM "{table}"')).scalar()
+    if oldest is None or oldest >= cutoff:
+        return 0
+
+    deleted = 0
+    month = _month_start(oldest)
+    # Month by month so a rollup and its delete always commit together.
+    while month < cutoff:
+        upper = _add_months(month, 1)
+        with engine.begin() as conn:
+            rollup(conn, table, month, upper)
+            while True:
+                result = conn.execute(
+                    text(
+                        f'DELETE FROM "{table}" WHERE id IN ('
+                        f'SELECT id FROM "{table}" WHERE "{column}" >= :start AND "{column}" < :end LIMIT :limit)'
+                    ),
+                    {"start": month, "end": upper, "limit": batch_size},
+                )
+                deleted += result.rowcount or 0
+                if (result.rowcount or 0) < batch_size:
+                    break
+        month = upper
+    logger.info("Deleted %s expired rows from %s", deleted, table)
+    return deleted
+
+
+def run_retention(engine) -> Dict[str, int]:
+    """Apply the configured retention windows, pre-create upcoming partitions and drop unused snippets."""
+    from config import settings
+
+    windows = {
+        "auth_logs": settings.AUTH_LOG_RETENTION_MONTHS,
+        "assistant_history": settings.ASSISTANT_HISTORY_RETENTION_MONTHS,
+    }
+    summary = {}
+    for table, keep_months in windows.items():
+        summary[table] = apply_retention(engine, table, keep_months)
+        with engine.begin() as conn:
+            if is_partitioned(conn, table):
+                ensure_default_partition(conn, table)
+                ensure_monthly_partitions(
+                    conn, table, months_ahead=settings.PARTITION_MONTHS_AHEAD, move_default_rows=True
+                )
+    summary["source_snippets"] = purge_orphan_source_snippets(engine)
+    return summary
+
+
+def purge_orphan_source_snippets(engine) -> int:
+    """Delete source snippets left behind by deleted or rewritten general task payloads."""
+    from sqlalchemy.orm import Session
+    from database import purge_orphan_snippets
+
+    with Session(engine) as db:
+        removed = purge_orphan_snippets(db)
+        db.commit()
+    logger.info("Deleted %s unreferenced source snippets", removed)
+    return removed
+
+
+def compact_general_history(batch_size: int = 500) -> int:
+    """Move legacy JSON payloads into the compressed format, one batch per transaction."""
+    from database import SessionLocal, GeneralTaskHistoryDB, set_general_task_payload
+
+    converted = 0
+    while True:
+        db = SessionLocal()
+        try:
+            records = (
+                db.query(GeneralTaskHistoryDB)
+                .filter(GeneralTaskHistoryDB.payload_blob.is_(None))
+                .order_by(GeneralTaskHistoryDB.id.asc())
+                .limit(batch_size)
+                .all()
+            )
+            if not records:
+                break
+            for record in records:
+                set_general_task_payload(db, record, record.response_payload or {})
+            db.commit()
+            converted += len(records)
+            logger.info("Compacted %s general task payloads so far", converted)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    return converted
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Advotac database maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("upgrade", help="Create missing tables, apply schema upgrades and build indexes")
+    compact = sub.add_parser("compact-general-history", help="Compress legacy general task payloads")
+    compact.add_argument("--batch-size", type=int, default=500)
+    partition = sub.add_parser("partition", help="Convert a table to monthly range partitions")
+    partition.add_argument("--table", choices=sorted(PARTITIONED_TABLES), action="append")
+    sub.add_parser("retention", help="Roll up and drop data outside the retention windows and unused snippets")
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        from database import engine, init_db
+        init_db()
+        print(f"Built {create_indexes(engine)} indexes")
+    elif args.command == "compact-general-history":
+        total = compact_general_history(batch_size=args.batch_size)
+        print(f"Compacted {total} general task payloads")
+    elif args.command == "partition":
+        from config import settings
+        from database import engine, init_db
+        init_db()
+        for table in args.table or sorted(PARTITIONED_TABLES):
+            converted = partition_table(engine, table, months_ahead=settings.PARTITION_MONTHS_AHEAD)
+            print(f"{table}: {'partitioned' if converted else 'already partitioned'}")
+    elif args.command == "retention":
+        from database import engine
+        for table, count in run_retention(engine).items():
+            print(f"{table}: {count} removed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Batch document analysis streamed back as NDJSON.
+
+All documents of a bundle start together on a dedicated thread pool of
+``ANALYSIS_BATCH_WORKERS`` threads (by default one per document of a full
+bundle), so batches never hold anyio's request threads and cannot starve
+other endpoints. Their PDF pages go to the shared extraction process pool and
+their LLM calls share the process-wide TPM limiter
+(``analysis_llm.llm_limiter``), which is what actually paces them, so a
+bundle takes roughly as long as its slowest document as long as the
+deployment's budget allows. A bundle may carry at most
+``ANALYSIS_BATCH_MAX_BYTES`` of document content in total. One line is
+written per document as soon as it finishes, in completion order, followed by
+a summary line::
+
+    {"index": 3, "id": "brief.pdf", "status": "succeeded", "result": {...}}
+    {"index": 0, "id": null, "status": "failed", "error": "Decoded PDF content is empty."}
+    {"done": true, "documents": 2, "succeeded": 1, "failed": 1, "elapsed_ms": 5321.4}
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from services import analysis_cache
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_BATCH_MAX_DOCUMENTS = int(os.getenv("ANALYSIS_BATCH_MAX_DOCUMENTS", "50"))
+ANALYSIS_BATCH_WORKERS = int(os.getenv("ANALYSIS_BATCH_WORKERS", str(ANALYSIS_BATCH_MAX_DOCUMENTS)))
+ANALYSIS_BATCH_MAX_BYTES = int(os.getenv("ANALYSIS_BATCH_MAX_BYTES", str(32 * 1024 * 1024)))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+@dataclass
+class BatchEntry:
+    """One document of a batch: a validated spec, or the reason it was rejected."""
+
+    index: int
+    id: Optional[str]
+    spec: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, ANALYSIS_BATCH_WORKERS), thread_name_prefix="analysis-batch"
+            )
+        return _executor
+
+
+def shutdown_executor() -> None:
+    """Stop the batch worker threads; called on application shutdown."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _line(payload: Dict[str, Any]) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+async def _analyse(entry: BatchEntry) -> Dict[str, Any]:
+    outcome: Dict[str, Any] = {"index": entry.index, "id": entry.id}
+    if entry.error is not None:
+        return {**outcome, "status": "failed", "error": entry.error}
+    # Carry the request's context (pipeline instrumentation) into the worker thread.
+    call = functools.partial(contextvars.copy_context().run, analysis_cache.analyse_spec, entry.spec)
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(_get_executor(), call)
+    except Exception as exc:
+        logger.exception("Batch document %d failed", entry.index)
+        return {**outcome, "status": "failed", "error": str(exc) or exc.__class__.__name__}
+    return {**outcome, "status": "succeeded", "result": result.model_dump(mode="json")}
+
+
+async def stream_batch(entries: List[BatchEntry]) -> AsyncIterator[str]:
+    """Analyse ``entries`` concurrently and yield one NDJSON line per document as it completes."""
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(_analyse(entry)) for entry in entries]
+    succeeded = 0
+    try:
+        for finished in asyncio.as_completed(tasks):
+            outcome = await finished
+            succeeded += outcome["status"] == "succeeded"
+            yield _line(outcome)
+    finally:
+        # The client went away: cancelling a task also drops its document if no thread has picked it up.
+        for task in tasks:
+            task.cancel()
+    yield _line(
+        {
+            "done": True,
+            "documents": len(entries),
+            "succeeded": succeeded,
+            "failed": len(entries) - succeeded,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+    )
+
+
+__all__ = [
+    "ANALYSIS_BATCH_MAX_BYTES",
+    "ANALYSIS_BATCH_MAX_DOCUMENTS",
+    "ANALYSIS_BATCH_WORKERS",
+    "BatchEntry",
+    "shutdown_executor",
+    "stream_batch",
+]
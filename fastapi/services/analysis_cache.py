@@ -0,0 +1,400 @@
+"""
+Content-hash cache for document analyses.
+
+Results are stored in ``document_analyses`` under two keys, both SHA-256
+digests that also cover instructions, ``max_points``, mode, token budget and
+model:
+
+* ``content_hash`` — over the cleaned text being analysed, so the same
+  document text never reaches the LLM twice;
+* ``source_hash`` — over the raw uploaded file bytes (PDF, DOCX or TXT), so a
+  repeat upload skips extraction as well. A different file whose text matches
+  an existing analysis is recorded in ``document_analysis_sources`` as a
+  reference to that row rather than as a copy of it.
+
+A character budget cuts a file off at the same place every time, and the
+budget is part of both keys, so those results are cached like any other.
+Results whose extraction timed out depend on how far the pool got, so they
+are stored without cache keys and never served from the cache.
+
+A small in-process LRU sits in front of the table. Cache failures are logged
+and never fail the analysis itself. Every result also opens a follow-up
+session (see ``analysis_sessions``) under its token. Stored rows keep the
+analysed text compressed in ``text_blob``, so a cached result is returned
+without a live session and ``ask`` reopens the session on whichever worker
+the question reaches.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from database import SessionLocal, DocumentAnalysisDB, DocumentAnalysisSourceDB
+from services import analysis_llm, analysis_sessions
+from services.analysis_llm import AnalysisResult, ProgressCallback, SectionCallback
+from services.analysis_sessions import AnalysisAnswer
+from services.document_extract import DocumentSource, PdfSource, clean_text
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() in {"1", "true", "yes"}
+ANALYSIS_CACHE_LRU_SIZE = int(os.getenv("ANALYSIS_CACHE_LRU_SIZE", "256"))
+SOURCE_EXCERPT_CHARS = 2000
+ANALYSIS_TASK = "Analysis Docs"
+
+
+class _LRU:
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+_lru = _LRU(ANALYSIS_CACHE_LRU_SIZE)
+
+
+def _params_digest(instructions: Optional[str], max_points: int, mode: str, max_tokens: int):
+    digest = hashlib.sha256()
+    for part in (
+        analysis_llm.analysis_model_name(),
+        mode,
+        str(max_points),
+        str(max_tokens),
+        (instructions or "").strip(),
+    ):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest
+
+
+def content_key(
+    text: str, *, source: str, instructions: Optional[str], max_points: int, mode: str, max_tokens: int
+) -> str:
+    digest = _params_digest(instructions, max_points, mode, max_tokens)
+    digest.update(f"{source}\0".encode("utf-8"))
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def source_key(
+    raw: DocumentSource,
+    *,
+    instructions: Optional[str],
+    max_points: int,
+    mode: str,
+    max_tokens: int,
+    extension: str = "pdf",
+) -> str:
+    digest = _params_digest(instructions, max_points, mode, max_tokens)
+    digest.update(f"raw-{extension}\0".encode("utf-8"))
+    digest.update(raw)
+    return digest.hexdigest()
+
+
+def _lru_key(column: str, key: str) -> str:
+    return f"{column}:{key}"
+
+
+def _load(column: str, key: str) -> Optional[AnalysisResult]:
+    cached = _lru.get(_lru_key(column, key))
+    if cached is None:
+        db = SessionLocal()
+        try:
+            row = (
+                db.query(DocumentAnalysisDB.result)
+                .filter(getattr(DocumentAnalysisDB, column) == key)
+                .order_by(DocumentAnalysisDB.id.desc())
+                .first()
+            )
+            if row is None and column == "source_hash":
+                row = (
+                    db.query(DocumentAnalysisDB.result)
+                    .join(DocumentAnalysisSourceDB, DocumentAnalysisSourceDB.analysis_id == DocumentAnalysisDB.id)
+                    .filter(DocumentAnalysisSourceDB.source_hash == key)
+                    .first()
+                )
+        finally:
+            db.close()
+        if row is None:
+            return None
+        cached = row.result
+        _lru.put(_lru_key(column, key), cached)
+    result = AnalysisResult.model_validate_json(cached)
+    result.cached = True
+    return result
+
+
+def lookup(column: str, key: str) -> Optional[AnalysisResult]:
+    """Return a cached analysis by ``content_hash`` or ``source_hash``, if any."""
+    if not ANALYSIS_CACHE_ENABLED:
+        return None
+    try:
+        return _load(column, key)
+    except Exception:
+        logger.exception("Analysis cache lookup failed")
+        return None
+
+
+def store(
+    result: AnalysisResult,
+    *,
+    text: str,
+    content_hash: str,
+    source_hash: Optional[str] = None,
+    instructions: Optional[str] = None,
+    user_email: Optional[str] = None,
+) -> AnalysisResult:
+    """
+    Persist a fresh analysis, assigning its token. Degraded results are
+    returned unstored; ones cut short by an extraction timeout are stored
+    without cache keys, since the next attempt may read further.
+    """
+    if not ANALYSIS_CACHE_ENABLED or result._degraded:
+        return result
+    if result.extraction is not None and not result.extraction.deterministic:
+        content_hash, source_hash = None, None
+    result.token = uuid.uuid4().hex
+    payload = result.model_dump_json()
+    db = SessionLocal()
+    try:
+        db.add(
+            DocumentAnalysisDB(
+                token=result.token,
+                user_email=user_email,
+                task=ANALYSIS_TASK,
+                prompt=instructions,
+                source_excerpt=text[:SOURCE_EXCERPT_CHARS],
+                result=payload,
+                model=analysis_llm.analysis_model_name(),
+                content_hash=content_hash,
+                source_hash=source_hash,
+                text_blob=zlib.compress(text.encode("utf-8"), 6),
+            )
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to store analysis %s", result.token)
+        result.token = None
+        return result
+    finally:
+        db.close()
+    if content_hash:
+        _lru.put(_lru_key("content_hash", content_hash), payload)
+    if source_hash:
+        _lru.put(_lru_key("source_hash", source_hash), payload)
+    return result
+
+
+def _remember_source(content_hash: str, source_hash: str) -> None:
+    """Point another upload of already analysed text at that analysis so its raw bytes hit next time."""
+    db = SessionLocal()
+    try:
+        analysis_id = (
+            db.query(DocumentAnalysisDB.id)
+            .filter(DocumentAnalysisDB.content_hash == content_hash)
+            .order_by(DocumentAnalysisDB.id.desc())
+            .limit(1)
+            .scalar()
+        )
+        if analysis_id is None:
+            return
+        db.merge(DocumentAnalysisSourceDB(source_hash=source_hash, analysis_id=analysis_id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to record source hash for cached analysis")
+        return
+    finally:
+        db.close()
+    payload = _lru.get(_lru_key("content_hash", content_hash))
+    if payload is not None:
+        _lru.put(_lru_key("source_hash", source_hash), payload)
+
+
+def restore_session(token: str) -> bool:
+    """Reopen the follow-up session for ``token`` from its stored text; False if there is none."""
+    if not token:
+        return False
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(DocumentAnalysisDB.text_blob)
+            .filter(DocumentAnalysisDB.token == token, DocumentAnalysisDB.text_blob.isnot(None))
+            .first()
+        )
+    except Exception:
+        logger.exception("Failed to load analysis %s for a follow-up question", token)
+        return False
+    finally:
+        db.close()
+    if row is None:
+        return False
+    analysis_sessions.reopen_session(token, zlib.decompress(row.text_blob).decode("utf-8"))
+    return True
+
+
+def ask(token: str, question: str, *, top_k: int = analysis_sessions.ANALYSIS_ASK_TOP_K) -> Optional[AnalysisAnswer]:
+    """``analysis_sessions.ask``, reopening the session from the database when this worker has none."""
+    answer = analysis_sessions.ask(token, question, top_k=top_k)
+    if answer is None and restore_session(token):
+        answer = analysis_sessions.ask(token, question, top_k=top_k)
+    return answer
+
+
+def analyse_text(
+    text: str,
+    *,
+    max_tokens: int = analysis_llm.MAX_INPUT_TOKENS,
+    max_points: int = 5,
+    source: str = "text",
+    mode: str = "auto",
+    user_email: Optional[str] = None,
+    progress: Optional[ProgressCallback] = None,
+    on_section: Optional[SectionCallback] = None,
+) -> AnalysisResult:
+    """Cached wrapper around ``analysis_llm.analyse_text``."""
+    normalized = clean_text(text)
+    key = content_key(
+        normalized, source=source, instructions=None, max_points=max_points, mode=mode, max_tokens=max_tokens
+    )
+    cached = lookup("content_hash", key)
+    if cached is not None:
+        return analysis_sessions.open_session(cached, normalized)
+    result = analysis_llm.analyse_text(
+        normalized,
+        max_tokens=max_tokens,
+        max_points=max_points,
+        source=source,
+        mode=mode,
+        progress=progress,
+        normalized=True,
+        on_section=on_section,
+    )
+    result = store(result, text=normalized, content_hash=key, user_email=user_email)
+    return analysis_sessions.open_session(result, normalized)
+
+
+def analyse_document(
+    data: DocumentSource,
+    *,
+    extension: str,
+    instructions: Optional[str] = None,
+    max_tokens: int = analysis_llm.MAX_INPUT_TOKENS,
+    max_points: int = 5,
+    mode: str = "auto",
+    path: Optional[str] = None,
+    user_email: Optional[str] = None,
+    progress: Optional[ProgressCallback] = None,
+    on_section: Optional[SectionCallback] = None,
+) -> AnalysisResult:
+    """Cached wrapper around document analysis: raw-bytes hit skips extraction, text hit skips the LLM."""
+    params = dict(instructions=instructions, max_points=max_points, mode=mode, max_tokens=max_tokens)
+    raw_key = source_key(data, extension=extension, **params) if ANALYSIS_CACHE_ENABLED else None
+    raw_cached = lookup("source_hash", raw_key) if raw_key else None
+    # A raw-bytes hit skips extraction; its session is reopened from the stored text on the first question.
+    if raw_cached is not None:
+        return raw_cached
+
+    if progress is not None:
+        progress("extracting", 0.0)
+    extracted = analysis_llm.extract_for_analysis(
+        data, extension=extension, max_tokens=max_tokens, mode=mode, path=path
+    )
+    key = content_key(extracted.text, source=extension, **params)
+    cached = lookup("content_hash", key)
+    if cached is not None:
+        # A timed-out extraction says nothing about the rest of the file, so its raw bytes are not mapped.
+        if raw_key and extracted.stats.deterministic:
+            _remember_source(key, raw_key)
+        return analysis_sessions.open_session(cached, extracted.text)
+
+    result = analysis_llm.analyse_extracted(
+        extracted,
+        source=extension,
+        instructions=instructions,
+        max_tokens=max_tokens,
+        max_points=max_points,
+        mode=mode,
+        progress=progress,
+        on_section=on_section,
+    )
+    result = store(
+        result,
+        text=extracted.text,
+        content_hash=key,
+        source_hash=raw_key,
+        instructions=instructions,
+        user_email=user_email,
+    )
+    return analysis_sessions.open_session(result, extracted.text)
+
+
+def analyse_pdf(pdf_bytes: PdfSource, **kwargs) -> AnalysisResult:
+    """Cached PDF analysis; see ``analyse_document``."""
+    return analyse_document(pdf_bytes, extension="pdf", **kwargs)
+
+
+def analyse_spec(
+    spec: Dict[str, Any],
+    *,
+    progress: Optional[ProgressCallback] = None,
+    on_section: Optional[SectionCallback] = None,
+) -> AnalysisResult:
+    """Run a validated request spec (``text`` or ``pdf`` plus options) through the cached analysis."""
+    callbacks = dict(progress=progress, on_section=on_section)
+    if spec.get("pdf") is not None:
+        return analyse_pdf(
+            spec["pdf"],
+            instructions=spec.get("instructions"),
+            max_points=spec["max_points"],
+            mode=spec["mode"],
+            **callbacks,
+        )
+    return analyse_text(spec["text"], max_points=spec["max_points"], mode=spec["mode"], **callbacks)
+
+
+def clear_memory_cache() -> None:
+    _lru.clear()
+
+
+__all__ = [
+    "analyse_document",
+    "analyse_pdf",
+    "analyse_spec",
+    "analyse_text",
+    "ask",
+    "clear_memory_cache",
+    "content_key",
+    "lookup",
+    "restore_session",
+    "source_key",
+    "store",
+]
@@ -0,0 +1,338 @@
+"""
+Asynchronous document analysis jobs.
+
+``POST /analysis/jobs`` hands the work to a backend and returns a token right
+away; ``GET /analysis/jobs/{token}`` reports status, stage, progress and, once
+finished, the AnalysisResult. Two backends are available:
+
+* ``local`` (default) — an asyncio worker pool inside the API process. Each
+  worker runs one job at a time in the thread pool; state lives in memory.
+  At most ``ANALYSIS_JOB_QUEUE_MAX`` jobs wait; more are refused with
+  JobQueueFullError. Serverless functions (``VERCEL=1``) are frozen between
+  requests, so there the Celery backend is used when a broker is configured
+  and job submission fails otherwise.
+* ``celery`` — jobs are sent to Celery workers and state is kept in Redis so
+  any API instance can answer a poll. Start workers with
+  ``celery -A services.analysis_jobs.celery_app worker``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from services import analysis_cache
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_JOB_BACKEND = os.getenv("ANALYSIS_JOB_BACKEND", "local").lower()
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "4"))
+ANALYSIS_JOB_QUEUE_MAX = int(os.getenv("ANALYSIS_JOB_QUEUE_MAX", "100"))
+ANALYSIS_JOB_TTL_SECONDS = int(os.getenv("ANALYSIS_JOB_TTL_SECONDS", str(24 * 3600)))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", REDIS_URL)
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", REDIS_URL)
+SERVERLESS = os.getenv("VERCEL") == "1"
+BROKER_CONFIGURED = bool(os.getenv("CELERY_BROKER_URL") or os.getenv("REDIS_URL"))
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+# Share of overall progress covered by each stage: (start, end).
+_STAGE_SPAN = {
+    "queued": (0.0, 0.0),
+    "extracting": (0.02, 0.15),
+    "analysing": (0.15, 0.9),
+    "reducing": (0.9, 0.98),
+}
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised when the local backend already has ANALYSIS_JOB_QUEUE_MAX jobs waiting."""
+
+
+def _stage_progress(stage: str, fraction: float) -> float:
+    start, end = _STAGE_SPAN.get(stage, (0.0, 0.0))
+    return round(start + (end - start) * max(0.0, min(1.0, fraction)), 3)
+
+
+# ---------------------------------------------------------------------------
+# Job state stores
+# ---------------------------------------------------------------------------
+
+class MemoryJobStore:
+    """Job state for the local backend; entries expire after ANALYSIS_JOB_TTL_SECONDS."""
+
+    def __init__(self, ttl_seconds: int = ANALYSIS_JOB_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        for token in [token for token, job in self._jobs.items() if job["updated_at"] < cutoff]:
+            del self._jobs[token]
+
+    def create(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._prune()
+            self._jobs[job["token"]] = dict(job)
+
+    def update(self, token: str, **fields: Any) -> None:
+        with self._lock:
+            job = self._jobs.get(token)
+            if job is not None:
+                job.update(fields, updated_at=time.time())
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(token)
+            return dict(job) if job is not None else None
+
+
+class RedisJobStore:
+    """Job state in a Redis hash per job, shared by API instances and Celery workers."""
+
+    KEY_PREFIX = "analysis_job:"
+
+    def __init__(self, client, ttl_seconds: int = ANALYSIS_JOB_TTL_SECONDS):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+
+    def _key(self, token: str) -> str:
+        return f"{self.KEY_PREFIX}{token}"
+
+    def create(self, job: Dict[str, Any]) -> None:
+        key = self._key(job["token"])
+        pipe = self.client.pipeline()
+        pipe.hset(key, mapping={name: json.dumps(value) for name, value in job.items()})
+        pipe.expire(key, self.ttl_seconds)
+        pipe.execute()
+
+    def update(self, token: str, **fields: Any) -> None:
+        fields["updated_at"] = time.time()
+        key = self._key(token)
+        pipe = self.client.pipeline()
+        pipe.hset(key, mapping={name: json.dumps(value) for name, value in fields.items()})
+        pipe.expire(key, self.ttl_seconds)
+        pipe.execute()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.hgetall(self._key(token))
+        if not raw:
+            return None
+        return {
+            (name.decode() if isinstance(name, bytes) else name): json.loads(value)
+            for name, value in raw.items()
+        }
+
+
+# ---------------------------------------------------------------------------
+# Job execution (shared by both backends)
+# ---------------------------------------------------------------------------
+
+def _new_job(token: str) -> Dict[str, Any]:
+    now = time.time()
+    return {
+        "token": token,
+        "status": "queued",
+        "stage": "queued",
+        "progress": 0.0,
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def run_job(store, token: str, spec: Dict[str, Any]) -> None:
+    """Run one analysis job synchronously, recording progress and the outcome in ``store``."""
+    store.update(token, status="running", stage="extracting" if spec.get("pdf") else "analysing")
+
+    def progress(stage: str, fraction: float) -> None:
+        store.update(token, stage=stage, progress=_stage_progress(stage, fraction))
+
+    try:
+        result = analysis_cache.analyse_spec(spec, progress=progress)
+    except Exception as exc:
+        logger.exception("Analysis job %s failed", token)
+        store.update(token, status="failed", stage="failed", error=str(exc) or exc.__class__.__name__)
+        return
+    store.update(
+        token,
+        status="succeeded",
+        stage="done",
+        progress=1.0,
+        result=json.loads(result.model_dump_json()),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+class LocalJobBackend:
+    """In-process asyncio worker pool; jobs are lost if the process restarts."""
+
+    name = "local"
+
+    def __init__(
+        self,
+        workers: int = ANALYSIS_JOB_WORKERS,
+        store: Optional[MemoryJobStore] = None,
+        max_queued: int = ANALYSIS_JOB_QUEUE_MAX,
+    ):
+        self.workers = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self.store = store or MemoryJobStore()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_workers(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (tests): start a fresh pool bound to it.
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+            self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self) -> None:
+        while True:
+            token, spec = await self._queue.get()
+            try:
+                await run_in_threadpool(run_job, self.store, token, spec)
+            finally:
+                self._queue.task_done()
+
+    async def submit(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        self._ensure_workers()
+        if self._queue.full():
+            raise JobQueueFullError(f"{self.max_queued} analysis jobs are already waiting.")
+        job = _new_job(uuid.uuid4().hex)
+        self.store.create(job)
+        self._queue.put_nowait((job["token"], spec))
+        return job
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(token)
+
+    async def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._loop = None
+
+
+try:
+    from celery import Celery
+except ImportError:  # celery is optional for the local backend
+    Celery = None
+
+celery_app = (
+    Celery("analysis_jobs", broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND) if Celery is not None else None
+)
+
+
+def _redis_store() -> RedisJobStore:
+    import redis
+
+    return RedisJobStore(redis.Redis.from_url(REDIS_URL))
+
+
+if celery_app is not None:
+
+    @celery_app.task(name="analysis_jobs.run")
+    def run_analysis_task(token: str, spec: Dict[str, Any]) -> None:
+        if spec.get("pdf_base64"):
+            spec["pdf"] = base64.b64decode(spec.pop("pdf_base64"))
+        # Always Redis: the API polls it, whatever ANALYSIS_JOB_BACKEND says in the worker's environment.
+        run_job(_redis_store(), token, spec)
+
+
+class CeleryJobBackend:
+    """Jobs run on Celery workers; state is shared through Redis."""
+
+    name = "celery"
+
+    def __init__(self, store: Optional[RedisJobStore] = None):
+        if celery_app is None:
+            raise RuntimeError("ANALYSIS_JOB_BACKEND=celery requires the celery package.")
+        self.store = store or _redis_store()
+
+    async def submit(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        job = _new_job(uuid.uuid4().hex)
+        payload = dict(spec)
+        if payload.get("pdf") is not None:
+            payload["pdf_base64"] = base64.b64encode(payload.pop("pdf")).decode("ascii")
+        await run_in_threadpool(self.store.create, job)
+        await run_in_threadpool(run_analysis_task.apply_async, args=[job["token"], payload])
+        return job
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(token)
+
+    async def shutdown(self) -> None:
+        return None
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _configured_backend():
+    if ANALYSIS_JOB_BACKEND == "celery":
+        return CeleryJobBackend()
+    if SERVERLESS:
+        if BROKER_CONFIGURED:
+            return CeleryJobBackend()
+        raise RuntimeError(
+            "The local analysis job backend cannot run on Vercel; "
+            "set ANALYSIS_JOB_BACKEND=celery and CELERY_BROKER_URL or REDIS_URL."
+        )
+    return LocalJobBackend()
+
+
+def get_backend():
+    """Return the configured job backend, creating it on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _configured_backend()
+        return _backend
+
+
+def set_backend(backend) -> None:
+    """Swap the backend (tests, or wiring a custom store)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+async def shutdown_backend() -> None:
+    """Stop the backend's workers if one was started."""
+    if _backend is not None:
+        await _backend.shutdown()
+
+
+__all__ = [
+    "CeleryJobBackend",
+    "JOB_STATUSES",
+    "JobQueueFullError",
+    "LocalJobBackend",
+    "MemoryJobStore",
+    "RedisJobStore",
+    "celery_app",
+    "get_backend",
+    "run_job",
+    "set_backend",
+    "shutdown_backend",
+]
@@ -7,16 +7,27 @@ document analysis workflow so the FastAPI layer can stay thin.
 
 from __future__ import annotations
 
-import io
 import json
 import os
 import re
 import textwrap
-from typing import List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from openai import AzureOpenAI
-from pydantic import BaseModel
-from PyPDF2 import PdfReader
+from pydantic import BaseModel, PrivateAttr
+
+from services.document_extract import (
+    DocumentSource,
+    ExtractedText,
+    ExtractionStats,
+    PdfSource,
+    clean_text as _clean_text,
+    extract_document,
+    extract_pdf,
+)
+from services.json_stream import JsonObjectStream
+from services.rate_limit import TokenRateLimiter
 
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
@@ -27,6 +38,24 @@ MAX_INPUT_TOKENS = 6000
 MAX_OUTPUT_TOKENS = 1500
 AVG_CHARS_PER_TOKEN = 4  # heuristic used to keep inputs within Azure limits
 
+# Documents longer than one MAX_INPUT_TOKENS window are split into chunks that are
+# analysed concurrently (map) and then merged into one result (reduce).
+MAP_REDUCE_ENABLED = os.getenv("ANALYSIS_MAP_REDUCE", "true").lower() in {"1", "true", "yes"}
+MAP_REDUCE_MAX_CHUNKS = int(os.getenv("ANALYSIS_MAP_REDUCE_MAX_CHUNKS", "8"))
+MAP_REDUCE_CONCURRENCY = int(os.getenv("ANALYSIS_MAP_REDUCE_CONCURRENCY", "8"))
+ANALYSIS_MODES = ("auto", "single", "map_reduce")
+# Members of the model's JSON object, in the order the prompt asks for them.
+ANALYSIS_SECTIONS = ("summary", "analysis", "key_points", "keywords", "comparisons", "table_markdown")
+
+Partial = Tuple[str, str, List[str], List[str], List[str], Optional[str]]
+# progress(stage, fraction) with stage in "extracting", "analysing", "reducing"
+ProgressCallback = Callable[[str, float], None]
+# on_section(name, value) with name in ANALYSIS_SECTIONS, called as a streamed completion produces it
+SectionCallback = Callable[[str, Any], None]
+
+_SECTION_HEADING = re.compile(r"^(?:(?:PART|CHAPTER|SECTION|SCHEDULE|ARTICLE)\b|[A-Z][A-Z0-9 ,.'()&:-]{3,80}$)")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?;])\s+")
+
 
 class AnalysisResult(BaseModel):
     """Structured output returned to the API layer."""
@@ -40,6 +69,13 @@ class AnalysisResult(BaseModel):
     table_markdown: Optional[str] = None
     truncated: bool
     input_characters: int
+    extraction: Optional[ExtractionStats] = None
+    token: Optional[str] = None
+    cached: bool = False
+
+    # True when a configured LLM call failed and the extractive fallback was used;
+    # such results are not cached.
+    _degraded: bool = PrivateAttr(default=False)
 
 
 def _approximate_token_count(text: str) -> int:
@@ -57,18 +93,6 @@ def _truncate_to_token_limit(text: str, max_tokens: int) -> Tuple[str, bool]:
     return text[:char_limit], True
 
 
-def _clean_text(text: str) -> str:
-    """Normalize whitespace and strip non-printable characters before analysis."""
-    if not text:
-        return ""
-    sanitized = text.replace("\u00a0", " ")
-    sanitized = "".join(ch for ch in sanitized if ch.isprintable() or ch in "\n\r\t")
-    sanitized = re.sub(r"[ \t]+", " ", sanitized)
-    sanitized = re.sub(r"\r\n?", "\n", sanitized)
-    sanitized = re.sub(r"\n{3,}", "\n\n", sanitized)
-    return sanitized.strip()
-
-
 def _init_llm() -> Optional[AzureOpenAI]:
     """Create a reusable Azure OpenAI client if credentials are available."""
     if not AZURE_OPENAI_API_KEY or not AZURE_OPENAI_ENDPOINT:
@@ -85,33 +109,20 @@ def _init_llm() -> Optional[AzureOpenAI]:
 
 
 _llm_client = _init_llm()
+# Shared by every chat call in the process so concurrent analyses stay within the deployment's TPM.
+llm_limiter = TokenRateLimiter()
 
 
-def extract_text_from_pdf(pdf_bytes: bytes) -> str:
+def extract_text_from_pdf(pdf_bytes: bytes, max_tokens: Optional[int] = None) -> str:
     """
-    Extract raw text from a PDF byte stream.
+    Extract cleaned text from a PDF byte stream.
 
-    PyPDF2 handles text-only PDFs well enough for the initial release. We keep
-    the implementation defensive so malformed files do not crash the API.
+    Pages are parsed in the extraction process pool and reading stops once
+    ``max_tokens`` worth of characters is available. Malformed files yield an
+    empty string so they do not crash the API.
     """
-    if not pdf_bytes:
-        return ""
-
-    try:
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-    except Exception:
-        return ""
-
-    pieces: List[str] = []
-    for page in reader.pages:
-        try:
-            content = page.extract_text() or ""
-        except Exception:
-            content = ""
-        if content:
-            pieces.append(content.strip())
-    combined = "\n\n".join(pieces).strip()
-    return _clean_text(combined)
+    max_chars = max_tokens * AVG_CHARS_PER_TOKEN if max_tokens else None
+    return extract_pdf(pdf_bytes, max_chars=max_chars).text
 
 
 def _basic_summary(text: str, max_points: int) -> Tuple[str, str, List[str], List[str], List[str], Optional[str]]:
@@ -146,14 +157,8 @@ def _basic_summary(text: str, max_points: int) -> Tuple[str, str, List[str], Lis
     return summary.strip(), analysis.strip(), key_points, keywords, comparisons, table
 
 
-def _call_llm(text: str, max_points: int) -> Optional[Tuple[str, List[str]]]:
-    """Send the analysis prompt to Azure OpenAI when credentials are configured."""
-    if not _llm_client:
-        return None
-
-    prompt = (
-        "You are an India law assistant. Analyse the provided legal text and respond ONLY with JSON. "
-        "Focus on Indian statutes, case law, or legal principles when relevant. "
+def _output_spec(max_points: int) -> str:
+    return (
         "Return an object with the following keys:\n"
         "- summary: 2 concise paragraphs (>= 4 sentences total) capturing the matter.\n"
         "- analysis: detailed multi-paragraph passage (~180-250 words) explaining legal significance, statutory hooks, and implications.\n"
@@ -164,26 +169,64 @@ def _call_llm(text: str, max_points: int) -> Optional[Tuple[str, List[str]]]:
         "Ensure the JSON is valid, with strings trimmed; do not include code fences or additional commentary."
     )
 
-    try:
-        response = _llm_client.chat.completions.create(
-            model=AZURE_OPENAI_CHAT_DEPLOYMENT_NAME,
-            temperature=0.2,
-            max_tokens=MAX_OUTPUT_TOKENS,
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": text},
-            ],
-        )
-    except Exception:
-        return None
 
-    try:
-        content = response.choices[0].message.content if response.choices else ""
-    except (AttributeError, IndexError):
-        content = ""
-    if not content:
-        return None
+def _analysis_prompt(max_points: int) -> str:
+    return (
+        "You are an India law assistant. Analyse the provided legal text and respond ONLY with JSON. "
+        "Focus on Indian statutes, case law, or legal principles when relevant. "
+        + _output_spec(max_points)
+    )
 
+
+def _reduce_prompt(max_points: int, instructions: str = "") -> str:
+    return (
+        "You are an India law assistant. You are given JSON analyses of consecutive parts of ONE legal document. "
+        "Combine them into a single analysis of the whole document and respond ONLY with JSON. "
+        "Keep the narrative in document order, drop repetition between parts and keep the most significant points. "
+        + (f"Follow the user's instructions for the analysis:\n{instructions}\n" if instructions else "")
+        + _output_spec(max_points)
+    )
+
+
+def _with_instructions(text: str, instructions: str) -> str:
+    return f"User instructions:\n{instructions}\n\nDocument:\n{text}" if instructions else text
+
+
+def _report(progress: Optional[ProgressCallback], stage: str, fraction: float) -> None:
+    if progress is not None:
+        try:
+            progress(stage, fraction)
+        except Exception:
+            # Progress reporting must never break the analysis itself.
+            pass
+
+
+def _notify(on_section: Optional[SectionCallback], name: str, value: Any) -> None:
+    if on_section is not None:
+        try:
+            on_section(name, value)
+        except Exception:
+            # Neither may a consumer of streamed sections.
+            pass
+
+
+def _normalize_section(name: str, value: Any, max_points: int) -> Any:
+    """Trim one member of the model's JSON object into the shape AnalysisResult expects."""
+    if name in ("summary", "analysis"):
+        return str(value).strip() if value is not None else ""
+    if name == "table_markdown":
+        return (value.strip() or None) if isinstance(value, str) else None
+    if not isinstance(value, list):
+        return []
+    items = [item.strip() for item in value if isinstance(item, str) and item.strip()]
+    if name == "key_points":
+        return items[:max_points]
+    if name == "comparisons":
+        return items[:3]
+    return items
+
+
+def _parse_payload(content: str) -> Optional[Dict[str, Any]]:
     content = content.strip()
     try:
         payload = json.loads(content)
@@ -195,34 +238,236 @@ def _call_llm(text: str, max_points: int) -> Optional[Tuple[str, List[str]]]:
             payload = json.loads(cleaned)
         except json.JSONDecodeError:
             return None
+    return payload if isinstance(payload, dict) else None
 
-    summary = str(payload.get("summary", "")).strip()
-    analysis = str(payload.get("analysis", "")).strip()
-    raw_points = payload.get("key_points") or []
-    raw_keywords = payload.get("keywords") or []
-    raw_comparisons = payload.get("comparisons") or []
-    table_markdown = payload.get("table_markdown")
-    points: List[str] = []
-    if isinstance(raw_points, list):
-        for item in raw_points[:max_points]:
-            if isinstance(item, str) and item.strip():
-                points.append(item.strip())
-    keywords: List[str] = []
-    if isinstance(raw_keywords, list):
-        for item in raw_keywords:
-            if isinstance(item, str) and item.strip():
-                keywords.append(item.strip())
-    comparisons: List[str] = []
-    if isinstance(raw_comparisons, list):
-        for item in raw_comparisons[:3]:
-            if isinstance(item, str) and item.strip():
-                comparisons.append(item.strip())
-    if isinstance(table_markdown, str):
-        table_markdown = table_markdown.strip() or None
-    else:
-        table_markdown = None
 
-    return summary, analysis, points, keywords, comparisons, table_markdown
+def _stream_completion(messages: List[Dict[str, str]], max_points: int, on_section: SectionCallback) -> str:
+    """Stream the completion, reporting each top-level section as soon as its value is complete."""
+    stream = _llm_client.chat.completions.create(
+        model=AZURE_OPENAI_CHAT_DEPLOYMENT_NAME,
+        temperature=0.2,
+        max_tokens=MAX_OUTPUT_TOKENS,
+        messages=messages,
+        stream=True,
+    )
+    parser = JsonObjectStream()
+    parts: List[str] = []
+    for chunk in stream:
+        # Azure sends content-filter results in chunks without choices.
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if not delta:
+            continue
+        parts.append(delta)
+        for name, value in parser.feed(delta):
+            if name in ANALYSIS_SECTIONS:
+                _notify(on_section, name, _normalize_section(name, value, max_points))
+    return "".join(parts)
+
+
+def _call_llm(
+    text: str,
+    max_points: int,
+    prompt: Optional[str] = None,
+    on_section: Optional[SectionCallback] = None,
+) -> Optional[Partial]:
+    """
+    Send the analysis prompt to Azure OpenAI when credentials are configured.
+
+    With ``on_section`` the completion is streamed and each section is reported
+    as soon as it is complete; the return value is the same either way.
+    """
+    if not _llm_client:
+        return None
+
+    prompt = prompt or _analysis_prompt(max_points)
+    messages = [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": text},
+    ]
+
+    try:
+        with llm_limiter.acquire(_approximate_token_count(prompt + text) + MAX_OUTPUT_TOKENS):
+            if on_section is not None:
+                content = _stream_completion(messages, max_points, on_section)
+            else:
+                response = _llm_client.chat.completions.create(
+                    model=AZURE_OPENAI_CHAT_DEPLOYMENT_NAME,
+                    temperature=0.2,
+                    max_tokens=MAX_OUTPUT_TOKENS,
+                    messages=messages,
+                )
+                try:
+                    content = response.choices[0].message.content if response.choices else ""
+                except (AttributeError, IndexError):
+                    content = ""
+    except Exception:
+        return None
+
+    if not content:
+        return None
+    payload = _parse_payload(content)
+    if payload is None:
+        return None
+    return tuple(_normalize_section(name, payload.get(name), max_points) for name in ANALYSIS_SECTIONS)
+
+
+def _split_long_block(block: str, chunk_chars: int) -> List[str]:
+    """Break an oversized paragraph on sentence boundaries, hard-splitting run-on sentences."""
+    pieces: List[str] = []
+    current = ""
+    for sentence in _SENTENCE_BREAK.split(block):
+        while len(sentence) > chunk_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:chunk_chars])
+            sentence = sentence[chunk_chars:]
+        if current and len(current) + 1 + len(sentence) > chunk_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _split_into_chunks(text: str, chunk_chars: int) -> List[str]:
+    """
+    Pack paragraphs into chunks of at most ``chunk_chars`` characters.
+
+    A section heading starts a new chunk once the current one is at least half
+    full, so parts of the document line up with its own structure where possible.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        blocks = [paragraph] if len(paragraph) <= chunk_chars else _split_long_block(paragraph, chunk_chars)
+        for block in blocks:
+            starts_section = bool(_SECTION_HEADING.match(block.split("\n", 1)[0]))
+            if current and (size + 2 + len(block) > chunk_chars or (starts_section and size >= chunk_chars // 2)):
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(block)
+            size += len(block) + (2 if size else 0)
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _analyse_chunk(chunk: str, index: int, total: int, max_points: int, instructions: str = "") -> Tuple[Partial, bool]:
+    """Returns the partial and whether it is a fallback for a failed LLM call."""
+    llm_result = _call_llm(_with_instructions(f"[Part {index + 1} of {total}]\n{chunk}", instructions), max_points)
+    if llm_result:
+        return llm_result, False
+    return _basic_summary(chunk, max_points), _llm_client is not None
+
+
+def _dedupe(items: List[str], limit: int) -> List[str]:
+    seen = set()
+    result: List[str] = []
+    for item in items:
+        key = item.strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            result.append(item.strip())
+        if len(result) >= limit:
+            break
+    return result
+
+
+def _interleave(lists: List[List[str]]) -> List[str]:
+    """Round-robin across parts so early sections do not crowd out later ones."""
+    merged: List[str] = []
+    for depth in range(max((len(items) for items in lists), default=0)):
+        merged.extend(items[depth] for items in lists if depth < len(items))
+    return merged
+
+
+def _merge_partials(partials: List[Partial], max_points: int) -> Partial:
+    """Deterministic reduce used when the LLM is unavailable or the reduce call fails."""
+    summaries = [partial[0] for partial in partials if partial[0]]
+    analyses = [partial[1] for partial in partials if partial[1]]
+    summary = textwrap.shorten(" ".join(summaries), width=1200, placeholder="…")
+    analysis = "\n\n".join(analyses)
+    key_points = _dedupe(_interleave([partial[2] for partial in partials]), max_points)
+    keyword_counts: Dict[str, int] = {}
+    for partial in partials:
+        for keyword in partial[3]:
+            keyword_counts[keyword] = keyword_counts.get(keyword, 0) + 1
+    ranked = sorted(keyword_counts, key=lambda keyword: -keyword_counts[keyword])
+    keywords = _dedupe(ranked, 8)
+    comparisons = _dedupe(_interleave([partial[4] for partial in partials]), 3)
+    table_markdown = next((partial[5] for partial in partials if partial[5]), None)
+    return summary, analysis, key_points, keywords, comparisons, table_markdown
+
+
+def _reduce_partials(
+    partials: List[Partial],
+    max_points: int,
+    on_section: Optional[SectionCallback] = None,
+    instructions: str = "",
+) -> Tuple[Partial, bool]:
+    if len(partials) == 1:
+        return partials[0], False
+    digest = json.dumps(
+        [
+            {
+                "part": index + 1,
+                "summary": partial[0],
+                "analysis": textwrap.shorten(partial[1], width=1500, placeholder="…"),
+                "key_points": partial[2],
+                "keywords": partial[3],
+                "comparisons": partial[4],
+            }
+            for index, partial in enumerate(partials)
+        ],
+        ensure_ascii=False,
+    )
+    reduced = _call_llm(digest, max_points, prompt=_reduce_prompt(max_points, instructions), on_section=on_section)
+    if reduced:
+        return reduced, False
+    return _merge_partials(partials, max_points), _llm_client is not None
+
+
+def _map_reduce(
+    text: str,
+    max_tokens: int,
+    max_points: int,
+    progress: Optional[ProgressCallback] = None,
+    on_section: Optional[SectionCallback] = None,
+    instructions: str = "",
+) -> Tuple[Partial, int, bool, bool]:
+    """
+    Analyse up to MAP_REDUCE_MAX_CHUNKS chunks concurrently and merge the results.
+    ``instructions`` go with every map call and the reduce call.
+
+    Returns the merged partial, characters analysed, whether the document was
+    cut off, and whether any LLM call had to fall back.
+    """
+    overhead = len(_with_instructions("", instructions))
+    chunks = _split_into_chunks(text, max(1000, max_tokens * AVG_CHARS_PER_TOKEN - overhead))
+    truncated = len(chunks) > MAP_REDUCE_MAX_CHUNKS
+    chunks = chunks[:MAP_REDUCE_MAX_CHUNKS]
+    workers = max(1, min(MAP_REDUCE_CONCURRENCY, len(chunks)))
+    mapped: List[Tuple[Partial, bool]] = [None] * len(chunks)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis-map") as pool:
+        futures = {
+            pool.submit(_analyse_chunk, chunk, index, len(chunks), max_points, instructions): index
+            for index, chunk in enumerate(chunks)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            mapped[futures[future]] = future.result()
+            _report(progress, "analysing", done / len(chunks))
+    partials = [partial for partial, _ in mapped]
+    _report(progress, "reducing", 0.0)
+    merged, reduce_degraded = _reduce_partials(partials, max_points, on_section, instructions)
+    degraded = reduce_degraded or any(fallback for _, fallback in mapped)
+    return merged, sum(len(chunk) for chunk in chunks), truncated, degraded
 
 
 def analyse_text(
@@ -231,11 +476,30 @@ def analyse_text(
     max_tokens: int = MAX_INPUT_TOKENS,
     max_points: int = 5,
     source: str = "text",
+    mode: str = "auto",
+    progress: Optional[ProgressCallback] = None,
+    normalized: bool = False,
+    on_section: Optional[SectionCallback] = None,
+    instructions: Optional[str] = None,
 ) -> AnalysisResult:
     """
     Run document analysis on the provided text and return a structured payload.
+
+    ``mode`` selects between a single call on the first ``max_tokens`` of the
+    text ("single"), chunked map-reduce over the whole document ("map_reduce"),
+    or map-reduce only when the text does not fit one call ("auto"). Pass
+    ``normalized=True`` when ``text`` has already been through ``clean_text``.
+    ``on_section`` streams the final call (the single call or the reduce) and
+    receives each section as soon as the model has written it. ``instructions``
+    from the user are sent with every LLM call, including each map-reduce part.
     """
-    if not text or not text.strip():
+    if mode not in ANALYSIS_MODES:
+        raise ValueError(f"mode must be one of {', '.join(ANALYSIS_MODES)}.")
+
+    if not normalized:
+        text = _clean_text(text)
+    instructions = _clean_text(instructions or "")
+    if not text:
         return AnalysisResult(
             source=source,
             summary="",
@@ -248,23 +512,36 @@ def analyse_text(
             input_characters=0,
         )
 
-    normalized = _clean_text(text)
-    trimmed_text, truncated = _truncate_to_token_limit(normalized, max_tokens)
+    use_map_reduce = mode == "map_reduce" or (
+        mode == "auto" and MAP_REDUCE_ENABLED
+        and len(_with_instructions(text, instructions)) > max_tokens * AVG_CHARS_PER_TOKEN
+    )
 
-    llm_result = _call_llm(trimmed_text, max_points)
-    if llm_result:
-        summary, analysis, key_points, keywords, comparisons, table_markdown = llm_result
-    else:
-        summary, analysis, key_points, keywords, comparisons, table_markdown = _basic_summary(
-            trimmed_text, max_points
+    if use_map_reduce:
+        (summary, analysis, key_points, keywords, comparisons, table_markdown), input_characters, truncated, degraded = (
+            _map_reduce(text, max_tokens, max_points, progress, on_section, instructions)
         )
+        fallback_text = text
+    else:
+        trimmed_text, truncated = _truncate_to_token_limit(_with_instructions(text, instructions), max_tokens)
+        input_characters = len(trimmed_text)
+        fallback_text = trimmed_text
+        _report(progress, "analysing", 0.0)
+        llm_result = _call_llm(trimmed_text, max_points, on_section=on_section)
+        degraded = not llm_result and _llm_client is not None
+        if llm_result:
+            summary, analysis, key_points, keywords, comparisons, table_markdown = llm_result
+        else:
+            summary, analysis, key_points, keywords, comparisons, table_markdown = _basic_summary(
+                trimmed_text, max_points
+            )
 
     if not summary:
-        summary = textwrap.shorten(trimmed_text, width=600, placeholder="…")
+        summary = textwrap.shorten(fallback_text, width=600, placeholder="…")
     if not analysis:
         analysis = summary
 
-    return AnalysisResult(
+    result = AnalysisResult(
         source=source,
         summary=summary,
         analysis=analysis,
@@ -273,36 +550,135 @@ def analyse_text(
         comparisons=comparisons,
         table_markdown=table_markdown,
         truncated=truncated,
-        input_characters=len(trimmed_text),
+        input_characters=input_characters,
+    )
+    result._degraded = degraded
+    return result
+
+
+def _max_document_chars(max_tokens: int, mode: str) -> int:
+    """Characters worth extracting for ``mode``; map-reduce can use several windows."""
+    windows = MAP_REDUCE_MAX_CHUNKS if mode == "map_reduce" or (mode == "auto" and MAP_REDUCE_ENABLED) else 1
+    return max_tokens * AVG_CHARS_PER_TOKEN * windows
+
+
+def analyse_extracted(
+    extracted: ExtractedText,
+    *,
+    source: str = "pdf",
+    instructions: Optional[str] = None,
+    max_tokens: int = MAX_INPUT_TOKENS,
+    max_points: int = 5,
+    mode: str = "auto",
+    progress: Optional[ProgressCallback] = None,
+    on_section: Optional[SectionCallback] = None,
+) -> AnalysisResult:
+    """Run the text analysis over already extracted document text."""
+    # Extracted pages are already clean; analyse_text normalizes the instructions.
+    result = analyse_text(
+        extracted.text,
+        max_tokens=max_tokens,
+        max_points=max_points,
+        source=source,
+        mode=mode,
+        progress=progress,
+        normalized=True,
+        on_section=on_section,
+        instructions=instructions,
+    )
+    result.extraction = extracted.stats
+    if extracted.stats.stopped_early:
+        result.truncated = True
+    return result
+
+
+def extract_for_analysis(
+    data: DocumentSource,
+    *,
+    extension: str = "pdf",
+    max_tokens: int = MAX_INPUT_TOKENS,
+    mode: str = "auto",
+    path: Optional[str] = None,
+) -> ExtractedText:
+    """Extract as much of the document as ``mode`` can analyse."""
+    return extract_document(data, extension=extension, max_chars=_max_document_chars(max_tokens, mode), path=path)
+
+
+def analyse_document(
+    data: DocumentSource,
+    *,
+    extension: str,
+    instructions: Optional[str] = None,
+    max_tokens: int = MAX_INPUT_TOKENS,
+    max_points: int = 5,
+    mode: str = "auto",
+    path: Optional[str] = None,
+    progress: Optional[ProgressCallback] = None,
+    on_section: Optional[SectionCallback] = None,
+) -> AnalysisResult:
+    """
+    Extract text from a PDF, DOCX or TXT file and delegate to the core text analysis.
+
+    ``data`` may also be an mmap of an uploaded file, with ``path`` pointing at it.
+    Raises UnsupportedDocumentError for other extensions.
+    """
+    _report(progress, "extracting", 0.0)
+    extracted = extract_for_analysis(data, extension=extension, max_tokens=max_tokens, mode=mode, path=path)
+    return analyse_extracted(
+        extracted,
+        source=extension,
+        instructions=instructions,
+        max_tokens=max_tokens,
+        max_points=max_points,
+        mode=mode,
+        progress=progress,
+        on_section=on_section,
     )
 
 
 def analyse_pdf(
-    pdf_bytes: bytes,
+    pdf_bytes: PdfSource,
     *,
     instructions: Optional[str] = None,
     max_tokens: int = MAX_INPUT_TOKENS,
     max_points: int = 5,
+    mode: str = "auto",
+    path: Optional[str] = None,
+    progress: Optional[ProgressCallback] = None,
+    on_section: Optional[SectionCallback] = None,
 ) -> AnalysisResult:
     """Extract text from a PDF and delegate to the core text analysis."""
-    text = extract_text_from_pdf(pdf_bytes)
-    if instructions and instructions.strip():
-        combined = _clean_text(f"User instructions:\n{instructions.strip()}\n\nDocument:\n{text}")
-    else:
-        combined = text
-    return analyse_text(
-        combined,
+    return analyse_document(
+        pdf_bytes,
+        extension="pdf",
+        instructions=instructions,
         max_tokens=max_tokens,
         max_points=max_points,
-        source="pdf",
+        mode=mode,
+        path=path,
+        progress=progress,
+        on_section=on_section,
     )
 
 
+def analysis_model_name() -> str:
+    """Identifies what produces analyses right now; part of the result cache key."""
+    return AZURE_OPENAI_CHAT_DEPLOYMENT_NAME if _llm_client else "extractive"
+
+
 __all__ = [
+    "ANALYSIS_MODES",
+    "ANALYSIS_SECTIONS",
     "AnalysisResult",
     "MAX_OUTPUT_TOKENS",
+    "analyse_document",
+    "analyse_extracted",
     "analyse_pdf",
     "analyse_text",
+    "analysis_model_name",
+    "extract_for_analysis",
     "extract_text_from_pdf",
     "MAX_INPUT_TOKENS",
+    "ProgressCallback",
+    "SectionCallback",
 ]
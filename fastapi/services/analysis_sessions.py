@@ -0,0 +1,307 @@
+"""
+Follow-up questions on an analysed document.
+
+Every analysis opens a session keyed by its token that holds the document
+text. The first question chunks the text and embeds all chunks in batched
+embedding calls; the vectors are kept in a small NumPy matrix next to the
+chunks. Each question after that costs one query embedding, a matrix-vector
+product and a short LLM call over the best few chunks, instead of sending the
+whole document again.
+
+Sessions live in process memory, expire ``ANALYSIS_SESSION_TTL_SECONDS`` after
+their last use and at most ``ANALYSIS_SESSION_MAX`` are kept (least recently
+used first out). A worker that has no session for a stored analysis reopens
+it from the database (``analysis_cache.ask``); unstored results only live on
+the worker that produced them.
+
+Without Azure credentials, or if an embedding call fails, chunks are embedded
+with a hashed bag-of-words so retrieval still works, and the answer is built
+from the retrieved passages.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import textwrap
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from services import analysis_llm
+from services.analysis_llm import AnalysisResult
+
+logger = logging.getLogger(__name__)
+
+AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME", "text-embedding-3-small")
+ANALYSIS_SESSION_TTL_SECONDS = int(os.getenv("ANALYSIS_SESSION_TTL_SECONDS", "3600"))
+ANALYSIS_SESSION_MAX = int(os.getenv("ANALYSIS_SESSION_MAX", "128"))
+ANALYSIS_CHUNK_CHARS = int(os.getenv("ANALYSIS_CHUNK_CHARS", "1500"))
+ANALYSIS_EMBED_BATCH_SIZE = int(os.getenv("ANALYSIS_EMBED_BATCH_SIZE", "64"))
+ANALYSIS_ASK_TOP_K = int(os.getenv("ANALYSIS_ASK_TOP_K", "4"))
+ANALYSIS_ASK_MAX_TOKENS = int(os.getenv("ANALYSIS_ASK_MAX_TOKENS", "600"))
+
+HASHED_DIMENSIONS = 1024
+_WORD = re.compile(r"\w+")
+
+_ASK_PROMPT = (
+    "You answer questions about a single legal document using only the numbered excerpts "
+    "provided. Cite excerpts as [1], [2] and so on. If the excerpts do not contain the "
+    "answer, say so plainly instead of guessing."
+)
+
+
+class RetrievedChunk(BaseModel):
+    index: int
+    score: float
+    text: str
+
+
+class AnalysisAnswer(BaseModel):
+    token: str
+    question: str
+    answer: str
+    chunks: List[RetrievedChunk]
+    embedding: str
+
+
+@dataclass
+class DocumentIndex:
+    """Chunks of one document and their unit-length embeddings, one row per chunk."""
+
+    chunks: List[str]
+    vectors: np.ndarray
+    embedding: str
+
+    def search(self, query: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        if not self.chunks:
+            return []
+        scores = self.vectors @ query
+        k = min(top_k, len(self.chunks))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(i), float(scores[i])) for i in best]
+
+
+@dataclass
+class AnalysisSession:
+    token: str
+    text: Optional[str]
+    last_used: float = field(default_factory=time.monotonic)
+    index: Optional[DocumentIndex] = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class SessionStore:
+    """Token -> AnalysisSession with a sliding TTL and an LRU size cap."""
+
+    def __init__(self, ttl_seconds: int = ANALYSIS_SESSION_TTL_SECONDS, max_sessions: int = ANALYSIS_SESSION_MAX):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, AnalysisSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.ttl_seconds
+        while self._sessions:
+            token, session = next(iter(self._sessions.items()))
+            if session.last_used >= cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[token]
+
+    def put(self, token: str, text: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                self._sessions[token] = AnalysisSession(token=token, text=text, last_used=now)
+            else:
+                session.last_used = now
+                self._sessions.move_to_end(token)
+            self._prune(now)
+
+    def get(self, token: str) -> Optional[AnalysisSession]:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            session = self._sessions.get(token)
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(token)
+            return session
+
+    def __contains__(self, token: str) -> bool:
+        with self._lock:
+            self._prune(time.monotonic())
+            return token in self._sessions
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+
+_store = SessionStore()
+
+
+def open_session(result: AnalysisResult, text: str) -> AnalysisResult:
+    """Keep ``text`` for follow-up questions under the result's token, assigning one if needed."""
+    if not text:
+        return result
+    if not result.token:
+        result.token = uuid.uuid4().hex
+    _store.put(result.token, text)
+    return result
+
+
+def reopen_session(token: str, text: str) -> None:
+    """Keep ``text`` under an existing token, e.g. a stored analysis asked about on another worker."""
+    if text:
+        _store.put(token, text)
+
+
+def has_session(token: Optional[str]) -> bool:
+    return bool(token) and token in _store
+
+
+# ---------------------------------------------------------------------------
+# Embeddings
+# ---------------------------------------------------------------------------
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _hashed_embeddings(texts: List[str]) -> np.ndarray:
+    """Bag-of-words hashed into HASHED_DIMENSIONS buckets with sublinear term weights."""
+    matrix = np.zeros((len(texts), HASHED_DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _WORD.findall(text.lower())
+        if not words:
+            continue
+        buckets = np.fromiter((zlib.crc32(word.encode("utf-8")) % HASHED_DIMENSIONS for word in words), dtype=np.int64)
+        counts = np.bincount(buckets, minlength=HASHED_DIMENSIONS).astype(np.float32)
+        matrix[row] = np.log1p(counts)
+    return _unit_rows(matrix)
+
+
+def _azure_embeddings(texts: List[str]) -> np.ndarray:
+    """Embed ``texts`` with ANALYSIS_EMBED_BATCH_SIZE inputs per request."""
+    rows: List[List[float]] = []
+    for start in range(0, len(texts), ANALYSIS_EMBED_BATCH_SIZE):
+        batch = texts[start:start + ANALYSIS_EMBED_BATCH_SIZE]
+        response = analysis_llm._llm_client.embeddings.create(model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME, input=batch)
+        rows.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return _unit_rows(np.asarray(rows, dtype=np.float32))
+
+
+def _embed(texts: List[str], kind: Optional[str] = None) -> Tuple[np.ndarray, str]:
+    """Return unit vectors and the embedding kind; ``kind`` pins queries to the index's embedding."""
+    if kind != "hashed" and analysis_llm._llm_client is not None:
+        try:
+            return _azure_embeddings(texts), "azure"
+        except Exception:
+            if kind == "azure":
+                raise
+            logger.exception("Embedding request failed; using hashed embeddings for this document")
+    return _hashed_embeddings(texts), "hashed"
+
+
+def _build_index(text: str) -> DocumentIndex:
+    chunks = analysis_llm._split_into_chunks(text, ANALYSIS_CHUNK_CHARS)
+    if not chunks:
+        return DocumentIndex(chunks=[], vectors=np.zeros((0, HASHED_DIMENSIONS), dtype=np.float32), embedding="hashed")
+    started = time.perf_counter()
+    vectors, kind = _embed(chunks)
+    logger.info(
+        "Indexed %d chunks with %s embeddings in %.1fms",
+        len(chunks),
+        kind,
+        (time.perf_counter() - started) * 1000,
+    )
+    return DocumentIndex(chunks=chunks, vectors=vectors, embedding=kind)
+
+
+def _index_for(session: AnalysisSession) -> DocumentIndex:
+    with session.lock:
+        if session.index is None:
+            session.index = _build_index(session.text or "")
+            session.text = None
+        return session.index
+
+
+# ---------------------------------------------------------------------------
+# Questions
+# ---------------------------------------------------------------------------
+
+def _answer_with_llm(question: str, passages: List[str]) -> Optional[str]:
+    if analysis_llm._llm_client is None:
+        return None
+    excerpts = "\n\n".join(f"[{number}] {passage}" for number, passage in enumerate(passages, start=1))
+    user_message = f"Excerpts:\n{excerpts}\n\nQuestion: {question}"
+    estimate = analysis_llm._approximate_token_count(_ASK_PROMPT + user_message) + ANALYSIS_ASK_MAX_TOKENS
+    try:
+        with analysis_llm.llm_limiter.acquire(estimate):
+            response = analysis_llm._llm_client.chat.completions.create(
+                model=analysis_llm.AZURE_OPENAI_CHAT_DEPLOYMENT_NAME,
+                temperature=0.1,
+                max_tokens=ANALYSIS_ASK_MAX_TOKENS,
+                messages=[
+                    {"role": "system", "content": _ASK_PROMPT},
+                    {"role": "user", "content": user_message},
+                ],
+            )
+        content = response.choices[0].message.content if response.choices else ""
+    except Exception:
+        logger.exception("Follow-up answer request failed")
+        return None
+    return (content or "").strip() or None
+
+
+def _extractive_answer(passages: List[str]) -> str:
+    if not passages:
+        return "The document does not contain any text to answer from."
+    return " ".join(
+        f"[{number}] {textwrap.shorten(passage, width=400, placeholder='…')}"
+        for number, passage in enumerate(passages, start=1)
+    )
+
+
+def ask(token: str, question: str, *, top_k: int = ANALYSIS_ASK_TOP_K) -> Optional[AnalysisAnswer]:
+    """Answer ``question`` from the session's most relevant chunks; None if the session is gone."""
+    session = _store.get(token)
+    if session is None:
+        return None
+    index = _index_for(session)
+    query, _ = _embed([question], kind=index.embedding)
+    hits = index.search(query[0], max(1, top_k))
+    chunks = [RetrievedChunk(index=i, score=round(score, 4), text=index.chunks[i]) for i, score in hits]
+    passages = [chunk.text for chunk in chunks]
+    answer = _answer_with_llm(question, passages) or _extractive_answer(passages)
+    return AnalysisAnswer(token=token, question=question, answer=answer, chunks=chunks, embedding=index.embedding)
+
+
+def clear_sessions() -> None:
+    _store.clear()
+
+
+__all__ = [
+    "AnalysisAnswer",
+    "DocumentIndex",
+    "RetrievedChunk",
+    "SessionStore",
+    "ask",
+    "clear_sessions",
+    "has_session",
+    "open_session",
+    "reopen_session",
+]
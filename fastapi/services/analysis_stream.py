@@ -0,0 +1,89 @@
+"""
+Server-sent events for a single document analysis.
+
+The analysis runs in the thread pool as usual; its progress callback and the
+section callback of the streamed completion push events onto an asyncio queue
+that the response drains. A client sees the first section once the model has
+written it, not after the whole JSON object is generated and parsed::
+
+    event: progress
+    data: {"stage": "analysing", "progress": 0.0}
+
+    event: section
+    data: {"name": "summary", "value": "The appellant challenged ..."}
+
+    event: result
+    data: {"source": "text", "summary": "...", ...}
+
+``result`` is always last and authoritative. Before it, any section that was
+not streamed (cache hits, the extractive fallback, a reduce over one part) or
+whose final value differs from what was streamed is sent again. A failure
+ends the stream with an ``error`` event instead.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict
+
+from fastapi.concurrency import run_in_threadpool
+
+from services import analysis_cache
+from services.analysis_llm import ANALYSIS_SECTIONS
+
+logger = logging.getLogger(__name__)
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+_END = object()
+
+
+def _event(name: str, data: Any) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_analysis(spec: Dict[str, Any]) -> AsyncIterator[str]:
+    """Run ``analysis_cache.analyse_spec`` and yield its progress, sections and result as SSE frames."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(*item: Any) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def run():
+        try:
+            return analysis_cache.analyse_spec(
+                spec,
+                progress=lambda stage, fraction: emit("progress", {"stage": stage, "progress": round(fraction, 3)}),
+                on_section=lambda name, value: emit("section", {"name": name, "value": value}),
+            )
+        finally:
+            emit(_END, None)
+
+    task = asyncio.ensure_future(run_in_threadpool(run))
+    sent: Dict[str, Any] = {}
+    while True:
+        name, data = await queue.get()
+        if name is _END:
+            break
+        if name == "section":
+            sent[data["name"]] = data["value"]
+        yield _event(name, data)
+
+    try:
+        result = await task
+    except Exception as exc:
+        logger.exception("Streamed analysis failed")
+        yield _event("error", {"detail": str(exc) or exc.__class__.__name__})
+        return
+
+    payload = result.model_dump(mode="json")
+    for section in ANALYSIS_SECTIONS:
+        if section not in sent or sent[section] != payload[section]:
+            yield _event("section", {"name": section, "value": payload[section]})
+    yield _event("result", payload)
+
+
+__all__ = ["SSE_HEADERS", "stream_analysis"]
@@ -14,13 +14,20 @@ Advotac CMD Chatbase (RERANK FIX v2 - Precision Upgrade + Prompt Suite)
 import os
 import re
 import json
+import functools
 from dataclasses import dataclass
 from typing import List, Optional, Tuple, Dict
 
+import numpy as np
 from qdrant_client import QdrantClient
 from openai import AzureOpenAI
 from pydantic import BaseModel
 
+from services import instrumentation, vector_rerank as vr
+from services.embedding_batcher import EmbeddingBatcher
+from services.instrumentation import PipelineTimings, record_usage, stage
+from services.search_batcher import SearchBatcher
+
 
 def _normalize_deployment_name(name: Optional[str], default: str) -> str:
     """
@@ -84,6 +91,7 @@ class AnswerResponse(BaseModel):
     expanded_queries: List[str]
     sources: List[Source]
     validation: Optional[str] = None
+    timings: Optional[PipelineTimings] = None
 
 # -------------------------- Clients --------------------------
 llm = AzureOpenAI(
@@ -98,14 +106,28 @@ qdrant = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
 class Hit:
     score: float
     payload: dict
+    vector: Optional[List[float]] = None
 
 # -------------------------- Embeddings --------------------------
+def _embed_many(texts: List[str]) -> List[List[float]]:
+    res = llm.embeddings.create(model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME, input=texts)
+    return [item.embedding for item in sorted(res.data, key=lambda item: item.index)]
+
+
+# Concurrent requests share list-input embedding calls; see services/embedding_batcher.py.
+_embedding_batcher = EmbeddingBatcher(_embed_many, name="answer_llm")
+
+
+@stage("embed")
 def embed(text: str) -> List[float]:
-    resp = llm.embeddings.create(
-        model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME,
-        input=text
-    )
-    return resp.data[0].embedding
+    return _embedding_batcher.embed(text)
+
+
+@stage("embed")
+def embed_queries(texts: List[str]) -> List[List[float]]:
+    """Embed the query and its rewrites together; they share one batched call."""
+    futures = [_embedding_batcher.submit(text) for text in texts]
+    return [future.result() for future in futures]
 
 # -------------------------- Simple Heuristics (fallback) --------------------------
 _WORD_RE = re.compile(r"[A-Za-z0-9\-\(\)\/\.]+")
@@ -156,6 +178,7 @@ def gather_text_for_overlap(p: dict) -> str:
     ]
     return " | ".join([x for x in parts if x])
 
+@stage("heuristic_rerank")
 def heuristic_rerank(query: str, hits: List[Hit], alpha=0.65, beta=0.25, gamma=0.10) -> List[Hit]:
     if not hits:
         return []
@@ -173,15 +196,80 @@ def heuristic_rerank(query: str, hits: List[Hit], alpha=0.65, beta=0.25, gamma=0
     scored.sort(key=lambda x: x[0], reverse=True)
     return [h for _, h in scored]
 
+@functools.lru_cache(maxsize=vr.RERANK_TOKEN_CACHE_SIZE)
+def _overlap_tokens(text: str) -> frozenset:
+    # Chunks recur across queries, so their token sets are built once. For ASCII
+    # text, lower-casing before matching gives the same tokens in one call.
+    if text.isascii():
+        return frozenset(_WORD_RE.findall(text.lower()))
+    return frozenset(simple_tokens(text))
+
+@functools.lru_cache(maxsize=64)
+def _prior_pattern(pattern: str) -> "re.Pattern":
+    return re.compile(pattern, re.I)
+
+@stage("vector_rerank")
+def vector_rerank(
+    query: str,
+    hits: List[Hit],
+    query_vectors: Optional[List[List[float]]] = None,
+    alpha=0.65,
+    beta=0.25,
+    gamma=0.10,
+    mmr_lambda: float = 1.0,
+    mmr_limit: int = 0,
+) -> List[Hit]:
+    """
+    ``heuristic_rerank`` scored as arrays, with the same result when hits carry no vectors.
+    When they do, the vector term is each hit's best cosine against ``query_vectors``
+    (the query and its rewrites). ``mmr_lambda`` below 1 diversifies the first ``mmr_limit`` hits.
+    """
+    if not hits:
+        return []
+    q_set = frozenset(simple_tokens(query))
+    q_len = max(1, len(q_set))
+    priors = [(_prior_pattern(pattern), val) for pattern, val in build_act_priors(query)]
+    boosts: Dict[str, float] = {}
+    overlap = np.empty(len(hits))
+    boost = np.empty(len(hits))
+    for i, h in enumerate(hits):
+        payload = h.payload or {}
+        tokens = _overlap_tokens(gather_text_for_overlap(payload))
+        overlap[i] = len(q_set & tokens) / q_len if tokens else 0.0
+        act = payload.get("doc_title", "") or ""
+        if act not in boosts:
+            total = 0.0
+            for pattern, val in priors:
+                if pattern.search(act):
+                    total += val
+            boosts[act] = total
+        boost[i] = boosts[act]
+
+    vectors = vr.vector_matrix([h.vector for h in hits])
+    if vectors is not None and query_vectors:
+        vector_scores = vr.query_similarity(vectors, query_vectors)
+    else:
+        vector_scores = np.array([h.score or 0.0 for h in hits], dtype=np.float64)
+    scores = vr.combine(vector_scores, overlap, boost, alpha, beta, gamma)
+    if vectors is not None and mmr_lambda < 1.0:
+        order = vr.mmr_order(scores, vectors, mmr_lambda, mmr_limit or len(hits))
+    else:
+        order = vr.rank(scores)
+    return [hits[i] for i in order]
+
 # -------------------------- Search --------------------------
-def qdrant_search(query_vec: List[float], top_k=15) -> List[Hit]:
+# Concurrent requests share search_batch calls; see services/search_batcher.py.
+_search_batcher = SearchBatcher(lambda: qdrant, name="answer_llm")
+
+
+@stage("qdrant_search")
+def qdrant_search(query_vec: List[float], top_k=15, with_vectors: bool = False) -> List[Hit]:
     limit = max(15, top_k * 8)
-    res = qdrant.search(
-        collection_name=QDRANT_COLLECTION,
-        query_vector=query_vec,
-        limit=limit,
-    )
-    return [Hit(score=(r.score or 0.0), payload=r.payload) for r in res]
+    res = _search_batcher.search(QDRANT_COLLECTION, query_vec, limit, with_vectors=with_vectors)
+    return [
+        Hit(score=(r.score or 0.0), payload=r.payload, vector=r.vector if isinstance(r.vector, list) else None)
+        for r in res
+    ]
 
 # -------------------------- Layer Detection --------------------------
 def detect_layer(p: Dict) -> str:
@@ -226,6 +314,7 @@ def split_context_by_layer(hits: List[Hit], max_chars=7500):
     return "\n---\n".join(l1), "\n---\n".join(l2), "\n---\n".join(l3)
 
 # -------------------------- 1) RETRIEVER REWRITER PROMPT --------------------------
+@stage("rewrite_queries")
 def rewrite_queries(user_query: str) -> List[str]:
     system_msg = (
         "You are a retrieval rewriter for the Advotac Legal AI system.\n\n"
@@ -250,6 +339,7 @@ def rewrite_queries(user_query: str) -> List[str]:
                 {"role": "user", "content": user_msg}
             ]
         )
+        record_usage(resp)
         content = resp.choices[0].message.content.strip()
         # Strict JSON list expected
         queries = json.loads(content)
@@ -261,6 +351,7 @@ def rewrite_queries(user_query: str) -> List[str]:
     return [user_query]
 
 # -------------------------- 2) LLM RERANKER PROMPT (with fallback) --------------------------
+@stage("llm_rerank")
 def llm_rerank(user_query: str, hits: List[Hit]) -> Optional[List[Tuple[float, Hit]]]:
     """
     Returns list of (score, Hit) sorted desc by score using LLM. If fails, returns None.
@@ -319,6 +410,7 @@ def llm_rerank(user_query: str, hits: List[Hit]) -> Optional[List[Tuple[float, H
                 {"role": "user", "content": user_msg}
             ]
         )
+        record_usage(resp)
         content = resp.choices[0].message.content.strip()
         ranked = json.loads(content)
         scored: List[Tuple[float, Hit]] = []
@@ -334,6 +426,7 @@ def llm_rerank(user_query: str, hits: List[Hit]) -> Optional[List[Tuple[float, H
         return None
 
 # -------------------------- 3) GENERATOR PROMPT (final synthesis) --------------------------
+@stage("generate_answer")
 def generate_answer(user_query: str, l1_texts: str, l2_texts: str, l3_texts: str) -> str:
     system_msg = (
         "You are Advotac Legal AI, a precision-based assistant trained on Indian Acts (L1–L3 hierarchy).\n\n"
@@ -381,9 +474,11 @@ Rules:
             {"role": "user", "content": user_msg}
         ]
     )
+    record_usage(resp)
     return resp.choices[0].message.content.strip()
 
 # -------------------------- 4) (Optional) CITATION VALIDATOR --------------------------
+@stage("validate_citations")
 def validate_citations(answer_text: str, l1_texts: str, l2_texts: str, l3_texts: str) -> str:
     system_msg = (
         "You are a legal citation validator for Indian Acts.\n"
@@ -409,6 +504,7 @@ L3: {l3_texts or "[none]"}"""
                 {"role": "user", "content": user_msg}
             ]
         )
+        record_usage(resp)
         return resp.choices[0].message.content.strip()
     except Exception as e:
         return f"(validator error: {e})"
@@ -460,7 +556,15 @@ def answer_query(
 ) -> AnswerResponse:
     """
     Execute the full retrieval + generation pipeline and return a serializable response.
+    The response carries per-stage timings and token usage.
     """
+    with instrumentation.trace("query") as run:
+        response = _answer_query(query, top_k=top_k, threshold=threshold, do_validate=do_validate)
+    response.timings = run.timings()
+    return response
+
+
+def _answer_query(query: str, top_k: int, threshold: float, do_validate: bool) -> AnswerResponse:
     normalized_query = _sanitize_query(query)
     if not normalized_query:
         raise ValueError("Query must not be empty.")
@@ -470,25 +574,32 @@ def answer_query(
         raise ValueError("threshold must be between 0 and 1.")
 
     expanded = rewrite_queries(normalized_query)
+    use_vectors = vr.RERANK_MODE == "vector"
 
     try:
-        query_vector = embed(normalized_query)
+        if use_vectors:
+            # The rewrites join the query embedding call and score hits in vector_rerank.
+            query_vectors = embed_queries([normalized_query] + [q for q in expanded if q != normalized_query])
+        else:
+            query_vectors = [embed(normalized_query)]
     except Exception as exc:
         raise RuntimeError("Failed to create embedding for query.") from exc
 
     try:
-        wide_hits = qdrant_search(query_vector, top_k=max(15, top_k * 8))
+        wide_hits = qdrant_search(query_vectors[0], top_k=max(15, top_k * 8), with_vectors=use_vectors)
     except Exception as exc:
         raise RuntimeError("Vector search against Qdrant failed.") from exc
 
     final_hits: List[Hit]
-    reranked_llm = llm_rerank(normalized_query, wide_hits)
+    reranked_llm = None if use_vectors else llm_rerank(normalized_query, wide_hits)
     if reranked_llm:
         filtered = [(score, hit) for score, hit in reranked_llm if (hit.score or 0.0) >= threshold]
         base = filtered if filtered else reranked_llm
         final_hits = weighted_blend(base, top_k)
     else:
-        heuristic_hits = heuristic_rerank(normalized_query, wide_hits)
+        heuristic_hits = vector_rerank(
+            normalized_query, wide_hits, query_vectors, mmr_lambda=vr.RERANK_MMR_LAMBDA, mmr_limit=top_k
+        )
         filtered = [hit for hit in heuristic_hits if (hit.score or 0.0) >= threshold]
         final_hits = filtered[:top_k] if filtered else heuristic_hits[:top_k]
 
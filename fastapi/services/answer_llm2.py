@@ -14,6 +14,11 @@ from qdrant_client import QdrantClient
 from openai import AzureOpenAI
 from pydantic import BaseModel
 
+from services import instrumentation
+from services.embedding_batcher import EmbeddingBatcher
+from services.instrumentation import PipelineTimings, record_usage, stage
+from services.search_batcher import SearchBatcher
+
 
 def _normalize_deployment_name(name: Optional[str], default: str) -> str:
     """
@@ -100,18 +105,35 @@ class AnswerResponse(BaseModel):
     expanded_queries: List[str]
     sources: List[Source]
     validation: Optional[str] = None
+    timings: Optional[PipelineTimings] = None
 
 # -------------------------- EMBEDDINGS --------------------------
+def _embed_many(texts: List[str]) -> List[List[float]]:
+    res = llm.embeddings.create(model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME, input=texts)
+    return [item.embedding for item in sorted(res.data, key=lambda item: item.index)]
+
+
+# Concurrent requests share list-input embedding calls; see services/embedding_batcher.py.
+_embedding_batcher = EmbeddingBatcher(_embed_many, name="answer_llm2")
+
+
+@stage("embed")
 def embed(text: str) -> List[float]:
-    res = llm.embeddings.create(model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME, input=text)
-    return res.data[0].embedding
+    return _embedding_batcher.embed(text)
 
 # -------------------------- SEARCH --------------------------
+# Concurrent requests share one search_batch call per collection; see services/search_batcher.py.
+_search_batcher = SearchBatcher(lambda: qdrant, name="answer_llm2")
+
+
+@stage("multi_search")
 def multi_search(query_vec: List[float], top_k: int = 15) -> List[Hit]:
     results = []
-    for col in COLLECTIONS:
+    # Queue all collections before waiting so their searches run side by side.
+    pending = [(col, _search_batcher.submit(col, query_vec, top_k)) for col in COLLECTIONS]
+    for col, future in pending:
         try:
-            res = qdrant.search(collection_name=col, query_vector=query_vec, limit=top_k)
+            res = future.result()
             for r in res:
                 results.append(Hit(score=r.score or 0.0, collection=col, payload=r.payload))
         except Exception as e:
@@ -172,6 +194,7 @@ def split_context_by_layer(hits: List[Hit], max_chars: int = 8000):
     return "\n---\n".join(l1), "\n---\n".join(l2), "\n---\n".join(l3)
 
 # -------------------------- PROMPTS --------------------------
+@stage("rewrite_queries")
 def rewrite_queries(user_query: str) -> List[str]:
     system_msg = (
         "You are a retrieval rewriter for the Advotac Legal AI system.\n"
@@ -187,9 +210,11 @@ def rewrite_queries(user_query: str) -> List[str]:
             max_tokens=200,
             messages=[{"role":"system","content":system_msg},{"role":"user","content":user_query}]
         )
+        record_usage(resp)
         return json.loads(resp.choices[0].message.content)
     except Exception: return [user_query]
 
+@stage("llm_rerank")
 def llm_rerank(user_query: str, hits: List[Hit]) -> Optional[List[Tuple[float, Hit]]]:
     if not hits: return None
     items=[]
@@ -206,6 +231,7 @@ def llm_rerank(user_query: str, hits: List[Hit]) -> Optional[List[Tuple[float, H
             model=AZURE_OPENAI_CHAT_DEPLOYMENT_NAME,temperature=0,max_tokens=700,
             messages=[{"role":"system","content":system_msg},{"role":"user","content":json.dumps({'q':user_query,'chunks':items},ensure_ascii=False)}]
         )
+        record_usage(r)
         ranked=json.loads(r.choices[0].message.content)
         scored=[]
         for row in ranked:
@@ -216,6 +242,7 @@ def llm_rerank(user_query: str, hits: List[Hit]) -> Optional[List[Tuple[float, H
         return scored
     except Exception: return None
 
+@stage("generate_answer")
 def generate_answer(user_query:str,l1:str,l2:str,l3:str)->str:
     system_msg=("You are Advotac Legal AI, precision-based assistant for Indian law. Use the retrieved context (L1–L3).")
     user_msg=f"""
@@ -236,17 +263,21 @@ If unclear → say "No directly relevant section found."
 """
     r=llm.chat.completions.create(model=AZURE_OPENAI_CHAT_DEPLOYMENT_NAME,temperature=0.1,max_tokens=900,
         messages=[{"role":"system","content":system_msg},{"role":"user","content":user_msg}])
+    record_usage(r)
     return r.choices[0].message.content.strip()
 
+@stage("validate_citations")
 def validate_citations(ans,l1,l2,l3):
     sys_msg=("You are a legal citation validator. Check that all Acts/sections cited exist in retrieved context. Respond with '✅ Verified' or '⚠️ Possibly inaccurate'.")
     user_msg=f"Answer:\n{ans}\n\nContext:\nL1:{l1}\nL2:{l2}\nL3:{l3}"
     try:
         r=llm.chat.completions.create(model=AZURE_OPENAI_CHAT_DEPLOYMENT_NAME,temperature=0,max_tokens=200,
             messages=[{"role":"system","content":sys_msg},{"role":"user","content":user_msg}])
+        record_usage(r)
         return r.choices[0].message.content.strip()
     except Exception as e: return f"(validator error: {e})"
 
+@stage("generate_answer_fallback")
 def generate_answer_fallback(user_query: str) -> str:
     """
     Produce a best-effort answer even when retrieval returns no context.
@@ -278,6 +309,7 @@ def generate_answer_fallback(user_query: str) -> str:
             {"role": "user", "content": user_msg},
         ],
     )
+    record_usage(r)
     return r.choices[0].message.content.strip()
 
 
@@ -290,7 +322,15 @@ def answer_query(
     """
     Execute the Advotac multi-collection pipeline and return a structured response.
     Mirrors the CLI behaviour so that even in low-retrieval scenarios the LLM still responds.
+    The response carries per-stage timings and token usage.
     """
+    with instrumentation.trace("query-v2") as run:
+        response = _answer_query(query, top_k=top_k, threshold=threshold, validate=validate)
+    response.timings = run.timings()
+    return response
+
+
+def _answer_query(query: str, top_k: int, threshold: float, validate: bool) -> AnswerResponse:
     normalized_query = (query or "").strip()
     if not normalized_query:
         raise ValueError("Query must not be empty.")
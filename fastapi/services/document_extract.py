@@ -0,0 +1,488 @@
+"""
+Text extraction for uploaded documents.
+
+PDF parsing is CPU-bound, so pages are extracted in a process pool instead of
+the API worker's thread pool, where it would hold the GIL for every other
+request. Pages are handed out in small batches, cleaned one at a time inside
+the workers and collected in order; extraction stops as soon as the caller's
+character budget is filled, so a 900-page filing costs no more than the pages
+that can actually be sent to the model. Serverless hosts (``VERCEL=1``) have no
+shared memory for the pool's locks, so there, and whenever the pool cannot be
+started or fed, pages are extracted inline instead.
+
+DOCX and plain-text files go through the same budget. DOCX bodies are
+streamed paragraph by paragraph out of ``word/document.xml`` (python-docx would
+build the whole element tree first) and text files are decoded in fixed-size
+chunks, so neither is ever held in memory as one string.
+"""
+
+from __future__ import annotations
+
+import codecs
+import io
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple, Union
+
+from lxml import etree
+from pydantic import BaseModel
+from PyPDF2 import PdfReader
+
+from services.text_normalize import normalize_text
+
+logger = logging.getLogger(__name__)
+
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "4"))
+# Documents this short are parsed inline; shipping them to a worker costs more than it saves.
+PDF_INLINE_MAX_PAGES = int(os.getenv("PDF_INLINE_MAX_PAGES", "4"))
+PDF_TASK_TIMEOUT_SECONDS = float(os.getenv("PDF_TASK_TIMEOUT_SECONDS", "30"))
+PDF_POOL_ENABLED = os.getenv("VERCEL") != "1" and os.getenv("PDF_POOL_ENABLED", "true").lower() in {"1", "true", "yes"}
+
+PAGE_SEPARATOR = "\n\n"
+TXT_CHUNK_BYTES = 256 * 1024
+
+DocumentSource = Union[bytes, mmap.mmap]
+PdfSource = DocumentSource
+
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_DOCX_PARAGRAPH = f"{_W_NS}p"
+_DOCX_TEXT = f"{_W_NS}t"
+_DOCX_BREAKS = {f"{_W_NS}tab": "\t", f"{_W_NS}br": "\n", f"{_W_NS}cr": "\n"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# Set once the pool fails to start (e.g. no /dev/shm); later documents go inline straight away.
+_pool_unavailable = False
+
+# Per-worker cache so a process parses the cross-reference table once per document. It holds one
+# document, keyed by (path, mtime, size) so a reused temp path is never served from a stale copy.
+_worker_reader: Tuple[Optional[Tuple[str, int, int]], Optional[PdfReader]] = (None, None)
+
+
+class UnsupportedDocumentError(ValueError):
+    """Raised for file types that have no extractor."""
+
+
+class ExtractionStats(BaseModel):
+    """Timing details for a document extraction, returned alongside the analysis."""
+
+    # "page" for PDFs, "paragraph" for DOCX, "chunk" for text files.
+    unit: str = "page"
+    # None when a streamed document was cut off before its end was reached.
+    pages_total: Optional[int]
+    pages_read: int
+    stopped_early: bool
+    # Why extraction stopped early: "budget" (the character budget was filled, the same
+    # every time) or "timeout" (a page batch ran too long in the pool); None when finished.
+    stop_reason: Optional[str] = None
+    elapsed_ms: float
+    # Per-page timings; PDFs only.
+    page_timings_ms: List[float]
+
+    @property
+    def deterministic(self) -> bool:
+        """Whether the same file and budget always extract to this text."""
+        return self.stop_reason != "timeout"
+
+
+@dataclass
+class ExtractedText:
+    text: str
+    stats: ExtractionStats
+
+
+def clean_text(text: str) -> str:
+    """Normalize whitespace and strip non-printable characters before analysis."""
+    return normalize_text(text)
+
+
+def _extract_page(reader: PdfReader, index: int) -> Tuple[str, float]:
+    started = time.perf_counter()
+    try:
+        content = reader.pages[index].extract_text() or ""
+    except Exception:
+        content = ""
+    return clean_text(content), (time.perf_counter() - started) * 1000
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> List[Tuple[str, float]]:
+    """Worker entry point: extract and clean pages ``start``..``stop - 1`` of the PDF at ``path``."""
+    global _worker_reader
+    cached_key, reader = _worker_reader
+    try:
+        info = os.stat(path)
+    except OSError:
+        # The file is gone; so is any reason to keep the previous document in memory.
+        _worker_reader = (None, None)
+        return [("", 0.0)] * (stop - start)
+    key = (path, info.st_mtime_ns, info.st_size)
+    if cached_key != key or reader is None:
+        _worker_reader = (None, None)
+        try:
+            reader = PdfReader(path)
+        except Exception:
+            return [("", 0.0)] * (stop - start)
+        _worker_reader = (key, reader)
+    return [_extract_page(reader, index) for index in range(start, stop)]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _pool_unavailable
+    with _pool_lock:
+        if _pool is None:
+            try:
+                _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS)
+            except (OSError, NotImplementedError, ImportError):
+                _pool_unavailable = True
+                raise
+        return _pool
+
+
+def _use_pool(total: int) -> bool:
+    return PDF_POOL_ENABLED and not _pool_unavailable and PDF_EXTRACT_WORKERS > 1 and total > PDF_INLINE_MAX_PAGES
+
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def shutdown_pool() -> None:
+    """Stop the extraction workers; called on application shutdown."""
+    _reset_pool()
+
+
+class _Collector:
+    """Accumulates cleaned pages in order until the character budget is filled."""
+
+    def __init__(self, char_limit: Optional[int]) -> None:
+        self.char_limit = char_limit
+        self.pieces: List[str] = []
+        self.length = 0
+        self.units = 0
+        self.timings: List[float] = []
+        self.timed_out = False
+
+    @property
+    def full(self) -> bool:
+        return self.char_limit is not None and self.length >= self.char_limit
+
+    def add(self, text: str, elapsed_ms: Optional[float] = None) -> None:
+        self.units += 1
+        if elapsed_ms is not None:
+            self.timings.append(round(elapsed_ms, 2))
+        if text:
+            self.length += len(text) + (len(PAGE_SEPARATOR) if self.pieces else 0)
+            self.pieces.append(text)
+
+
+def _extract_inline(reader: PdfReader, total: int, collector: _Collector) -> None:
+    for index in range(total):
+        if collector.full:
+            break
+        collector.add(*_extract_page(reader, index))
+
+
+def _extract_in_pool(pdf_data: PdfSource, total: int, collector: _Collector, path: Optional[str]) -> None:
+    owns_file = path is None
+    if owns_file:
+        fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        if owns_file:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(pdf_data)
+
+        pool = _get_pool()
+        batches = [(start, min(start + PDF_PAGES_PER_TASK, total)) for start in range(0, total, PDF_PAGES_PER_TASK)]
+        pending: Deque[Future] = deque()
+        next_batch = 0
+        window = max(1, PDF_EXTRACT_WORKERS) * 2
+        try:
+            while next_batch < len(batches) or pending:
+                while next_batch < len(batches) and len(pending) < window:
+                    start, stop = batches[next_batch]
+                    pending.append(pool.submit(_extract_page_range, path, start, stop))
+                    next_batch += 1
+                for text, elapsed_ms in pending.popleft().result(timeout=PDF_TASK_TIMEOUT_SECONDS):
+                    collector.add(text, elapsed_ms)
+                if collector.full:
+                    break
+        except FutureTimeoutError:
+            collector.timed_out = True
+            logger.warning("PDF page batch exceeded %.0fs; keeping %d pages", PDF_TASK_TIMEOUT_SECONDS, collector.units)
+        finally:
+            for future in pending:
+                future.cancel()
+    finally:
+        if owns_file:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def extract_pdf(
+    pdf_data: PdfSource,
+    *,
+    max_chars: Optional[int] = None,
+    path: Optional[str] = None,
+) -> ExtractedText:
+    """
+    Extract cleaned text from a PDF, stopping once ``max_chars`` characters
+    have been collected. Malformed files yield an empty result rather than an error.
+
+    ``pdf_data`` may be bytes or an mmap of an uploaded file; pass the file's
+    ``path`` as well so pool workers can open it without another copy.
+    """
+    started = time.perf_counter()
+    collector = _Collector(max_chars)
+    total = 0
+
+    if pdf_data:
+        try:
+            stream = pdf_data if isinstance(pdf_data, mmap.mmap) else io.BytesIO(pdf_data)
+            reader = PdfReader(stream)
+            total = len(reader.pages)
+        except Exception:
+            reader = None
+
+        if reader is not None and total:
+            if not _use_pool(total):
+                _extract_inline(reader, total, collector)
+            else:
+                try:
+                    _extract_in_pool(pdf_data, total, collector, path)
+                except Exception as exc:
+                    # Creating or feeding the pool failed (BrokenProcessPool, OSError without
+                    # /dev/shm, ...); the document is still readable in this process.
+                    logger.warning("PDF extraction pool unavailable (%r); extracting inline", exc)
+                    if isinstance(exc, BrokenProcessPool):
+                        _reset_pool()
+                    collector = _Collector(max_chars)
+                    _extract_inline(reader, total, collector)
+
+    text = PAGE_SEPARATOR.join(collector.pieces)
+    stopped_early = collector.units < total
+    stats = ExtractionStats(
+        pages_total=total,
+        pages_read=collector.units,
+        stopped_early=stopped_early,
+        stop_reason=("timeout" if collector.timed_out else "budget") if stopped_early else None,
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+        page_timings_ms=collector.timings,
+    )
+    if total:
+        slowest = max(collector.timings) if collector.timings else 0.0
+        logger.info(
+            "Extracted %d/%d PDF pages in %.1fms (slowest page %.1fms)",
+            stats.pages_read,
+            stats.pages_total,
+            stats.elapsed_ms,
+            slowest,
+        )
+    return ExtractedText(text=text, stats=stats)
+
+
+def _docx_paragraphs(stream) -> Iterator[str]:
+    """Yield the raw text of each ``w:p`` in document order, discarding parsed elements as it goes."""
+    for _, paragraph in etree.iterparse(
+        stream, events=("end",), tag=_DOCX_PARAGRAPH, resolve_entities=False, no_network=True
+    ):
+        parts = []
+        for node in paragraph.iter():
+            if node.tag == _DOCX_TEXT:
+                parts.append(node.text or "")
+            elif node.tag in _DOCX_BREAKS:
+                parts.append(_DOCX_BREAKS[node.tag])
+        yield "".join(parts)
+        paragraph.clear(keep_tail=True)
+        while paragraph.getprevious() is not None:
+            del paragraph.getparent()[0]
+
+
+def extract_docx(
+    docx_data: DocumentSource,
+    *,
+    max_chars: Optional[int] = None,
+    path: Optional[str] = None,
+) -> ExtractedText:
+    """
+    Extract cleaned text from a DOCX body paragraph by paragraph, stopping once
+    ``max_chars`` characters have been collected. Malformed files yield an empty result.
+    """
+    started = time.perf_counter()
+    collector = _Collector(max_chars)
+    finished = True
+
+    if docx_data:
+        try:
+            # zipfile needs a seekable file object, which mmap is not; uploads on disk come with a path.
+            source = path or io.BytesIO(docx_data)
+            with zipfile.ZipFile(source) as archive, archive.open("word/document.xml") as body:
+                for paragraph in _docx_paragraphs(body):
+                    if collector.full or not _add_capped(collector, paragraph):
+                        finished = False
+                        break
+        except (zipfile.BadZipFile, KeyError, etree.LxmlError, OSError):
+            logger.warning("Could not read DOCX body; keeping %d paragraphs", collector.units)
+    return _finish(collector, "paragraph", started, finished)
+
+
+def _detect_encoding(head: bytes) -> Tuple[str, int]:
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8", len(codecs.BOM_UTF8)
+    for bom, encoding in ((codecs.BOM_UTF16_LE, "utf-16-le"), (codecs.BOM_UTF16_BE, "utf-16-be")):
+        if head.startswith(bom):
+            return encoding, len(bom)
+    return "utf-8", 0
+
+
+def _split_complete(text: str) -> Tuple[str, str]:
+    """Split decoded text at its last paragraph (or line) break; the tail waits for the next chunk."""
+    cut = text.rfind("\n\n")
+    if cut < 0:
+        cut = text.rfind("\n")
+    if cut < 0:
+        return "", text
+    return text[:cut], text[cut:]
+
+
+def _room(collector: _Collector) -> Optional[int]:
+    """Characters left in the collector's budget, after the separator; None without a budget."""
+    if collector.char_limit is None:
+        return None
+    return max(0, collector.char_limit - collector.length - (len(PAGE_SEPARATOR) if collector.pieces else 0))
+
+
+def _add_capped(collector: _Collector, text: str) -> bool:
+    """Add ``text``, cut to the remaining budget; returns False if any of it was cut."""
+    room = _room(collector)
+    if room is not None and len(text) > room:
+        if room:
+            collector.add(clean_text(text[:room]))
+        return False
+    collector.add(clean_text(text))
+    return True
+
+
+def _decode_chunks(data: DocumentSource, encoding: str, offset: int, errors: str, collector: _Collector) -> bool:
+    """Feed ``data`` to ``collector`` one chunk at a time; returns True if the whole file was read."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    pending = ""
+    size = len(data)
+    for start in range(offset, size, TXT_CHUNK_BYTES):
+        if collector.full:
+            return False
+        final = start + TXT_CHUNK_BYTES >= size
+        decoded = pending + decoder.decode(data[start:start + TXT_CHUNK_BYTES], final=final)
+        complete, pending = (decoded, "") if final else _split_complete(decoded)
+        if complete and not _add_capped(collector, complete):
+            return False
+        room = _room(collector)
+        if room is not None and len(pending) > room:
+            # A line longer than the rest of the budget; its end is never needed.
+            _add_capped(collector, pending)
+            return False
+    if pending:
+        if collector.full:
+            return False
+        return _add_capped(collector, pending)
+    return True
+
+
+def extract_txt(
+    txt_data: DocumentSource,
+    *,
+    max_chars: Optional[int] = None,
+    path: Optional[str] = None,
+) -> ExtractedText:
+    """
+    Decode and clean a text file in ``TXT_CHUNK_BYTES`` chunks, stopping once
+    ``max_chars`` characters have been collected. UTF-8 and UTF-16 (with a BOM)
+    are recognised; anything that is not valid UTF-8 is read as Windows-1252.
+    """
+    started = time.perf_counter()
+    collector = _Collector(max_chars)
+    finished = True
+
+    if txt_data:
+        encoding, offset = _detect_encoding(txt_data[:4])
+        # A BOM settles the encoding; only unmarked files fall back to Windows-1252.
+        errors = "strict" if offset == 0 else "replace"
+        try:
+            finished = _decode_chunks(txt_data, encoding, offset, errors, collector)
+        except UnicodeDecodeError:
+            collector = _Collector(max_chars)
+            finished = _decode_chunks(txt_data, "cp1252", 0, "replace", collector)
+    return _finish(collector, "chunk", started, finished)
+
+
+def _finish(collector: _Collector, unit: str, started: float, finished: bool) -> ExtractedText:
+    stats = ExtractionStats(
+        unit=unit,
+        pages_total=collector.units if finished else None,
+        pages_read=collector.units,
+        stopped_early=not finished,
+        stop_reason=None if finished else "budget",
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+        page_timings_ms=[],
+    )
+    if collector.units:
+        logger.info(
+            "Extracted %d %ss in %.1fms%s",
+            stats.pages_read,
+            unit,
+            stats.elapsed_ms,
+            " (stopped at the character budget)" if stats.stopped_early else "",
+        )
+    return ExtractedText(text=PAGE_SEPARATOR.join(collector.pieces), stats=stats)
+
+
+_EXTRACTORS: Dict[str, Callable[..., ExtractedText]] = {
+    "pdf": extract_pdf,
+    "docx": extract_docx,
+    "txt": extract_txt,
+}
+SUPPORTED_EXTENSIONS = tuple(_EXTRACTORS)
+
+
+def extract_document(
+    data: DocumentSource,
+    *,
+    extension: str,
+    max_chars: Optional[int] = None,
+    path: Optional[str] = None,
+) -> ExtractedText:
+    """Dispatch to the extractor for ``extension`` (``pdf``, ``docx`` or ``txt``)."""
+    extractor = _EXTRACTORS.get(extension.lower().lstrip("."))
+    if extractor is None:
+        raise UnsupportedDocumentError(f"Unsupported document type '{extension}'.")
+    return extractor(data, max_chars=max_chars, path=path)
+
+
+__all__ = [
+    "DocumentSource",
+    "ExtractedText",
+    "ExtractionStats",
+    "SUPPORTED_EXTENSIONS",
+    "UnsupportedDocumentError",
+    "clean_text",
+    "extract_document",
+    "extract_docx",
+    "extract_pdf",
+    "extract_txt",
+    "shutdown_pool",
+]
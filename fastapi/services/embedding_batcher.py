@@ -0,0 +1,59 @@
+"""
+Cross-request micro-batching for query embeddings.
+
+Every ``/query`` and ``/query-v2`` request embeds one short query string.
+Under load that turns into dozens of single-input embedding calls at once,
+each counted against the deployment's request rate. An ``EmbeddingBatcher``
+holds each query for up to ``EMBED_BATCH_WINDOW_MS`` (or until
+``EMBED_BATCH_MAX_INPUTS`` queries are waiting), sends them as one list-input
+``embeddings.create`` call and hands every caller its own vector. Identical
+queries in the same batch are embedded once. See ``services.micro_batch``.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Callable, List
+
+from services.micro_batch import MicroBatcher
+
+EMBED_BATCH_ENABLED = os.getenv("EMBED_BATCH_ENABLED", "true").lower() in {"1", "true", "yes"}
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX_INPUTS = int(os.getenv("EMBED_BATCH_MAX_INPUTS", "64"))
+EMBED_BATCH_CONCURRENCY = int(os.getenv("EMBED_BATCH_CONCURRENCY", "4"))
+
+EmbedMany = Callable[[List[str]], List[List[float]]]
+
+
+class EmbeddingBatcher(MicroBatcher[str, List[float]]):
+    """Collects single-text embedding requests and sends them as list-input calls."""
+
+    def __init__(
+        self,
+        embed_many: EmbedMany,
+        *,
+        name: str,
+        window_ms: float = EMBED_BATCH_WINDOW_MS,
+        max_inputs: int = EMBED_BATCH_MAX_INPUTS,
+        concurrency: int = EMBED_BATCH_CONCURRENCY,
+        enabled: bool = EMBED_BATCH_ENABLED,
+    ) -> None:
+        super().__init__(
+            embed_many,
+            name=f"{name}.embed",
+            window_ms=window_ms,
+            max_items=max_inputs,
+            concurrency=concurrency,
+            enabled=enabled,
+        )
+
+    def embed(self, text: str) -> List[float]:
+        return self.call(text)
+
+
+__all__ = [
+    "EMBED_BATCH_ENABLED",
+    "EMBED_BATCH_MAX_INPUTS",
+    "EMBED_BATCH_WINDOW_MS",
+    "EmbeddingBatcher",
+]
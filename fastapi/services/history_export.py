@@ -0,0 +1,172 @@
+"""
+Streaming export of assistant and general task history.
+
+Both history tables are read through server-side cursors (``yield_per``) and
+merged by ``created_at`` so memory stays bounded no matter how many rows a
+user has. Output is NDJSON or CSV, optionally gzip-compressed on the fly.
+"""
+
+from __future__ import annotations
+
+import csv
+import heapq
+import io
+import json
+import zlib
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from database import SessionLocal, AssistantHistoryDB, GeneralTaskHistoryDB
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_FIELDS = [
+    "entry_type",
+    "id",
+    "user_id",
+    "task_name",
+    "question",
+    "answer",
+    "created_at",
+    "response_time_ms",
+    "token",
+]
+YIELD_PER = 500
+FLUSH_BYTES = 64 * 1024
+
+
+def _assistant_rows(db, user_id: Optional[str]) -> Iterator[Dict[str, Any]]:
+    query = db.query(
+        AssistantHistoryDB.id,
+        AssistantHistoryDB.user_id,
+        AssistantHistoryDB.task_name,
+        AssistantHistoryDB.question,
+        AssistantHistoryDB.answer,
+        AssistantHistoryDB.created_at,
+        AssistantHistoryDB.response_time_ms,
+    )
+    if user_id:
+        query = query.filter(AssistantHistoryDB.user_id == user_id)
+    query = query.order_by(AssistantHistoryDB.created_at.desc(), AssistantHistoryDB.id.desc())
+    for row in query.execution_options(yield_per=YIELD_PER):
+        yield {
+            "entry_type": "analysis",
+            "id": row.id,
+            "user_id": row.user_id,
+            "task_name": row.task_name,
+            "question": row.question,
+            "answer": row.answer,
+            "created_at": row.created_at,
+            "response_time_ms": row.response_time_ms,
+            "token": None,
+        }
+
+
+def _general_rows(db, user_id: Optional[str]) -> Iterator[Dict[str, Any]]:
+    # Only scalar columns are selected so the payload blobs never leave the database.
+    query = db.query(
+        GeneralTaskHistoryDB.id,
+        GeneralTaskHistoryDB.user_id,
+        GeneralTaskHistoryDB.task_name,
+        GeneralTaskHistoryDB.query,
+        GeneralTaskHistoryDB.answer,
+        GeneralTaskHistoryDB.created_at,
+        GeneralTaskHistoryDB.token,
+    )
+    if user_id:
+        query = query.filter(GeneralTaskHistoryDB.user_id == user_id)
+    query = query.order_by(GeneralTaskHistoryDB.created_at.desc(), GeneralTaskHistoryDB.id.desc())
+    for row in query.execution_options(yield_per=YIELD_PER):
+        yield {
+            "entry_type": "general",
+            "id": row.id,
+            "user_id": row.user_id,
+            "task_name": row.task_name,
+            "question": row.query,
+            "answer": row.answer,
+            "created_at": row.created_at,
+            "response_time_ms": None,
+            "token": row.token,
+        }
+
+
+def _encode_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    for row in rows:
+        row["created_at"] = row["created_at"].isoformat() if row["created_at"] else None
+        buffer.write(json.dumps(row, ensure_ascii=False))
+        buffer.write("\n")
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _encode_csv(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        row["created_at"] = row["created_at"].isoformat() if row["created_at"] else ""
+        writer.writerow(row)
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def iter_history_export(
+    user_id: Optional[str],
+    *,
+    fmt: str = "ndjson",
+    compress: bool = False,
+) -> Iterator[bytes]:
+    """
+    Yield the encoded history export for one user, or for every user when
+    ``user_id`` is None. Opens its own session so it can outlive the request
+    dependency while the response is streamed.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{fmt}'.")
+
+    db = SessionLocal()
+    try:
+        rows = heapq.merge(
+            _assistant_rows(db, user_id),
+            _general_rows(db, user_id),
+            key=lambda row: row["created_at"],
+            reverse=True,
+        )
+        chunks = _encode_ndjson(rows) if fmt == "ndjson" else _encode_csv(rows)
+        if compress:
+            chunks = _gzip_chunks(chunks)
+        yield from chunks
+    finally:
+        db.close()
+
+
+def export_filename(fmt: str, compress: bool, prefix: str = "history") -> str:
+    return f"{prefix}.{fmt}{'.gz' if compress else ''}"
+
+
+def export_media_type(fmt: str, compress: bool) -> str:
+    return "application/gzip" if compress else EXPORT_FORMATS[fmt]
+
+
+__all__ = [
+    "EXPORT_FORMATS",
+    "export_filename",
+    "export_media_type",
+    "iter_history_export",
+]
@@ -0,0 +1,141 @@
+"""
+Per-stage latency and token accounting for the RAG pipelines.
+
+``answer_query`` in both pipelines runs inside ``trace(pipeline)``. Functions
+decorated with ``@stage`` (rewrite, embed, search, rerank, generate,
+validate) add their wall time to the current trace, and ``record_usage``
+adds the ``usage`` token counts of a chat completion to the stage it was made
+in. The trace is carried in a context variable, so it follows the request
+into ``run_in_threadpool`` and nothing has to be passed around.
+
+Every stage also feeds the ``rag_stage_seconds`` histogram and the
+``rag_llm_tokens_total`` counter on ``/metrics``. ``Trace.timings()`` gives
+the ``PipelineTimings`` attached to ``AnswerResponse`` and stored with the
+assistant history. Outside a trace (the CLI) the decorators do nothing.
+"""
+
+from __future__ import annotations
+
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+
+from pydantic import BaseModel
+
+from services import metrics
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+STAGE_SECONDS = metrics.Histogram(
+    "rag_stage_seconds",
+    "Wall time of one RAG pipeline stage; stage=total covers the whole pipeline.",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32),
+    labels=("pipeline", "stage"),
+)
+LLM_TOKENS = metrics.Counter(
+    "rag_llm_tokens_total",
+    "Tokens reported in completion usage, by pipeline stage; kind is prompt or completion.",
+    labels=("pipeline", "stage", "kind"),
+)
+
+
+class StageTokens(BaseModel):
+    prompt: int = 0
+    completion: int = 0
+
+
+class PipelineTimings(BaseModel):
+    total_ms: float
+    stages_ms: Dict[str, float]
+    tokens: Dict[str, StageTokens] = {}
+
+
+@dataclass
+class Trace:
+    pipeline: str
+    started: float = field(default_factory=time.perf_counter)
+    stages_ms: Dict[str, float] = field(default_factory=dict)
+    tokens: Dict[str, StageTokens] = field(default_factory=dict)
+    current_stage: Optional[str] = None
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages_ms[name] = self.stages_ms.get(name, 0.0) + seconds * 1000
+        STAGE_SECONDS.observe(seconds, pipeline=self.pipeline, stage=name)
+
+    def timings(self) -> PipelineTimings:
+        return PipelineTimings(
+            total_ms=round((time.perf_counter() - self.started) * 1000, 1),
+            stages_ms={name: round(ms, 1) for name, ms in self.stages_ms.items()},
+            tokens={name: usage.model_copy() for name, usage in self.tokens.items()},
+        )
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("rag_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def trace(pipeline: str) -> Iterator[Trace]:
+    """Collect stage timings and token usage for one pipeline run."""
+    run = Trace(pipeline=pipeline)
+    token = _current.set(run)
+    try:
+        yield run
+    finally:
+        _current.reset(token)
+        STAGE_SECONDS.observe(time.perf_counter() - run.started, pipeline=pipeline, stage="total")
+
+
+def stage(name: str) -> Callable[[F], F]:
+    """Decorator timing calls to the wrapped function as pipeline stage ``name``."""
+
+    def decorate(fn: F) -> F:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            run = _current.get()
+            if run is None:
+                return fn(*args, **kwargs)
+            outer, run.current_stage = run.current_stage, name
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                run.add_stage(name, time.perf_counter() - started)
+                run.current_stage = outer
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def record_usage(response: Any) -> None:
+    """Add a completion's ``usage`` to the stage it was made in; ignores responses without usage."""
+    run = _current.get()
+    usage = getattr(response, "usage", None)
+    if run is None or usage is None:
+        return
+    name = run.current_stage or "other"
+    prompt = int(getattr(usage, "prompt_tokens", 0) or 0)
+    completion = int(getattr(usage, "completion_tokens", 0) or 0)
+    totals = run.tokens.setdefault(name, StageTokens())
+    totals.prompt += prompt
+    totals.completion += completion
+    LLM_TOKENS.inc(prompt, pipeline=run.pipeline, stage=name, kind="prompt")
+    LLM_TOKENS.inc(completion, pipeline=run.pipeline, stage=name, kind="completion")
+
+
+__all__ = [
+    "PipelineTimings",
+    "StageTokens",
+    "Trace",
+    "current_trace",
+    "record_usage",
+    "stage",
+    "trace",
+]
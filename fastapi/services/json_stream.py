@@ -0,0 +1,106 @@
+"""
+Incremental parser for a JSON object that arrives in pieces.
+
+The analysis prompt asks the model for one flat JSON object. When the
+completion is streamed, ``JsonObjectStream`` is fed each delta and returns the
+top-level members whose values are complete, so ``summary`` can be shown while
+``analysis`` is still being generated. Anything before the opening brace (a
+code fence, say) is skipped; the full text is still parsed with ``json.loads``
+once the stream ends, so this parser only decides *when* a member is ready.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, List, Optional, Tuple
+
+_WHITESPACE = " \t\r\n"
+
+
+class JsonObjectStream:
+    """Feed chunks of ``{"key": value, ...}``; get back ``(key, value)`` pairs as each value completes."""
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        # "key" -> expecting a key, "colon", "value", "after" -> expecting "," or "}".
+        self._phase = "key"
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def _complete(self, end: int) -> List[Tuple[str, Any]]:
+        raw = self._buffer[self._value_start:end]
+        key, self._key, self._value_start = self._key, None, None
+        self._phase = "after"
+        try:
+            return [(key, json.loads(raw))]
+        except (TypeError, ValueError):
+            return []
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume ``chunk`` and return the members completed by it, in document order."""
+        if self._done or not chunk:
+            return []
+        self._buffer += chunk
+        members: List[Tuple[str, Any]] = []
+        buffer = self._buffer
+        for index in range(self._pos, len(buffer)):
+            char = buffer[index]
+            if not self._started:
+                if char == "{":
+                    self._started, self._depth = True, 1
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        if self._phase == "key":
+                            self._key = json.loads(buffer[self._string_start:index + 1])
+                            self._phase = "colon"
+                        elif self._phase == "value":
+                            members.extend(self._complete(index + 1))
+                continue
+
+            if self._phase == "value" and self._value_start is None and char not in _WHITESPACE:
+                self._value_start = index
+            if char == '"':
+                self._in_string = True
+                self._string_start = index
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._phase == "value" and self._value_start is not None:
+                        members.extend(self._complete(index))
+                    self._done = True
+                    self._pos = index + 1
+                    return members
+                if self._depth == 1 and self._phase == "value":
+                    members.extend(self._complete(index + 1))
+            elif self._depth == 1:
+                if char == ":" and self._phase == "colon":
+                    self._phase = "value"
+                elif char == ",":
+                    if self._phase == "value" and self._value_start is not None:
+                        members.extend(self._complete(index))
+                    self._phase = "key"
+        self._pos = len(buffer)
+        return members
+
+
+__all__ = ["JsonObjectStream"]
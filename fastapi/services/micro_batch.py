@@ -0,0 +1,153 @@
+"""
+Cross-request micro-batching for calls that have a list-input variant.
+
+Under load, many request threads make the same kind of small call at once
+(embed one query, search one vector). A ``MicroBatcher`` holds each item for
+up to ``window_ms`` (or until ``max_items`` are waiting), passes them to
+``send`` as one list and resolves every caller's future with its own result.
+Equal items in one batch are sent once, so items must be hashable. When a
+batched call raises, the batch is split in half and each half retried, so
+one bad item fails only the callers that asked for it.
+
+Callers block on a future, so batchers work from the thread pool that runs
+the synchronous pipelines. The collecting thread is started lazily and again
+after a fork, so Celery and process-pool workers each get their own. Batch
+sizes, call latency and failures are recorded in ``services.metrics`` under
+the batcher's name.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+BATCH_SIZE = metrics.Histogram(
+    "micro_batch_size",
+    "Distinct items sent per batched call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+    labels=("batcher",),
+)
+BATCH_LATENCY = metrics.Histogram(
+    "micro_batch_seconds",
+    "Duration of batched calls.",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    labels=("batcher",),
+)
+BATCH_FAILURES = metrics.Counter(
+    "micro_batch_failures_total",
+    "Batched calls that raised.",
+    labels=("batcher",),
+)
+
+
+class MicroBatcher(Generic[T, R]):
+    """Collects single items from many threads and sends them through one list-input call."""
+
+    def __init__(
+        self,
+        send: Callable[[List[T]], List[R]],
+        *,
+        name: str,
+        window_ms: float,
+        max_items: int,
+        concurrency: int = 4,
+        enabled: bool = True,
+    ) -> None:
+        self.send = send
+        self.name = name
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_items = max(1, max_items)
+        self.concurrency = max(1, concurrency)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._queue: "queue.Queue[Tuple[T, Future]]" = queue.Queue()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _ensure_started(self) -> None:
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # Fresh state after a fork: the parent's thread and pool do not exist here.
+            self._queue = queue.Queue()
+            self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"batch-{self.name}")
+            threading.Thread(target=self._collect, name=f"batcher-{self.name}", daemon=True).start()
+            self._pid = pid
+
+    def submit(self, item: T) -> Future:
+        """Queue ``item`` for the next batch; the future resolves to its result."""
+        future: Future = Future()
+        if not self.enabled:
+            self._flush([(item, future)])
+            return future
+        self._ensure_started()
+        self._queue.put((item, future))
+        return future
+
+    def call(self, item: T) -> R:
+        return self.submit(item).result()
+
+    def _collect(self) -> None:
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_items:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(pending.get(timeout=remaining) if remaining > 0 else pending.get_nowait())
+                except queue.Empty:
+                    break
+            self._pool.submit(self._flush, batch)
+
+    def _send_isolating(self, items: List[T], results: Dict[T, R], errors: Dict[T, Exception]) -> None:
+        """Send ``items``; on failure bisect until each error is pinned to the items that cause it."""
+        try:
+            batch_results = self.send(items)
+            if len(batch_results) != len(items):
+                raise RuntimeError(f"Expected {len(items)} results, got {len(batch_results)}")
+        except Exception as exc:
+            BATCH_FAILURES.inc(batcher=self.name)
+            if len(items) == 1:
+                logger.warning("Item for %s failed: %s", self.name, exc)
+                errors[items[0]] = exc
+                return
+            logger.warning("Batch of %d for %s failed, retrying in halves: %s", len(items), self.name, exc)
+            middle = len(items) // 2
+            self._send_isolating(items[:middle], results, errors)
+            self._send_isolating(items[middle:], results, errors)
+            return
+        results.update(zip(items, batch_results))
+
+    def _flush(self, batch: List[Tuple[T, Future]]) -> None:
+        unique = list(dict.fromkeys(item for item, _ in batch))
+        BATCH_SIZE.observe(len(unique), batcher=self.name)
+        results: Dict[T, R] = {}
+        errors: Dict[T, Exception] = {}
+        started = time.perf_counter()
+        try:
+            self._send_isolating(unique, results, errors)
+        finally:
+            BATCH_LATENCY.observe(time.perf_counter() - started, batcher=self.name)
+        for item, future in batch:
+            if item in errors:
+                future.set_exception(errors[item])
+            else:
+                future.set_result(results[item])
+
+__all__ = ["BATCH_FAILURES", "BATCH_LATENCY", "BATCH_SIZE", "MicroBatcher"]
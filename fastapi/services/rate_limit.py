@@ -0,0 +1,61 @@
+"""
+Process-wide limits for Azure OpenAI chat calls.
+
+Azure deployments are provisioned in tokens per minute (TPM). With map-reduce,
+batch analysis and follow-up questions all calling the model from worker
+threads, the limiter keeps the process under that budget instead of collecting
+429s: each call reserves its estimated tokens (prompt plus the output cap)
+from a bucket that refills continuously at ``AZURE_OPENAI_TPM / 60`` per
+second, and at most ``ANALYSIS_LLM_CONCURRENCY`` calls are in flight at once.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+AZURE_OPENAI_TPM = int(os.getenv("AZURE_OPENAI_TPM", "0"))  # 0 disables the token budget
+ANALYSIS_LLM_CONCURRENCY = int(os.getenv("ANALYSIS_LLM_CONCURRENCY", "16"))
+
+
+class TokenRateLimiter:
+    """Token bucket over tokens per minute combined with a cap on concurrent calls."""
+
+    def __init__(self, tokens_per_minute: int = AZURE_OPENAI_TPM, max_concurrency: int = ANALYSIS_LLM_CONCURRENCY):
+        self.capacity = float(tokens_per_minute)
+        self.refill_per_second = tokens_per_minute / 60.0
+        self._available = self.capacity
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._available = min(self.capacity, self._available + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def _reserve(self, tokens: int) -> None:
+        if self.capacity <= 0:
+            return
+        # A single call larger than the whole budget waits for a full bucket rather than forever.
+        needed = min(float(tokens), self.capacity)
+        with self._condition:
+            while True:
+                self._refill()
+                if self._available >= needed:
+                    self._available -= needed
+                    return
+                self._condition.wait((needed - self._available) / self.refill_per_second)
+
+    @contextmanager
+    def acquire(self, tokens: int) -> Iterator[None]:
+        """Hold a concurrency slot and ``tokens`` of the per-minute budget for one call."""
+        with self._slots:
+            self._reserve(tokens)
+            yield
+
+
+__all__ = ["ANALYSIS_LLM_CONCURRENCY", "AZURE_OPENAI_TPM", "TokenRateLimiter"]
@@ -0,0 +1,93 @@
+"""
+Cross-request coalescing of Qdrant vector searches, per collection.
+
+``qdrant_search`` and ``multi_search`` used to send one HTTP search per
+request per collection. A ``SearchBatcher`` keeps one ``MicroBatcher`` per
+collection: concurrent searches against the same collection wait up to
+``SEARCH_BATCH_WINDOW_MS`` and go out as a single ``search_batch`` call whose
+results are fanned back to the callers. The Qdrant client is looked up
+through ``client`` on every batch, so the module-level client can be swapped
+(for tests or an in-memory instance) at any time. Searches that pass
+``with_vectors=True`` get the point vectors back as well.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+from qdrant_client import QdrantClient, models
+
+from services.micro_batch import MicroBatcher
+
+SEARCH_BATCH_ENABLED = os.getenv("SEARCH_BATCH_ENABLED", "true").lower() in {"1", "true", "yes"}
+SEARCH_BATCH_WINDOW_MS = float(os.getenv("SEARCH_BATCH_WINDOW_MS", "2"))
+SEARCH_BATCH_MAX_REQUESTS = int(os.getenv("SEARCH_BATCH_MAX_REQUESTS", "32"))
+SEARCH_BATCH_CONCURRENCY = int(os.getenv("SEARCH_BATCH_CONCURRENCY", "4"))
+
+
+class SearchQuery(NamedTuple):
+    vector: Tuple[float, ...]
+    limit: int
+    with_vectors: bool = False
+
+
+class SearchBatcher:
+    """Per-collection micro-batchers over ``QdrantClient.search_batch``."""
+
+    def __init__(
+        self,
+        client: Callable[[], QdrantClient],
+        *,
+        name: str,
+        window_ms: float = SEARCH_BATCH_WINDOW_MS,
+        max_requests: int = SEARCH_BATCH_MAX_REQUESTS,
+        concurrency: int = SEARCH_BATCH_CONCURRENCY,
+        enabled: bool = SEARCH_BATCH_ENABLED,
+    ) -> None:
+        self.client = client
+        self.name = name
+        self._options = dict(window_ms=window_ms, max_items=max_requests, concurrency=concurrency, enabled=enabled)
+        self._batchers: Dict[str, MicroBatcher[SearchQuery, List[models.ScoredPoint]]] = {}
+        self._lock = threading.Lock()
+
+    def _send(self, collection: str, queries: List[SearchQuery]) -> List[List[models.ScoredPoint]]:
+        requests = [
+            models.SearchRequest(vector=list(query.vector), limit=query.limit, with_payload=True, with_vector=query.with_vectors)
+            for query in queries
+        ]
+        return self.client().search_batch(collection_name=collection, requests=requests)
+
+    def _batcher(self, collection: str) -> MicroBatcher[SearchQuery, List[models.ScoredPoint]]:
+        batcher = self._batchers.get(collection)
+        if batcher is None:
+            with self._lock:
+                batcher = self._batchers.get(collection)
+                if batcher is None:
+                    batcher = MicroBatcher(
+                        lambda queries: self._send(collection, queries),
+                        name=f"{self.name}.search.{collection}",
+                        **self._options,
+                    )
+                    self._batchers[collection] = batcher
+        return batcher
+
+    def submit(self, collection: str, vector: Sequence[float], limit: int, with_vectors: bool = False) -> Future:
+        """Queue one search; the future resolves to its list of ScoredPoint."""
+        return self._batcher(collection).submit(SearchQuery(tuple(vector), limit, with_vectors))
+
+    def search(
+        self, collection: str, vector: Sequence[float], limit: int, with_vectors: bool = False
+    ) -> List[models.ScoredPoint]:
+        return self.submit(collection, vector, limit, with_vectors).result()
+
+
+__all__ = [
+    "SEARCH_BATCH_ENABLED",
+    "SEARCH_BATCH_MAX_REQUESTS",
+    "SEARCH_BATCH_WINDOW_MS",
+    "SearchBatcher",
+    "SearchQuery",
+]
@@ -0,0 +1,74 @@
+"""
+Single-flight coalescing of identical in-flight work.
+
+When the same assistant query arrives many times within a few seconds (a
+statute change in the news, a shared link), each copy used to run the whole
+retrieval and generation pipeline. ``SingleFlight.run`` lets the first caller
+for a key start the work and every concurrent caller with the same key await
+that same task. Nothing is cached: once the task finishes the key is free and
+the next caller runs the pipeline again.
+
+The shared task is shielded, so a caller that disconnects does not cancel it
+for the others. Exceptions reach every caller. Only the pipeline is shared;
+endpoints still do per-caller work such as credits and history themselves.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from services import metrics
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() in {"1", "true", "yes"}
+
+T = TypeVar("T")
+
+CALLS = metrics.Counter(
+    "single_flight_calls_total",
+    "Calls through a single-flight group; role is leader (ran the work) or follower (shared it).",
+    labels=("group", "role"),
+)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Free-text query with whitespace collapsed. Callers key on it and pass it to
+    the pipeline too, so every caller sharing a run gets the answer to its own text.
+    Case is kept: it can matter to retrieval and generation (IPC, Cr.P.C.).
+    """
+    return " ".join((query or "").split())
+
+
+class SingleFlight:
+    """Runs at most one task per key at a time and shares it with concurrent callers."""
+
+    def __init__(self, name: str, *, enabled: bool = SINGLE_FLIGHT_ENABLED) -> None:
+        self.name = name
+        self.enabled = enabled
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def _release(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def run(self, key: Hashable, work: Callable[[], Awaitable[T]]) -> T:
+        """Return the result of ``work()``, or of the identical call already in flight."""
+        if not self.enabled:
+            return await work()
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            CALLS.inc(group=self.name, role="leader")
+            task = asyncio.ensure_future(work())
+            self._inflight[key] = task
+            task.add_done_callback(lambda finished: self._release(key, finished))
+        else:
+            CALLS.inc(group=self.name, role="follower")
+        return await asyncio.shield(task)
+
+
+__all__ = ["SINGLE_FLIGHT_ENABLED", "SingleFlight", "normalize_query"]
@@ -0,0 +1,72 @@
+"""
+Whitespace and control-character normalization for extracted document text.
+
+The old cleaner called ``str.isprintable()`` from a Python generator for every
+character and then made three regex passes. Here every step runs in C:
+
+* ``str.replace`` for line endings, tabs and non-breaking spaces, which
+  extraction produces all the time;
+* ``str.isprintable()`` per line to find the few lines that still hold control
+  or format characters, which then go through ``str.translate`` with a
+  precomputed table;
+* two compiled regexes with literal prefixes to collapse runs of spaces and
+  blank lines in one pass each.
+
+Unicode spaces such as U+2003 (em space) become a plain space instead of being
+dropped, so the words they separate stay separated.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Dict, Optional, Union
+
+_REPLACEMENTS = (("\t", " "), ("\u00a0", " "))
+_SPACE_RUN = re.compile("  +")
+_BLANK_LINES = re.compile("\n\n\n+")
+
+# Code points below this are put in the table at import; the rest on first sight.
+_PRECOMPUTED_LIMIT = 0x3000
+
+
+class _TranslationTable(Dict[int, Union[int, str, None]]):
+    """``str.translate`` table: printable characters map to themselves, spaces to " ", the rest to None."""
+
+    def __missing__(self, cp: int) -> Optional[Union[int, str]]:
+        char = chr(cp)
+        if char.isprintable():
+            value: Optional[Union[int, str]] = cp
+        elif unicodedata.category(char) == "Zs":
+            value = " "
+        else:
+            value = None
+        self[cp] = value
+        return value
+
+
+_TABLE = _TranslationTable()
+for _cp in range(_PRECOMPUTED_LIMIT):
+    _TABLE[_cp]
+del _cp
+
+
+def normalize_text(text: str) -> str:
+    """Normalize whitespace and strip non-printable characters before analysis."""
+    if not text:
+        return ""
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    for old, new in _REPLACEMENTS:
+        text = text.replace(old, new)
+
+    lines = text.split("\n")
+    if not all(map(str.isprintable, lines)):
+        text = "\n".join([line if line.isprintable() else line.translate(_TABLE) for line in lines])
+
+    text = _SPACE_RUN.sub(" ", text)
+    text = _BLANK_LINES.sub("\n\n", text)
+    return text.strip()
+
+
+__all__ = ["normalize_text"]
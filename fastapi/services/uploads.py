@@ -0,0 +1,262 @@
+"""
+Streaming multipart uploads for document analysis.
+
+The request body is parsed as it arrives: form fields are kept in memory
+(they are tiny), while the file part is written to a spool that lives in
+memory up to ``UPLOAD_SPOOL_BYTES`` and on disk beyond that. The size limit is
+enforced per chunk, so an oversized upload is rejected after at most one
+chunk past the limit instead of after it has been buffered in full. Once the
+upload is complete the file is exposed through ``mmap`` so extraction reads
+the page cache rather than a second copy on the heap.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+MAX_FIELD_BYTES = 64 * 1024
+MAX_FIELDS = 16
+# Room for boundaries, part headers and the small form fields on top of the file itself.
+MULTIPART_OVERHEAD_BYTES = MAX_FIELDS * 1024 + MAX_FIELD_BYTES
+
+
+class UploadTooLargeError(Exception):
+    """Raised as soon as an upload grows past the configured limit."""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds the maximum size of {limit} bytes.")
+        self.limit = limit
+
+
+class InvalidUploadError(ValueError):
+    """Raised for malformed multipart bodies."""
+
+
+class SpooledUpload:
+    """An uploaded file kept in memory while small and in a named temp file once large."""
+
+    def __init__(self, filename: str, content_type: Optional[str], max_bytes: int):
+        self.filename = filename
+        self.content_type = content_type
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.path: Optional[str] = None
+        self._buffer = bytearray()
+        self._file = None
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.filename)[1].lower().lstrip(".")
+
+    def _rollover(self) -> None:
+        fd, self.path = tempfile.mkstemp(prefix="upload-", suffix=f".{self.extension or 'bin'}")
+        self._file = os.fdopen(fd, "wb")
+        self._file.write(self._buffer)
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLargeError(self.max_bytes)
+        if self._file is None and self.size > UPLOAD_SPOOL_BYTES:
+            self._rollover()
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._buffer.extend(data)
+
+    @property
+    def on_disk(self) -> bool:
+        return self._file is not None
+
+    def finish(self) -> None:
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+    @contextmanager
+    def open_buffer(self) -> Iterator[Union[bytes, mmap.mmap]]:
+        """Yield the upload as bytes (in memory) or a read-only mmap of the spooled file."""
+        self.finish()
+        if self.path is None:
+            yield bytes(self._buffer)
+            return
+        with open(self.path, "rb") as handle:
+            if self.size == 0:
+                yield b""
+                return
+            view = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield view
+            finally:
+                view.close()
+
+    def close(self) -> None:
+        self.finish()
+        self._buffer = bytearray()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+
+class _StreamingForm:
+    """python-multipart callbacks that route the file part to a SpooledUpload."""
+
+    def __init__(self, file_field: str, max_bytes: int):
+        self.file_field = file_field
+        self.max_bytes = max_bytes
+        self.fields: Dict[str, str] = {}
+        self.upload: Optional[SpooledUpload] = None
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._content_type: Optional[str] = None
+        self._name: Optional[str] = None
+        self._field_data = bytearray()
+        self._writing_file = False
+        self._pending: List[bytes] = []
+
+    def callbacks(self) -> Dict[str, object]:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self) -> None:
+        self._disposition = b""
+        self._content_type = None
+        self._name = None
+        self._field_data = bytearray()
+        self._writing_file = False
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        name = self._header_name.lower()
+        if name == b"content-disposition":
+            self._disposition = self._header_value
+        elif name == b"content-type":
+            self._content_type = self._header_value.decode("latin-1")
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        if b"name" not in options:
+            raise InvalidUploadError('Each form part needs a Content-Disposition "name".')
+        self._name = options[b"name"].decode("utf-8", errors="replace")
+        if b"filename" in options:
+            if self._name != self.file_field or self.upload is not None:
+                raise InvalidUploadError(f"Send exactly one file in the '{self.file_field}' field.")
+            filename = options[b"filename"].decode("utf-8", errors="replace")
+            self.upload = SpooledUpload(filename, self._content_type, self.max_bytes)
+            self._writing_file = True
+        elif len(self.fields) >= MAX_FIELDS:
+            raise InvalidUploadError("Too many form fields.")
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._writing_file:
+            chunk = data[start:end]
+            # Count here so the limit trips on the chunk that crosses it, even before it is written out.
+            if self.upload.size + sum(len(piece) for piece in self._pending) + len(chunk) > self.max_bytes:
+                raise UploadTooLargeError(self.max_bytes)
+            self._pending.append(chunk)
+        else:
+            if len(self._field_data) + (end - start) > MAX_FIELD_BYTES:
+                raise InvalidUploadError(f"Form field '{self._name}' is too large.")
+            self._field_data.extend(data[start:end])
+
+    def on_part_end(self) -> None:
+        if not self._writing_file and self._name is not None:
+            self.fields[self._name] = self._field_data.decode("utf-8", errors="replace")
+
+    def take_pending(self) -> bytes:
+        if not self._pending:
+            return b""
+        data = b"".join(self._pending)
+        self._pending = []
+        return data
+
+
+async def receive_upload(
+    request: Request,
+    *,
+    max_bytes: int,
+    file_field: str = "file",
+) -> Tuple[SpooledUpload, Dict[str, str]]:
+    """
+    Stream a ``multipart/form-data`` request into a SpooledUpload.
+
+    Returns the upload and the remaining text fields. The caller owns the
+    upload and must ``close()`` it. Raises UploadTooLargeError or
+    InvalidUploadError.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise InvalidUploadError("Expected a multipart/form-data request body.")
+
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise UploadTooLargeError(max_bytes)
+
+    form = _StreamingForm(file_field, max_bytes)
+    parser = MultipartParser(params[b"boundary"], form.callbacks())
+
+    async def flush() -> None:
+        data = form.take_pending()
+        if not data:
+            return
+        if form.upload.on_disk or form.upload.size + len(data) > UPLOAD_SPOOL_BYTES:
+            await run_in_threadpool(form.upload.write, data)
+        else:
+            form.upload.write(data)
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            await flush()
+        parser.finalize()
+        await flush()
+    except Exception as exc:
+        if form.upload is not None:
+            form.upload.close()
+        if isinstance(exc, (UploadTooLargeError, InvalidUploadError)):
+            raise
+        raise InvalidUploadError(f"Malformed multipart body: {exc}") from exc
+
+    if form.upload is None:
+        raise InvalidUploadError(f"No file found in the '{file_field}' field.")
+    form.upload.finish()
+    return form.upload, form.fields
+
+
+__all__ = [
+    "InvalidUploadError",
+    "SpooledUpload",
+    "UploadTooLargeError",
+    "receive_upload",
+]
@@ -0,0 +1,321 @@
+"""
+Pre-aggregated latency and usage statistics for the assistant.
+
+New rows in ``assistant_history`` and ``credit_useed`` are folded into
+``assistant_stats_hourly`` (one row per hour, user and task) past a per-table
+id watermark, so each refresh only reads what arrived since the last one.
+Latencies are kept as fixed-bucket histograms, which can be merged across
+rows to answer p50/p95/p99 for any grouping without touching raw history.
+
+Refresh from cron with:
+    python -m services.usage_stats
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database import (
+    SessionLocal,
+    AssistantHistoryDB,
+    AssistantStatsHourlyDB,
+    CreditUsageDB,
+    StatsWatermarkDB,
+)
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (inclusive) in milliseconds; the last bucket catches everything slower.
+LATENCY_BUCKETS_MS: List[int] = [
+    50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 4000, 5000,
+    7500, 10000, 15000, 20000, 30000, 45000, 60000, 90000, 120000,
+]
+HISTOGRAM_SIZE = len(LATENCY_BUCKETS_MS) + 1
+
+REFRESH_BATCH_SIZE = int(os.getenv("STATS_REFRESH_BATCH_SIZE", "5000"))
+REFRESH_INTERVAL_SECONDS = float(os.getenv("STATS_REFRESH_INTERVAL_SECONDS", "60"))
+# Rows younger than this are left for the next refresh and the watermark stops at the first of them, so an
+# insert with a lower id that commits within this window is still counted. One whose transaction stays open
+# longer than STATS_SETTLE_SECONDS can be passed over; raise the setting if writes are held open that long.
+SETTLE_SECONDS = int(os.getenv("STATS_SETTLE_SECONDS", "5"))
+
+GROUP_BY_OPTIONS = ("hour", "task", "user")
+
+_refresh_lock = threading.Lock()
+_last_refresh = 0.0
+
+StatsKey = Tuple[datetime, str, str]
+
+
+def _hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _bucket_index(latency_ms: int) -> int:
+    return bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)
+
+
+def _empty_histogram() -> List[int]:
+    return [0] * HISTOGRAM_SIZE
+
+
+def _merge_histogram(target: List[int], source: Iterable[int]) -> None:
+    for index, count in enumerate(source):
+        if index < HISTOGRAM_SIZE:
+            target[index] += int(count)
+
+
+def histogram_percentile(histogram: List[int], pct: float) -> Optional[float]:
+    """Estimate a percentile by linear interpolation inside the matching bucket."""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = pct / 100.0 * total
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        if not count:
+            continue
+        if cumulative + count >= rank:
+            lower = LATENCY_BUCKETS_MS[index - 1] if index > 0 else 0
+            upper = LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else lower * 2
+            fraction = (rank - cumulative) / count
+            return round(lower + (upper - lower) * fraction, 1)
+        cumulative += count
+    return float(LATENCY_BUCKETS_MS[-1])
+
+
+class _Delta:
+    __slots__ = ("requests", "timed_requests", "total_ms", "histogram", "credits")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.timed_requests = 0
+        self.total_ms = 0
+        self.histogram = _empty_histogram()
+        self.credits = 0
+
+
+def _lock_watermark(db, source: str) -> StatsWatermarkDB:
+    watermark = db.query(StatsWatermarkDB).filter(StatsWatermarkDB.source == source).with_for_update().first()
+    if watermark is None:
+        watermark = StatsWatermarkDB(source=source, last_id=0)
+        db.add(watermark)
+        db.flush()
+    return watermark
+
+
+def _settled(rows: List, cutoff: datetime) -> List:
+    """Rows up to, not including, the first one created at or after ``cutoff`` (rows are in id order)."""
+    for index, row in enumerate(rows):
+        if row.created_at >= cutoff:
+            return rows[:index]
+    return rows
+
+
+def _collect_history(db, watermark: StatsWatermarkDB, cutoff: datetime, deltas: Dict[StatsKey, _Delta]) -> int:
+    rows = (
+        db.query(
+            AssistantHistoryDB.id,
+            AssistantHistoryDB.user_id,
+            AssistantHistoryDB.task_name,
+            AssistantHistoryDB.created_at,
+            AssistantHistoryDB.response_time_ms,
+        )
+        .filter(AssistantHistoryDB.id > watermark.last_id)
+        .order_by(AssistantHistoryDB.id.asc())
+        .limit(REFRESH_BATCH_SIZE)
+        .all()
+    )
+    rows = _settled(rows, cutoff)
+    for row in rows:
+        delta = deltas.setdefault((_hour(row.created_at), row.user_id, row.task_name), _Delta())
+        delta.requests += 1
+        if row.response_time_ms is not None:
+            delta.timed_requests += 1
+            delta.total_ms += row.response_time_ms
+            delta.histogram[_bucket_index(row.response_time_ms)] += 1
+    if rows:
+        watermark.last_id = rows[-1].id
+    return len(rows)
+
+
+def _collect_credits(db, watermark: StatsWatermarkDB, cutoff: datetime, deltas: Dict[StatsKey, _Delta]) -> int:
+    rows = (
+        db.query(
+            CreditUsageDB.id,
+            CreditUsageDB.user_id,
+            CreditUsageDB.task,
+            CreditUsageDB.created_at,
+            CreditUsageDB.credit_reduct,
+        )
+        .filter(CreditUsageDB.id > watermark.last_id)
+        .order_by(CreditUsageDB.id.asc())
+        .limit(REFRESH_BATCH_SIZE)
+        .all()
+    )
+    rows = _settled(rows, cutoff)
+    for row in rows:
+        if row.credit_reduct:
+            delta = deltas.setdefault((_hour(row.created_at), row.user_id, row.task), _Delta())
+            delta.credits += row.credit_reduct
+    if rows:
+        watermark.last_id = rows[-1].id
+    return len(rows)
+
+
+def _apply_deltas(db, deltas: Dict[StatsKey, _Delta]) -> None:
+    if not deltas:
+        return
+    hours = {key[0] for key in deltas}
+    users = {key[1] for key in deltas}
+    existing = {
+        (row.hour, row.user_id, row.task_name): row
+        for row in db.query(AssistantStatsHourlyDB).filter(
+            AssistantStatsHourlyDB.hour.in_(list(hours)),
+            AssistantStatsHourlyDB.user_id.in_(list(users)),
+        )
+    }
+    for key, delta in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            row = AssistantStatsHourlyDB(
+                hour=key[0],
+                user_id=key[1],
+                task_name=key[2],
+                requests=0,
+                timed_requests=0,
+                total_response_time_ms=0,
+                latency_histogram=_empty_histogram(),
+                credits_spent=0,
+            )
+            db.add(row)
+        histogram = _empty_histogram()
+        _merge_histogram(histogram, row.latency_histogram or [])
+        _merge_histogram(histogram, delta.histogram)
+        row.requests += delta.requests
+        row.timed_requests += delta.timed_requests
+        row.total_response_time_ms += delta.total_ms
+        row.latency_histogram = histogram  # reassign so the JSON column is flagged dirty
+        row.credits_spent += delta.credits
+
+
+def refresh_rollups(db) -> int:
+    """
+    Fold new history and credit rows into the hourly rollups.
+
+    Each batch commits together with its watermarks, so a crash never double
+    counts. Returns the number of source rows consumed.
+    """
+    consumed = 0
+    while True:
+        cutoff = datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+        try:
+            history_mark = _lock_watermark(db, "assistant_history")
+            credit_mark = _lock_watermark(db, "credit_useed")
+            deltas: Dict[StatsKey, _Delta] = {}
+            history_rows = _collect_history(db, history_mark, cutoff, deltas)
+            credit_rows = _collect_credits(db, credit_mark, cutoff, deltas)
+            _apply_deltas(db, deltas)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        consumed += history_rows + credit_rows
+        if history_rows < REFRESH_BATCH_SIZE and credit_rows < REFRESH_BATCH_SIZE:
+            break
+    if consumed:
+        logger.info("Folded %s rows into assistant_stats_hourly", consumed)
+    return consumed
+
+
+def maybe_refresh(db) -> bool:
+    """Refresh at most once per REFRESH_INTERVAL_SECONDS per process."""
+    global _last_refresh
+    if time.monotonic() - _last_refresh < REFRESH_INTERVAL_SECONDS:
+        return False
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+    try:
+        refresh_rollups(db)
+        _last_refresh = time.monotonic()
+        return True
+    finally:
+        _refresh_lock.release()
+
+
+def get_stats(
+    db,
+    *,
+    since: datetime,
+    until: Optional[datetime] = None,
+    group_by: str = "hour",
+    user_id: Optional[str] = None,
+    task_name: Optional[str] = None,
+) -> List[Dict[str, object]]:
+    """Merge hourly rollups into one bucket per hour, task or user."""
+    if group_by not in GROUP_BY_OPTIONS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUP_BY_OPTIONS)}.")
+
+    query = db.query(AssistantStatsHourlyDB).filter(AssistantStatsHourlyDB.hour >= _hour(since))
+    if until is not None:
+        query = query.filter(AssistantStatsHourlyDB.hour < until)
+    if user_id:
+        query = query.filter(AssistantStatsHourlyDB.user_id == user_id)
+    if task_name:
+        query = query.filter(AssistantStatsHourlyDB.task_name == task_name)
+
+    merged: Dict[object, _Delta] = defaultdict(_Delta)
+    for row in query:
+        if group_by == "hour":
+            key = row.hour
+        elif group_by == "task":
+            key = row.task_name
+        else:
+            key = row.user_id
+        delta = merged[key]
+        delta.requests += row.requests
+        delta.timed_requests += row.timed_requests
+        delta.total_ms += row.total_response_time_ms
+        delta.credits += row.credits_spent
+        _merge_histogram(delta.histogram, row.latency_histogram or [])
+
+    buckets = []
+    for key in sorted(merged, key=lambda item: (item is None, item)):
+        delta = merged[key]
+        buckets.append(
+            {
+                "key": key.isoformat() if isinstance(key, datetime) else key,
+                "requests": delta.requests,
+                "avg_ms": round(delta.total_ms / delta.timed_requests, 1) if delta.timed_requests else None,
+                "p50_ms": histogram_percentile(delta.histogram, 50),
+                "p95_ms": histogram_percentile(delta.histogram, 95),
+                "p99_ms": histogram_percentile(delta.histogram, 99),
+                "credits_spent": delta.credits,
+            }
+        )
+    return buckets
+
+
+__all__ = [
+    "GROUP_BY_OPTIONS",
+    "LATENCY_BUCKETS_MS",
+    "get_stats",
+    "histogram_percentile",
+    "maybe_refresh",
+    "refresh_rollups",
+]
+
+
+if __name__ == "__main__":
+    session = SessionLocal()
+    try:
+        print(f"Folded {refresh_rollups(session)} rows into assistant_stats_hourly")
+    finally:
+        session.close()
@@ -0,0 +1,113 @@
+"""
+Array scoring for the retrieval rerankers.
+
+``answer_llm.heuristic_rerank`` scores hits one at a time in Python. The
+helpers here let a reranker score a whole candidate list at once:
+
+* ``query_similarity`` asks Qdrant for the hit vectors (``with_vectors``) and
+  compares them to the query and its rewrites. It computes one matrix product
+  and takes the best cosine per hit.
+* ``combine`` builds the alpha/beta/gamma blend of vector, lexical and prior
+  scores as array operations.
+* ``mmr_order`` optionally diversifies the top of the ranking with maximal
+  marginal relevance, so near-duplicate chunks do not fill the context.
+
+``RERANK_MODE=vector`` makes ``/query`` use this scoring instead of the LLM
+reranker. That saves one chat call per request. ``RERANK_MMR_LAMBDA`` below
+1.0 trades relevance for diversity.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RERANK_MODE = os.getenv("RERANK_MODE", "llm").strip().lower()
+RERANK_MMR_LAMBDA = float(os.getenv("RERANK_MMR_LAMBDA", "1.0"))
+RERANK_TOKEN_CACHE_SIZE = int(os.getenv("RERANK_TOKEN_CACHE_SIZE", "16384"))
+
+if RERANK_MODE not in {"llm", "vector"}:
+    logger.warning("Unknown RERANK_MODE %r; using the LLM reranker", RERANK_MODE)
+    RERANK_MODE = "llm"
+
+
+def unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def vector_matrix(vectors: Sequence[Optional[Sequence[float]]]) -> Optional[np.ndarray]:
+    """Unit-length rows for ``vectors``; None unless every vector is present and of one size."""
+    if not vectors or any(v is None for v in vectors):
+        return None
+    if len({len(v) for v in vectors}) != 1:
+        return None
+    return unit_rows(np.asarray(vectors, dtype=np.float32))
+
+
+def query_similarity(hit_vectors: np.ndarray, query_vectors: Sequence[Sequence[float]]) -> np.ndarray:
+    """Best cosine of each hit against the query and its rewrites."""
+    queries = unit_rows(np.asarray(query_vectors, dtype=np.float32))
+    return (hit_vectors @ queries.T).max(axis=1).astype(np.float64)
+
+
+def combine(
+    vector_scores: np.ndarray,
+    overlap: np.ndarray,
+    boost: np.ndarray,
+    alpha: float,
+    beta: float,
+    gamma: float,
+) -> np.ndarray:
+    """The heuristic reranker's blend: vector scores are scaled by their maximum, boosts capped at 0.35."""
+    top = vector_scores.max() if vector_scores.size else 0.0
+    vec_norm = vector_scores / (top or 1.0)
+    return alpha * vec_norm + beta * overlap + gamma * np.minimum(boost, 0.35)
+
+
+def rank(scores: np.ndarray) -> np.ndarray:
+    """Indices by descending score; ties keep input order, like ``sort(reverse=True)``."""
+    return np.argsort(-scores, kind="stable")
+
+
+def mmr_order(scores: np.ndarray, vectors: np.ndarray, lambda_: float, limit: int) -> List[int]:
+    """
+    Greedy maximal marginal relevance over the first ``limit`` picks.
+
+    Each pick maximises ``lambda_ * score - (1 - lambda_) * max cosine to the
+    picks so far``. The remaining hits follow in score order.
+    """
+    order = rank(scores)
+    limit = min(max(0, limit), len(order))
+    if lambda_ >= 1.0 or limit < 2:
+        return order.tolist()
+    similarity = vectors @ vectors.T
+    chosen = [int(order[0])]
+    available = np.ones(len(scores), dtype=bool)
+    available[chosen[0]] = False
+    redundancy = similarity[chosen[0]].astype(np.float64)
+    for _ in range(limit - 1):
+        marginal = np.where(available, lambda_ * scores - (1.0 - lambda_) * redundancy, -np.inf)
+        pick = int(np.argmax(marginal))
+        chosen.append(pick)
+        available[pick] = False
+        np.maximum(redundancy, similarity[pick], out=redundancy)
+    return chosen + [int(i) for i in order if available[i]]
+
+
+__all__ = [
+    "RERANK_MMR_LAMBDA",
+    "RERANK_MODE",
+    "RERANK_TOKEN_CACHE_SIZE",
+    "combine",
+    "mmr_order",
+    "query_similarity",
+    "rank",
+    "unit_rows",
+    "vector_matrix",
+]
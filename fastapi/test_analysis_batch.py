@@ -0,0 +1,147 @@
+"""
+Smoke test for batch analysis and the shared LLM rate limiter.
+
+Posts a mixed batch to /api/assistant/analysis/batch and checks the NDJSON
+stream: one line per document (invalid ones reported as failed) and a summary
+line last, and that a full bundle of slow documents runs all at once on the
+batch threads. Also checks that the token bucket makes a caller wait once the
+per-minute budget is spent. No Azure credentials are needed.
+
+    python test_analysis_batch.py
+"""
+import sys
+import os
+import asyncio
+import json
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api_assistant import router
+from services import analysis_batch, analysis_cache
+from services.rate_limit import TokenRateLimiter
+
+# Keep the smoke test independent of a database (main.app connects on startup).
+analysis_cache.ANALYSIS_CACHE_ENABLED = False
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+DOCUMENT = (
+    "The appellant challenged the order of the High Court. "
+    "The Supreme Court examined Section 482 of the Code of Criminal Procedure. "
+    "It held that the inherent powers must be exercised sparingly. "
+    "The appeal was dismissed with costs."
+)
+
+
+def test_batch_streams_one_line_per_document():
+    documents = [
+        {"id": "first", "text": DOCUMENT, "top_points": 2},
+        {"id": "broken", "pdf_base64": "not base64!"},
+        {"id": "third", "text": DOCUMENT.upper()},
+    ]
+    with TestClient(app) as client:
+        response = client.post("/api/assistant/analysis/batch", json={"documents": documents})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    summary = lines.pop()
+    assert summary["done"] and summary["documents"] == 3
+    assert summary["succeeded"] == 2 and summary["failed"] == 1
+
+    by_id = {line["id"]: line for line in lines}
+    assert sorted(line["index"] for line in lines) == [0, 1, 2]
+    assert by_id["broken"]["status"] == "failed"
+    assert "base64" in by_id["broken"]["error"]
+    assert by_id["first"]["status"] == "succeeded"
+    assert len(by_id["first"]["result"]["key_points"]) <= 2
+    print(f"batch of 3: {summary['succeeded']} succeeded, {summary['failed']} failed in {summary['elapsed_ms']}ms")
+
+
+def test_batch_rejects_empty_and_oversized():
+    with TestClient(app) as client:
+        assert client.post("/api/assistant/analysis/batch", json={"documents": []}).status_code == 400
+        too_many = [{"text": DOCUMENT}] * (analysis_batch.ANALYSIS_BATCH_MAX_DOCUMENTS + 1)
+        assert client.post("/api/assistant/analysis/batch", json={"documents": too_many}).status_code == 413
+
+        original = analysis_batch.ANALYSIS_BATCH_MAX_BYTES
+        analysis_batch.ANALYSIS_BATCH_MAX_BYTES = 2 * len(DOCUMENT)
+        try:
+            # Each document is within its own limit; together they are over the batch cap.
+            too_big = [{"text": DOCUMENT}] * 3
+            response = client.post("/api/assistant/analysis/batch", json={"documents": too_big})
+            assert response.status_code == 413 and "in total" in response.text
+            fits = [{"text": DOCUMENT}] * 2
+            assert client.post("/api/assistant/analysis/batch", json={"documents": fits}).status_code == 200
+        finally:
+            analysis_batch.ANALYSIS_BATCH_MAX_BYTES = original
+
+
+class _SlowResult:
+    def __init__(self):
+        self.thread = threading.current_thread().name
+
+    def model_dump(self, mode):
+        return {"thread": self.thread}
+
+
+def _slow_analysis(spec):
+    time.sleep(0.2)
+    return _SlowResult()
+
+
+def test_full_bundle_runs_at_once():
+    entries = [analysis_batch.BatchEntry(index=n, id=None, spec={}) for n in range(analysis_batch.ANALYSIS_BATCH_MAX_DOCUMENTS)]
+
+    async def collect():
+        return [json.loads(line) async for line in analysis_batch.stream_batch(entries)]
+
+    original = analysis_cache.analyse_spec
+    analysis_cache.analyse_spec = _slow_analysis
+    try:
+        started = time.monotonic()
+        lines = asyncio.run(collect())
+        elapsed = time.monotonic() - started
+    finally:
+        analysis_cache.analyse_spec = original
+    summary = lines.pop()
+    assert summary["succeeded"] == len(entries)
+    assert all(line["result"]["thread"].startswith("analysis-batch") for line in lines)
+    # Fifty 200ms documents take about one document's time, not fifty.
+    assert elapsed < 1.5, elapsed
+    print(f"batch of {len(entries)} slow documents took {elapsed * 1000:.0f}ms")
+
+
+def test_token_bucket_waits_for_budget():
+    limiter = TokenRateLimiter(tokens_per_minute=6000, max_concurrency=2)  # 100 tokens per second
+    started = time.monotonic()
+    with limiter.acquire(6000):
+        pass
+    with limiter.acquire(20):
+        pass
+    waited = time.monotonic() - started
+    assert 0.15 <= waited < 2.0, waited
+    print(f"second call waited {waited * 1000:.0f}ms for the bucket to refill")
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Batch analysis test")
+    print("=" * 80)
+    for test in (
+        test_batch_streams_one_line_per_document,
+        test_batch_rejects_empty_and_oversized,
+        test_full_bundle_runs_at_once,
+        test_token_bucket_waits_for_budget,
+    ):
+        test()
+        print(f"   \u2713 {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Smoke test for the document analysis cache.
+
+Runs against an in-memory SQLite database with Azure switched off. Checks
+hits and misses on both cache keys, that another file with the same text is
+recorded as a reference rather than a copy, that extractions cut off by the
+character budget are cached while timed-out ones never are, that a repeat upload is answered from the
+raw-bytes cache without extracting again, even on a worker that never saw
+the analysis, and that follow-up questions reopen the session there.
+
+    python test_analysis_cache.py
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from api_assistant import router
+from database import Base, DocumentAnalysisDB, DocumentAnalysisSourceDB
+from services import analysis_cache, analysis_llm, analysis_sessions
+
+SECTIONS = {
+    "FACTS": "The appellant was a tenant of the shop premises since 1998 and paid rent monthly. ",
+    "COSTS": "The appeal is dismissed and the appellant shall pay costs of Rs. 25,000 to the respondent. ",
+}
+DOCUMENT = "\n\n".join(f"{heading}\n\n{sentence * 30}" for heading, sentence in SECTIONS.items()).encode()
+
+
+class _cache:
+    """Enables the cache on a fresh SQLite database, with Azure off and empty in-process state."""
+
+    def __enter__(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        self.Session = sessionmaker(bind=engine)
+        self.saved = (analysis_cache.SessionLocal, analysis_cache.ANALYSIS_CACHE_ENABLED, analysis_llm._llm_client)
+        analysis_cache.SessionLocal = self.Session
+        analysis_cache.ANALYSIS_CACHE_ENABLED = True
+        analysis_llm._llm_client = None
+        analysis_cache.clear_memory_cache()
+        analysis_sessions.clear_sessions()
+        return self
+
+    def rows(self, model=DocumentAnalysisDB):
+        db = self.Session()
+        try:
+            return db.query(model).all()
+        finally:
+            db.close()
+
+    def __exit__(self, *exc):
+        analysis_cache.SessionLocal, analysis_cache.ANALYSIS_CACHE_ENABLED, analysis_llm._llm_client = self.saved
+        analysis_cache.clear_memory_cache()
+        analysis_sessions.clear_sessions()
+
+
+def _no_extraction(*args, **kwargs):
+    raise AssertionError("a raw-bytes cache hit must not extract the document again")
+
+
+def _analyse(data=DOCUMENT, **kwargs):
+    return analysis_cache.analyse_document(data, extension="txt", **kwargs)
+
+
+def test_hit_and_miss():
+    with _cache() as cache:
+        first = _analyse()
+        assert not first.cached
+        assert _analyse().cached
+        # Other parameters are a miss on both keys.
+        other = _analyse(max_points=3)
+        assert not other.cached and other.token != first.token
+        assert len(cache.rows()) == 2
+        # Same bytes after the in-process LRU is gone: still a hit, from the table.
+        analysis_cache.clear_memory_cache()
+        assert _analyse().token == first.token
+
+
+def test_same_text_other_file_is_a_reference():
+    with _cache() as cache:
+        first = _analyse()
+        # A BOM changes the raw bytes but not the extracted text.
+        variant = b"\xef\xbb\xbf" + DOCUMENT
+        second = _analyse(variant)
+        assert second.cached and second.token == first.token
+        assert len(cache.rows()) == 1
+        refs = cache.rows(DocumentAnalysisSourceDB)
+        assert len(refs) == 1 and refs[0].analysis_id == cache.rows()[0].id
+        # The next upload of the variant hits by raw bytes without extracting.
+        analysis_cache.clear_memory_cache()
+        original = analysis_llm.extract_for_analysis
+        analysis_llm.extract_for_analysis = _no_extraction
+        try:
+            assert _analyse(variant).token == first.token
+        finally:
+            analysis_llm.extract_for_analysis = original
+
+
+def _timed_out_extraction(original):
+    def extract(*args, **kwargs):
+        extracted = original(*args, **kwargs)
+        extracted.stats.stopped_early, extracted.stats.stop_reason = True, "timeout"
+        return extracted
+
+    return extract
+
+
+def test_budget_cut_is_cached():
+    with _cache() as cache:
+        # A 100-token budget cuts the text off at the same place on every upload.
+        first = _analyse(max_tokens=100, mode="single")
+        assert first.extraction.stop_reason == "budget" and first.token
+        again = _analyse(max_tokens=100, mode="single")
+        assert again.cached and again.token == first.token
+        assert len(cache.rows()) == 1 and cache.rows()[0].source_hash
+
+
+def test_timed_out_extraction_is_not_cached():
+    with _cache() as cache:
+        original = analysis_llm.extract_for_analysis
+        analysis_llm.extract_for_analysis = _timed_out_extraction(original)
+        try:
+            partial = _analyse()
+            again = _analyse()
+        finally:
+            analysis_llm.extract_for_analysis = original
+        assert partial.extraction.stop_reason == "timeout" and partial.token
+        assert not again.cached and again.token != partial.token
+        rows = cache.rows()
+        assert len(rows) == 2 and all(row.content_hash is None and row.source_hash is None for row in rows)
+        assert cache.rows(DocumentAnalysisSourceDB) == []
+        # The stored text still backs follow-up questions.
+        analysis_sessions.clear_sessions()
+        assert analysis_cache.ask(partial.token, "Who is the appellant?") is not None
+
+
+def test_raw_hit_without_session_skips_extraction():
+    with _cache() as cache:
+        first = _analyse()
+        assert first.token and not first.cached
+        assert [row.token for row in cache.rows()] == [first.token] and cache.rows()[0].text_blob
+        # Another worker: no session, no LRU entry, and extraction would fail.
+        analysis_sessions.clear_sessions()
+        analysis_cache.clear_memory_cache()
+        original = analysis_llm.extract_for_analysis
+        analysis_llm.extract_for_analysis = _no_extraction
+        try:
+            again = _analyse()
+        finally:
+            analysis_llm.extract_for_analysis = original
+        assert again.cached and again.token == first.token
+        assert not analysis_sessions.has_session(first.token)
+
+
+def test_ask_reopens_session_from_database():
+    with _cache():
+        token = _analyse().token
+        analysis_sessions.clear_sessions()
+
+        app = FastAPI()
+        app.include_router(router, prefix="/api")
+        client = TestClient(app)
+        answer = client.post(f"/api/assistant/analysis/{token}/ask", json={"question": "Who pays the costs?", "top_k": 1})
+        assert answer.status_code == 200, answer.text
+        assert "costs of Rs. 25,000" in answer.json()["chunks"][0]["text"]
+        assert analysis_sessions.has_session(token)
+        assert client.post("/api/assistant/analysis/missing/ask", json={"question": "anything"}).status_code == 404
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Analysis cache test")
+    print("=" * 80)
+    for test in (
+        test_hit_and_miss,
+        test_same_text_other_file_is_a_reference,
+        test_budget_cut_is_cached,
+        test_timed_out_extraction_is_not_cached,
+        test_raw_hit_without_session_skips_extraction,
+        test_ask_reopens_session_from_database,
+    ):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
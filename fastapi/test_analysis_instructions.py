@@ -0,0 +1,96 @@
+"""
+Smoke test for user instructions in document analysis.
+
+Swaps in a fake Azure client that records every chat call and checks that
+the user's instructions reach each map call and the reduce call of a
+map-reduce analysis, and the single call of a short one.
+
+    python test_analysis_instructions.py
+"""
+import sys
+import os
+import json
+import threading
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from services import analysis_llm
+from services.document_extract import ExtractedText, ExtractionStats
+
+INSTRUCTIONS = "Focus only on the bail conditions imposed on the second accused."
+PARAGRAPH = "The accused was arrested on the complaint of the informant and produced before the Magistrate. " * 8
+COMPLETION = json.dumps(
+    {
+        "summary": "Bail was granted on conditions.",
+        "analysis": "The court weighed the gravity of the offence.",
+        "key_points": ["Bail granted."],
+        "keywords": ["bail"],
+        "comparisons": [],
+        "table_markdown": "",
+    }
+)
+
+
+class _RecordingClient:
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, *, messages, stream=False, **kwargs):
+        with self._lock:
+            self.calls.append(messages)
+        message = SimpleNamespace(content=COMPLETION)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def _extracted(paragraphs):
+    text = "\n\n".join(f"[{n}] {PARAGRAPH}" for n in range(paragraphs))
+    stats = ExtractionStats(pages_total=1, pages_read=1, stopped_early=False, elapsed_ms=0.0, page_timings_ms=[])
+    return ExtractedText(text=text, stats=stats)
+
+
+def _analyse(paragraphs, mode, max_tokens):
+    client = _RecordingClient()
+    original = analysis_llm._llm_client
+    analysis_llm._llm_client = client
+    try:
+        result = analysis_llm.analyse_extracted(
+            _extracted(paragraphs), instructions=INSTRUCTIONS, mode=mode, max_tokens=max_tokens
+        )
+    finally:
+        analysis_llm._llm_client = original
+    return result, client.calls
+
+
+def test_every_map_and_reduce_call_gets_instructions():
+    result, calls = _analyse(40, "map_reduce", max_tokens=1000)
+    assert not result._degraded
+    maps = [messages for messages in calls if "[Part " in messages[1]["content"]]
+    reduces = [messages for messages in calls if "consecutive parts of ONE legal document" in messages[0]["content"]]
+    assert len(maps) >= 3 and len(reduces) == 1 and len(calls) == len(maps) + 1, len(calls)
+    for messages in maps:
+        assert INSTRUCTIONS in messages[1]["content"]
+    assert INSTRUCTIONS in reduces[0][0]["content"]
+    # The document text itself is still split across the parts, not repeated.
+    assert sum(messages[1]["content"].count("[0] ") for messages in maps) == 1
+
+
+def test_single_call_gets_instructions():
+    _, calls = _analyse(2, "single", max_tokens=4000)
+    assert len(calls) == 1
+    assert calls[0][1]["content"].startswith(f"User instructions:\n{INSTRUCTIONS}\n\nDocument:\n")
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Analysis instructions test")
+    print("=" * 80)
+    for test in (test_every_map_and_reduce_call_gets_instructions, test_single_call_gets_instructions):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
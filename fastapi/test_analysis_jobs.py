@@ -0,0 +1,201 @@
+"""
+Smoke test for the asynchronous analysis job API.
+
+Runs a text job through the default local asyncio backend via the FastAPI
+test client, checks that a full local queue answers 503 and that the local
+backend is refused on Vercel, then runs the Celery backend in eager mode
+with job state in fakeredis, once injected and once picked on its own, and
+checks that the task reports through Redis whatever the worker's backend
+setting (skipped when fakeredis is not installed). No Azure credentials
+are needed: analysis falls back to the extractive summary.
+
+    python test_analysis_jobs.py
+"""
+import sys
+import os
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api_assistant import router
+from services import analysis_cache, analysis_jobs
+
+# Keep the smoke test independent of a database (main.app connects on startup).
+analysis_cache.ANALYSIS_CACHE_ENABLED = False
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+DOCUMENT = (
+    "The appellant challenged the order of the High Court. "
+    "The Supreme Court examined Section 482 of the Code of Criminal Procedure. "
+    "It held that the inherent powers must be exercised sparingly. "
+    "The appeal was dismissed with costs."
+)
+
+
+def _poll(client: TestClient, token: str, timeout: float = 30.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get(f"/api/assistant/analysis/jobs/{token}")
+        assert response.status_code == 200, response.text
+        job = response.json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {token} did not finish in {timeout}s")
+
+
+def test_local_backend_job_lifecycle():
+    analysis_jobs.set_backend(analysis_jobs.LocalJobBackend(workers=2))
+    with TestClient(app) as client:
+        response = client.post("/api/assistant/analysis/jobs", json={"text": DOCUMENT, "top_points": 3})
+        assert response.status_code == 202, response.text
+        queued = response.json()
+        assert queued["status"] == "queued" and queued["progress"] == 0.0
+
+        job = _poll(client, queued["token"])
+        assert job["status"] == "succeeded", job
+        assert job["progress"] == 1.0
+        assert job["result"]["summary"]
+        assert len(job["result"]["key_points"]) <= 3
+
+        assert client.get("/api/assistant/analysis/jobs/does-not-exist").status_code == 404
+        assert client.post("/api/assistant/analysis/jobs", json={"text": DOCUMENT, "mode": "bogus"}).status_code == 400
+        assert client.post("/api/assistant/analysis/jobs", json={}).status_code == 400
+
+
+def test_local_queue_is_bounded():
+    release = threading.Event()
+    original = analysis_jobs.run_job
+    analysis_jobs.run_job = lambda store, token, spec: release.wait(10)
+    backend = analysis_jobs.LocalJobBackend(workers=1, max_queued=1)
+    analysis_jobs.set_backend(backend)
+    try:
+        with TestClient(app) as client:
+            codes = [
+                client.post("/api/assistant/analysis/jobs", json={"text": DOCUMENT}).status_code for _ in range(4)
+            ]
+            # One job running and one waiting at most; the rest are turned away.
+            assert codes[0] == 202 and 503 in codes and codes.count(202) <= 2, codes
+            rejected = client.post("/api/assistant/analysis/jobs", json={"text": DOCUMENT})
+            assert rejected.status_code == 503 and rejected.headers["retry-after"] == "30"
+            assert len(backend.store._jobs) == codes.count(202)
+    finally:
+        release.set()
+        analysis_jobs.run_job = original
+        analysis_jobs.set_backend(None)
+
+
+def test_local_backend_refused_on_vercel():
+    saved = (analysis_jobs.ANALYSIS_JOB_BACKEND, analysis_jobs.SERVERLESS, analysis_jobs.BROKER_CONFIGURED)
+    analysis_jobs.ANALYSIS_JOB_BACKEND, analysis_jobs.SERVERLESS, analysis_jobs.BROKER_CONFIGURED = "local", True, False
+    analysis_jobs.set_backend(None)
+    try:
+        with TestClient(app) as client:
+            response = client.post("/api/assistant/analysis/jobs", json={"text": DOCUMENT})
+            assert response.status_code == 503, response.text
+        assert analysis_jobs._backend is None
+    finally:
+        analysis_jobs.ANALYSIS_JOB_BACKEND, analysis_jobs.SERVERLESS, analysis_jobs.BROKER_CONFIGURED = saved
+        analysis_jobs.set_backend(None)
+
+
+def test_celery_backend_with_fakeredis():
+    try:
+        import fakeredis
+    except ImportError:
+        print("   - fakeredis not installed; skipping Celery backend check")
+        return
+    if analysis_jobs.celery_app is None:
+        print("   - celery not installed; skipping Celery backend check")
+        return
+
+    analysis_jobs.celery_app.conf.task_always_eager = True
+    store = analysis_jobs.RedisJobStore(fakeredis.FakeRedis())
+    original = analysis_jobs._redis_store
+    analysis_jobs._redis_store = lambda: store
+    analysis_jobs.set_backend(analysis_jobs.CeleryJobBackend(store=store))
+    try:
+        with TestClient(app) as client:
+            response = client.post("/api/assistant/analysis/jobs", json={"text": DOCUMENT})
+            assert response.status_code == 202, response.text
+            job = _poll(client, response.json()["token"])
+            assert job["status"] == "succeeded", job
+            assert job["result"]["source"] == "text"
+            assert store.client.ttl(store._key(job["token"])) > 0
+    finally:
+        analysis_jobs._redis_store = original
+        analysis_jobs.celery_app.conf.task_always_eager = False
+        analysis_jobs.set_backend(None)
+
+
+def test_celery_task_writes_to_redis_without_backend_config():
+    try:
+        import fakeredis
+    except ImportError:
+        print("   - fakeredis not installed; skipping Celery task check")
+        return
+    if analysis_jobs.celery_app is None:
+        print("   - celery not installed; skipping Celery task check")
+        return
+
+    server = fakeredis.FakeServer()
+    saved = (
+        analysis_jobs.ANALYSIS_JOB_BACKEND,
+        analysis_jobs.SERVERLESS,
+        analysis_jobs.BROKER_CONFIGURED,
+        analysis_jobs._redis_store,
+    )
+    # The API runs on Vercel with a broker configured and picks Celery by itself.
+    analysis_jobs.ANALYSIS_JOB_BACKEND, analysis_jobs.SERVERLESS, analysis_jobs.BROKER_CONFIGURED = "local", True, True
+    analysis_jobs._redis_store = lambda: analysis_jobs.RedisJobStore(fakeredis.FakeRedis(server=server))
+    analysis_jobs.celery_app.conf.task_always_eager = True
+    analysis_jobs.set_backend(None)
+    try:
+        with TestClient(app) as client:
+            response = client.post("/api/assistant/analysis/jobs", json={"text": DOCUMENT})
+            assert response.status_code == 202, response.text
+            assert isinstance(analysis_jobs._backend, analysis_jobs.CeleryJobBackend)
+            job = _poll(client, response.json()["token"])
+            assert job["status"] == "succeeded", job
+
+        # A worker started without VERCEL or ANALYSIS_JOB_BACKEND=celery still reports through Redis.
+        analysis_jobs.SERVERLESS = False
+        analysis_jobs.set_backend(None)
+        store = analysis_jobs.RedisJobStore(fakeredis.FakeRedis(server=server))
+        store.create(analysis_jobs._new_job("worker-side-job"))
+        analysis_jobs.run_analysis_task("worker-side-job", {"text": DOCUMENT, "max_points": 3, "mode": "auto"})
+        assert store.get("worker-side-job")["status"] == "succeeded"
+        assert analysis_jobs._backend is None
+    finally:
+        (
+            analysis_jobs.ANALYSIS_JOB_BACKEND,
+            analysis_jobs.SERVERLESS,
+            analysis_jobs.BROKER_CONFIGURED,
+            analysis_jobs._redis_store,
+        ) = saved
+        analysis_jobs.celery_app.conf.task_always_eager = False
+        analysis_jobs.set_backend(None)
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Analysis job API test")
+    print("=" * 80)
+    for test in (
+        test_local_backend_job_lifecycle,
+        test_local_queue_is_bounded,
+        test_local_backend_refused_on_vercel,
+        test_celery_backend_with_fakeredis,
+        test_celery_task_writes_to_redis_without_backend_config,
+    ):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Smoke test for follow-up questions on an analysed document.
+
+Analyses a multi-section text through the FastAPI test client, then asks
+questions against its token. Azure is switched off so chunks are embedded
+with the hashed bag-of-words and answers are extractive.
+
+    python test_analysis_sessions.py
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api_assistant import router
+from services import analysis_cache, analysis_llm, analysis_sessions
+
+# Keep the smoke test independent of a database and of Azure.
+analysis_cache.ANALYSIS_CACHE_ENABLED = False
+analysis_llm._llm_client = None
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+SECTIONS = {
+    "FACTS": "The appellant was a tenant of the shop premises since 1998 and paid rent monthly. ",
+    "LIMITATION": "The suit was filed after the period of limitation under Article 65 had expired. ",
+    "EVIDENCE": "Three witnesses deposed that the sale deed was executed in the presence of the sub-registrar. ",
+    "COSTS": "The appeal is dismissed and the appellant shall pay costs of Rs. 25,000 to the respondent. ",
+}
+DOCUMENT = "\n\n".join(f"{heading}\n\n{sentence * 30}" for heading, sentence in SECTIONS.items())
+
+
+def test_ask_retrieves_relevant_chunk():
+    analysis_sessions.clear_sessions()
+    with TestClient(app) as client:
+        response = client.post("/api/assistant/analysis", json={"text": DOCUMENT})
+        assert response.status_code == 200, response.text
+        token = response.json()["token"]
+        assert token
+
+        answer = client.post(f"/api/assistant/analysis/{token}/ask", json={"question": "Who pays the costs of the appeal?", "top_k": 2})
+        assert answer.status_code == 200, answer.text
+        body = answer.json()
+        assert body["embedding"] == "hashed"
+        assert len(body["chunks"]) == 2
+        assert "costs of Rs. 25,000" in body["chunks"][0]["text"]
+
+        answer = client.post(f"/api/assistant/analysis/{token}/ask", json={"question": "limitation period Article 65"})
+        assert "Article 65" in answer.json()["chunks"][0]["text"]
+
+
+def test_unknown_or_expired_session():
+    with TestClient(app) as client:
+        assert client.post("/api/assistant/analysis/nope/ask", json={"question": "anything"}).status_code == 404
+        assert client.post("/api/assistant/analysis/nope/ask", json={"question": "  "}).status_code == 400
+
+    store = analysis_sessions.SessionStore(ttl_seconds=0, max_sessions=2)
+    store.put("a", "text")
+    assert store.get("a") is None
+    store = analysis_sessions.SessionStore(ttl_seconds=60, max_sessions=2)
+    for token in ("a", "b", "c"):
+        store.put(token, "text")
+    assert "a" not in store and "b" in store and "c" in store
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Analysis follow-up question test")
+    print("=" * 80)
+    for test in (test_ask_retrieves_relevant_chunk, test_unknown_or_expired_session):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Smoke test for streamed analysis over server-sent events.
+
+Swaps in a fake Azure client that streams a JSON analysis in small deltas
+and checks that /api/assistant/analysis/stream sends the summary section
+well before the final result event, and that the incremental parser copes
+with code fences, escapes and nested values split at any point.
+
+    python test_analysis_stream.py
+"""
+import sys
+import os
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api_assistant import router
+from services import analysis_cache, analysis_llm, analysis_stream
+from services.json_stream import JsonObjectStream
+
+# Keep the smoke test independent of a database (main.app connects on startup).
+analysis_cache.ANALYSIS_CACHE_ENABLED = False
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+COMPLETION = json.dumps(
+    {
+        "summary": "The appeal against the High Court order was dismissed.",
+        "analysis": "The Court read Section 482 narrowly. " * 40,
+        "key_points": ["Inherent powers are exercised sparingly.", "Costs were imposed."],
+        "keywords": ["Section 482", "inherent powers"],
+        "comparisons": [],
+        "table_markdown": "",
+    }
+)
+
+
+class _FakeCompletions:
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+
+    def create(self, *, stream=False, **kwargs):
+        if not stream:
+            message = SimpleNamespace(content=COMPLETION)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        return self._stream()
+
+    def _stream(self):
+        yield SimpleNamespace(choices=[])  # content-filter preamble
+        for start in range(0, len(COMPLETION), 16):
+            time.sleep(self.delay)
+            delta = SimpleNamespace(content=COMPLETION[start:start + 16])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def _parse(frames):
+    """(event, data) pairs from SSE frames or response lines."""
+    name = None
+    for line in "".join(frames).splitlines():
+        if line.startswith("event: "):
+            name = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield name, json.loads(line[len("data: "):])
+
+
+async def _timed_frames(spec):
+    started = time.perf_counter()
+    async for frame in analysis_stream.stream_analysis(spec):
+        yield frame, time.perf_counter() - started
+
+
+def test_sections_arrive_before_result():
+    original = analysis_llm._llm_client
+    analysis_llm._llm_client = SimpleNamespace(chat=SimpleNamespace(completions=_FakeCompletions(delay=0.01)))
+    spec = {"text": "The appeal was dismissed.", "max_points": 5, "mode": "auto"}
+
+    async def collect():
+        return [item async for item in _timed_frames(spec)]
+
+    try:
+        # The test client buffers whole responses, so time the event stream itself.
+        timed = asyncio.run(collect())
+        with TestClient(app) as client:
+            response = client.post("/api/assistant/analysis/stream", json={"text": "The appeal was dismissed."})
+    finally:
+        analysis_llm._llm_client = original
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = list(_parse([frame for frame, _ in timed]))
+    assert events[-1][0] == "result", events
+    sections = [data["name"] for name, data in events if name == "section"]
+    assert sections[:2] == ["summary", "analysis"], sections
+    first_section = next(at for frame, at in timed if frame.startswith("event: section"))
+    result_at = timed[-1][1]
+    assert first_section < result_at / 3, (first_section, result_at)
+    result = events[-1][1]
+    assert result["key_points"] == ["Inherent powers are exercised sparingly.", "Costs were imposed."]
+    assert result["table_markdown"] is None
+    over_http = list(_parse([response.text]))[-1]
+    assert over_http[0] == "result" and over_http[1]["summary"] == result["summary"]
+    print(f"first section after {first_section * 1000:.0f}ms, result after {result_at * 1000:.0f}ms")
+
+
+def test_fallback_sends_every_section():
+    with TestClient(app) as client:
+        response = client.post("/api/assistant/analysis/stream", json={"text": "One sentence. Another sentence."})
+    events = list(_parse([response.text]))
+    assert [data["name"] for name, data in events if name == "section"] == list(analysis_llm.ANALYSIS_SECTIONS)
+    assert events[-1][0] == "result"
+
+
+def test_parser_handles_arbitrary_splits():
+    document = {"summary": 'A "quoted" {brace} \\ end', "n": 3, "items": ["a, b", "c]"], "nested": {"x": [1, {"y": "}"}]}}
+    text = "```json\n" + json.dumps(document, indent=2) + "\n```"
+    rng = random.Random(3)
+    for _ in range(100):
+        parser, members, position = JsonObjectStream(), [], 0
+        while position < len(text):
+            step = rng.randint(1, 7)
+            members += parser.feed(text[position:position + step])
+            position += step
+        assert members == list(document.items()) and parser.done
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Streamed analysis test")
+    print("=" * 80)
+    for test in (test_parser_handles_arbitrary_splits, test_fallback_sends_every_section, test_sections_arrive_before_result):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Smoke test for document text extraction.
+
+Checks that long PDFs are read through the process pool, that they fall back
+to inline extraction when the pool cannot be created or fed (serverless hosts
+without /dev/shm) or is disabled with VERCEL=1, and that everything comes out
+the same either way, and that a pool worker never reads a file through a
+stale cached copy. Text and DOCX files must stay within the character budget
+whether they have many lines or paragraphs or a single very long one.
+
+    python test_document_extract.py
+"""
+import sys
+import os
+import io
+import tempfile
+import zipfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from reportlab.pdfgen import canvas
+
+from services import document_extract
+
+PAGES = 10
+
+
+def _pdf(pages=PAGES):
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for number in range(1, pages + 1):
+        pdf.drawString(72, 720, f"Page {number} of the agreement between the parties.")
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _assert_complete(result, pages=PAGES):
+    for number in range(1, pages + 1):
+        assert f"Page {number} of the agreement" in result.text, result.text[:200]
+    assert result.text.index("Page 1 ") < result.text.index(f"Page {pages} ")
+    assert result.stats.pages_total == pages and result.stats.pages_read == pages
+    assert not result.stats.stopped_early
+
+
+class _patched:
+    """Sets module attributes for the duration of a with-block."""
+
+    def __init__(self, **values):
+        self.values = values
+        self.saved = {}
+
+    def __enter__(self):
+        for name, value in self.values.items():
+            self.saved[name] = getattr(document_extract, name)
+            setattr(document_extract, name, value)
+
+    def __exit__(self, *exc):
+        for name, value in self.saved.items():
+            setattr(document_extract, name, value)
+
+
+def _no_pool(*args, **kwargs):
+    raise AssertionError("the process pool must not be used")
+
+
+def test_long_pdf_uses_pool():
+    with _patched(PDF_POOL_ENABLED=True, _pool_unavailable=False, PDF_EXTRACT_WORKERS=2, PDF_INLINE_MAX_PAGES=2):
+        try:
+            _assert_complete(document_extract.extract_pdf(_pdf()))
+            assert document_extract._pool is not None
+        finally:
+            document_extract.shutdown_pool()
+
+
+def test_pool_creation_failure_falls_back_inline():
+    def fail_to_start(max_workers):
+        raise OSError(38, "Function not implemented")  # SemLock on hosts without /dev/shm
+
+    original = document_extract.ProcessPoolExecutor
+    document_extract.ProcessPoolExecutor = fail_to_start
+    try:
+        with _patched(PDF_POOL_ENABLED=True, _pool_unavailable=False, PDF_EXTRACT_WORKERS=2, PDF_INLINE_MAX_PAGES=2):
+            document_extract.shutdown_pool()
+            _assert_complete(document_extract.extract_pdf(_pdf()))
+            assert document_extract._pool_unavailable
+            # Once the pool is known to be unavailable it is not tried again.
+            with _patched(_extract_in_pool=_no_pool):
+                _assert_complete(document_extract.extract_pdf(_pdf()))
+    finally:
+        document_extract.ProcessPoolExecutor = original
+
+
+def test_pool_submission_failure_falls_back_inline():
+    class ShutDownPool:
+        def submit(self, *args, **kwargs):
+            raise RuntimeError("cannot schedule new futures after shutdown")
+
+    with _patched(
+        PDF_POOL_ENABLED=True, _pool_unavailable=False, PDF_EXTRACT_WORKERS=2, PDF_INLINE_MAX_PAGES=2,
+        _get_pool=lambda: ShutDownPool(),
+    ):
+        _assert_complete(document_extract.extract_pdf(_pdf()))
+
+
+def test_disabled_pool_extracts_inline():
+    with _patched(PDF_POOL_ENABLED=False, PDF_EXTRACT_WORKERS=2, PDF_INLINE_MAX_PAGES=2, _extract_in_pool=_no_pool):
+        _assert_complete(document_extract.extract_pdf(_pdf()))
+
+
+def test_worker_cache_follows_file_changes():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "upload.pdf")
+        for pages in (3, 5):
+            with open(path, "wb") as handle:
+                handle.write(_pdf(pages))
+            texts = [text for text, _ in document_extract._extract_page_range(path, 0, pages)]
+            assert texts[-1].startswith(f"Page {pages} of"), texts
+        os.remove(path)
+        assert document_extract._extract_page_range(path, 0, 1) == [("", 0.0)]
+        assert document_extract._worker_reader == (None, None)
+
+
+def _docx(paragraphs):
+    ns = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+    body = "".join(f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>" for text in paragraphs)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("word/document.xml", f'<w:document xmlns:w="{ns}"><w:body>{body}</w:body></w:document>')
+    return buffer.getvalue()
+
+
+def test_docx_respects_budget():
+    result = document_extract.extract_docx(_docx(["Recitals.", "y" * 100_000]), max_chars=5000)
+    assert len(result.text) == 5000, len(result.text)
+    assert result.text.startswith("Recitals.") and result.stats.stop_reason == "budget"
+    many = document_extract.extract_docx(_docx(["Clause text of the lease."] * 5000), max_chars=5000)
+    assert 0 < len(many.text) <= 5000 and many.stats.stopped_early
+    whole = document_extract.extract_docx(_docx(["Recitals.", "y" * 100_000]))
+    assert len(whole.text) == len("Recitals.") + 2 + 100_000 and not whole.stats.stopped_early
+
+
+def test_txt_many_lines_respects_budget():
+    data = ("Clause text of the lease agreement.\n" * 60000).encode()
+    result = document_extract.extract_txt(data, max_chars=5000)
+    assert 0 < len(result.text) <= 5000, len(result.text)
+    assert result.stats.stopped_early and result.stats.pages_total is None
+    assert result.stats.stop_reason == "budget" and result.stats.deterministic
+    assert result.text.startswith("Clause text")
+
+
+def test_txt_single_line_respects_budget():
+    result = document_extract.extract_txt(b"x" * 1_000_000, max_chars=5000)
+    assert len(result.text) == 5000, len(result.text)
+    assert result.stats.stopped_early
+    # Without a budget the whole line comes through.
+    whole = document_extract.extract_txt(b"x" * 1_000_000)
+    assert len(whole.text) == 1_000_000 and not whole.stats.stopped_early
+
+
+def test_txt_within_budget_is_complete():
+    data = "\n".join(f"Line {n}" for n in range(100_000)).encode("utf-16")
+    result = document_extract.extract_txt(data, max_chars=10_000_000)
+    assert not result.stats.stopped_early
+    assert result.text.startswith("Line 0") and result.text.endswith("Line 99999")
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Document extraction test")
+    print("=" * 80)
+    for test in (
+        test_long_pdf_uses_pool,
+        test_pool_creation_failure_falls_back_inline,
+        test_pool_submission_failure_falls_back_inline,
+        test_disabled_pool_extracts_inline,
+        test_worker_cache_follows_file_changes,
+        test_docx_respects_budget,
+        test_txt_many_lines_respects_budget,
+        test_txt_single_line_respects_budget,
+        test_txt_within_budget_is_complete,
+    ):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Smoke test for the cross-request embedding micro-batcher.
+
+Fires concurrent single-query embeddings at a fake list-input embedding
+function and checks that they share a handful of calls, that each caller
+gets its own vector, that a batch-wide failure reaches every caller while
+one bad input fails only its own caller, and that batch sizes show up in
+the Prometheus metrics text.
+
+    python test_embedding_batcher.py
+"""
+import sys
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from services import metrics
+from services.embedding_batcher import EmbeddingBatcher
+from services.micro_batch import BATCH_SIZE
+
+
+class _FakeEmbeddings:
+    def __init__(self, latency: float = 0.02, fail: bool = False, reject: str = "") -> None:
+        self.latency = latency
+        self.fail = fail
+        self.reject = reject
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self._lock:
+            self.calls.append(list(texts))
+        time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("429 Too Many Requests")
+        if self.reject and self.reject in texts:
+            raise ValueError("400 input is too long")
+        return [[float(len(text)), float(sum(map(ord, text)))] for text in texts]
+
+
+def test_concurrent_queries_share_calls():
+    fake = _FakeEmbeddings()
+    batcher = EmbeddingBatcher(fake, name="test-share", window_ms=10, max_inputs=32)
+    queries = [f"section {i % 40} of the companies act" for i in range(120)]
+    with ThreadPoolExecutor(max_workers=60) as pool:
+        vectors = list(pool.map(batcher.embed, queries))
+
+    assert all(vector == [float(len(q)), float(sum(map(ord, q)))] for q, vector in zip(queries, vectors))
+    assert len(fake.calls) < 30, len(fake.calls)
+    assert all(len(call) <= 32 and len(call) == len(set(call)) for call in fake.calls)
+    sizes = BATCH_SIZE.snapshot(batcher="test-share.embed")
+    assert sizes["count"] == len(fake.calls)
+    print(f"120 queries -> {len(fake.calls)} embedding calls (mean batch {sizes['sum'] / sizes['count']:.1f})")
+
+
+def test_failure_reaches_every_caller():
+    batcher = EmbeddingBatcher(_FakeEmbeddings(fail=True), name="test-fail", window_ms=20)
+    futures = [batcher.submit(f"query {i}") for i in range(5)]
+    for future in futures:
+        try:
+            future.result(timeout=5)
+        except RuntimeError as exc:
+            assert "429" in str(exc)
+        else:
+            raise AssertionError("expected the batch failure to propagate")
+
+
+def test_bad_input_fails_only_its_caller():
+    fake = _FakeEmbeddings(latency=0.0, reject="query 5")
+    batcher = EmbeddingBatcher(fake, name="test-isolate", window_ms=50, max_inputs=32)
+    queries = [f"query {i}" for i in range(12)] + ["query 5"]
+    futures = [batcher.submit(query) for query in queries]
+    for query, future in zip(queries, futures):
+        if query == "query 5":
+            try:
+                future.result(timeout=5)
+            except ValueError as exc:
+                assert "400" in str(exc)
+            else:
+                raise AssertionError("expected the bad input to fail")
+        else:
+            assert future.result(timeout=5) == [float(len(query)), float(sum(map(ord, query)))]
+    # The whole batch, then halves down to the bad input: a few calls, not one per item.
+    assert fake.calls[0] == [f"query {i}" for i in range(12)], fake.calls
+    assert len(fake.calls) <= 2 * 4 + 1, len(fake.calls)
+
+
+def test_pipeline_embed_uses_batcher():
+    from services import answer_llm
+
+    fake = _FakeEmbeddings(latency=0.0)
+    original = answer_llm.llm
+    answer_llm.llm = SimpleNamespace(
+        embeddings=SimpleNamespace(
+            create=lambda model, input: SimpleNamespace(
+                data=[SimpleNamespace(index=i, embedding=vector) for i, vector in reversed(list(enumerate(fake(input))))]
+            )
+        )
+    )
+    try:
+        assert answer_llm.embed("transfer of property") == [20.0, float(sum(map(ord, "transfer of property")))]
+    finally:
+        answer_llm.llm = original
+    assert 'micro_batch_size_bucket{batcher="answer_llm.embed",le="1"}' in metrics.render()
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Embedding micro-batcher test")
+    print("=" * 80)
+    for test in (
+        test_concurrent_queries_share_calls,
+        test_failure_reaches_every_caller,
+        test_bad_input_fails_only_its_caller,
+        test_pipeline_embed_uses_batcher,
+    ):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Smoke test for compressed general task payloads.
+
+Runs against an in-memory SQLite database with foreign keys enabled. Checks
+that a payload comes back byte-for-byte as it was stored (sources with,
+without, with empty and with null snippets), that identical snippets are
+stored once, and that snippets nobody refers to any more are deleted when a
+payload is rewritten or its user is purged. With TEST_DATABASE_URL set to a
+PostgreSQL server it also checks that the purge leaves alone a snippet that
+a concurrent, uncommitted payload is reusing.
+
+    python test_general_payload.py
+"""
+import sys
+import os
+import json
+import uuid
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from database import (
+    Base,
+    UserDB,
+    GeneralTaskHistoryDB,
+    GeneralTaskSnippetDB,
+    SourceSnippetDB,
+    get_general_task_payload,
+    log_general_task_history,
+    pack_general_payload,
+    purge_orphan_snippets,
+    purge_user,
+    set_general_task_payload,
+    unpack_general_payload,
+)
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+SNIPPET = "Section 482 saves the inherent powers of the High Court to prevent abuse of process. " * 5
+PAYLOAD = {
+    "answer": "The High Court may quash the proceedings.",
+    "sources": [
+        {"collection": "judgments", "unit_id": "u1", "snippet": SNIPPET, "score": 0.91},
+        {"collection": "judgments", "unit_id": "u2", "score": 0.82},
+        {"collection": "statutes", "unit_id": "u3", "snippet": None, "score": 0.7},
+        {"collection": "statutes", "unit_id": "u4", "snippet": "", "score": 0.6},
+        {"snippet": "Anonymous excerpt with unicode — § 482.", "collection": None, "unit_id": None},
+    ],
+    "validation": {"passed": True},
+}
+
+
+def _make_session():
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def _enable_foreign_keys(dbapi_connection, _record):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    for user_id in ("alice", "bob"):
+        db.add(UserDB(id=user_id, email=f"{user_id}@example.com", name=user_id.title()))
+    db.commit()
+    return db
+
+
+def _log(db, user_id, token, payload):
+    return log_general_task_history(
+        db, user_id=user_id, token=token, task_name="General", query="q", answer="a", response_payload=payload
+    )
+
+
+def _dumps(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def test_round_trip_is_byte_identical():
+    db = _make_session()
+    for payload in (PAYLOAD, {"answer": "no sources"}, {"answer": "null", "sources": None}, {}):
+        assert _dumps(unpack_general_payload(db, pack_general_payload(db, payload))) == _dumps(payload)
+
+    record = _log(db, "alice", "t" * 32, PAYLOAD)
+    assert _dumps(get_general_task_payload(record)) == _dumps(PAYLOAD)
+    sources = get_general_task_payload(record)["sources"]
+    assert "snippet" not in sources[1]
+    assert sources[2]["snippet"] is None and sources[3]["snippet"] == ""
+    # Only the non-empty snippets leave the blob.
+    assert db.query(SourceSnippetDB).count() == 2
+    assert SNIPPET.encode() not in record.payload_blob
+
+
+def test_snippets_are_shared_and_orphans_purged():
+    db = _make_session()
+    first = _log(db, "alice", "a" * 32, PAYLOAD)
+    _log(db, "bob", "b" * 32, PAYLOAD)
+    assert db.query(SourceSnippetDB).count() == 2
+    assert db.query(GeneralTaskSnippetDB).count() == 4
+
+    # Rewriting a payload drops its old links; the snippets are still used by bob.
+    set_general_task_payload(db, first, {"answer": "rewritten", "sources": []})
+    db.commit()
+    assert db.query(GeneralTaskSnippetDB).filter(GeneralTaskSnippetDB.task_id == first.id).count() == 0
+    assert purge_orphan_snippets(db) == 0
+
+    purged = purge_user(db, "bob")
+    assert purged["source_snippets"] == 2
+    assert db.query(SourceSnippetDB).count() == 0
+    assert db.query(GeneralTaskHistoryDB).count() == 1
+    assert get_general_task_payload(first) == {"answer": "rewritten", "sources": []}
+
+
+def test_purge_skips_snippet_reused_concurrently():
+    if not TEST_DATABASE_URL:
+        print("   - TEST_DATABASE_URL not set; skipping PostgreSQL purge check")
+        return
+
+    schema = f"test_payload_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(TEST_DATABASE_URL)
+    with admin.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+    engine = create_engine(TEST_DATABASE_URL, connect_args={"options": f"-csearch_path={schema}"})
+    try:
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        setup = Session()
+        setup.add(UserDB(id="alice", email="alice@example.com", name="Alice"))
+        record = _log(setup, "alice", "a" * 32, PAYLOAD)
+        setup.commit()
+        # Both snippets are orphans once the payload is rewritten.
+        set_general_task_payload(setup, record, {"answer": "rewritten"})
+        setup.commit()
+        setup.close()
+
+        writer, purger = Session(), Session()
+        try:
+            # The writer has packed a payload that reuses both snippets but not linked them yet.
+            pack_general_payload(writer, PAYLOAD)
+            assert purge_orphan_snippets(purger) == 0
+            purger.commit()
+            _log(writer, "alice", "b" * 32, PAYLOAD)
+            assert purge_orphan_snippets(purger) == 0
+            assert purger.query(SourceSnippetDB).count() == 2
+        finally:
+            writer.close()
+            purger.close()
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+        admin.dispose()
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("General task payload test")
+    print("=" * 80)
+    for test in (
+        test_round_trip_is_byte_identical,
+        test_snippets_are_shared_and_orphans_purged,
+        test_purge_skips_snippet_reused_concurrently,
+    ):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
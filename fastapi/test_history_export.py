@@ -0,0 +1,164 @@
+"""
+Smoke test for the streamed history exports.
+
+Runs against an in-memory SQLite database. Checks the NDJSON and gzip/CSV
+output of /api/assistant/history/export for one user and of
+/admin/history/export for everyone, that users can only export their own
+history, and that other users' and the full export are refused to accounts
+that are not in ADMIN_EMAILS.
+
+    python test_history_export.py
+"""
+import sys
+import os
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from main import app
+from config import settings
+from database import Base, UserDB, AssistantHistoryDB, GeneralTaskHistoryDB, get_db
+from services import history_export
+
+ROWS_PER_USER = 1500  # several FLUSH_BYTES chunks per export
+
+
+def _setup():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    start = datetime(2025, 1, 1)
+    for user_id in ("alice", "bob"):
+        db.add(UserDB(id=user_id, email=f"{user_id}@example.com", name=user_id.title()))
+        db.flush()
+        for n in range(ROWS_PER_USER):
+            db.add(
+                AssistantHistoryDB(
+                    user_id=user_id, task_name="General", question=f"{user_id} question {n}, with comma",
+                    answer="line one\nline two", response_time_ms=n, created_at=start + timedelta(minutes=2 * n),
+                )
+            )
+        db.add(
+            GeneralTaskHistoryDB(
+                user_id=user_id, token=f"{user_id}-token".ljust(32, "x"), task_name="Summary",
+                query="summarise", answer="done", created_at=start + timedelta(minutes=1),
+            )
+        )
+    db.commit()
+    return Session, db
+
+
+class _Fixture:
+    def __enter__(self):
+        Session, self.db = _setup()
+        self.saved_session = history_export.SessionLocal
+        history_export.SessionLocal = Session
+        app.dependency_overrides[get_db] = lambda: self.db
+        return TestClient(app)
+
+    def __exit__(self, *exc):
+        history_export.SessionLocal = self.saved_session
+        app.dependency_overrides.clear()
+        self.db.close()
+
+
+def _auth(email):
+    token = jwt.encode({"sub": email, "exp": datetime.utcnow() + timedelta(minutes=5)}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _check_order(created):
+    assert created == sorted(created, reverse=True)
+
+
+def test_user_export_ndjson():
+    with _Fixture() as client:
+        response = client.get("/api/assistant/history/export", headers=_auth("alice@example.com"))
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rows) == ROWS_PER_USER + 1
+        assert {row["user_id"] for row in rows} == {"alice"}
+        assert {row["entry_type"] for row in rows} == {"analysis", "general"}
+        assert rows[0]["answer"] == "line one\nline two"
+        _check_order([row["created_at"] for row in rows])
+
+
+def test_user_export_gzip_csv():
+    with _Fixture() as client:
+        response = client.get(
+            "/api/assistant/history/export?user_email=bob@example.com&format=csv&gzip=true",
+            headers=_auth("bob@example.com"),
+        )
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"] == "application/gzip"
+        assert 'filename="history.csv.gz"' in response.headers["content-disposition"]
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode("utf-8"))))
+        assert len(rows) == ROWS_PER_USER + 1
+        assert list(rows[0]) == history_export.EXPORT_FIELDS
+        assert {row["user_id"] for row in rows} == {"bob"}
+        assert any(row["question"] == "bob question 7, with comma" for row in rows)
+        _check_order([row["created_at"] for row in rows])
+
+
+def test_user_export_is_own_history_only():
+    with _Fixture() as client:
+        assert client.get("/api/assistant/history/export?user_id=alice").status_code in (401, 403)
+        url = "/api/assistant/history/export?user_id=bob"
+        assert client.get(url, headers=_auth("alice@example.com")).status_code == 403
+
+        original = settings.ADMIN_EMAILS
+        settings.ADMIN_EMAILS = ["alice@example.com"]
+        try:
+            response = client.get(url, headers=_auth("alice@example.com"))
+        finally:
+            settings.ADMIN_EMAILS = original
+        assert response.status_code == 200
+        assert {json.loads(line)["user_id"] for line in response.text.splitlines()} == {"bob"}
+
+
+def test_admin_export_needs_admin():
+    with _Fixture() as client:
+        assert client.get("/admin/history/export").status_code in (401, 403)
+        assert client.get("/admin/history/export", headers=_auth("alice@example.com")).status_code == 403
+
+        original = settings.ADMIN_EMAILS
+        settings.ADMIN_EMAILS = ["alice@example.com"]
+        try:
+            response = client.get("/admin/history/export?format=csv&gzip=true", headers=_auth("alice@example.com"))
+        finally:
+            settings.ADMIN_EMAILS = original
+        assert response.status_code == 200
+        assert 'filename="history-all.csv.gz"' in response.headers["content-disposition"]
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode("utf-8"))))
+        assert len(rows) == 2 * (ROWS_PER_USER + 1)
+        assert {row["user_id"] for row in rows} == {"alice", "bob"}
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("History export test")
+    print("=" * 80)
+    for test in (
+        test_user_export_ndjson,
+        test_user_export_gzip_csv,
+        test_user_export_is_own_history_only,
+        test_admin_export_needs_admin,
+    ):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
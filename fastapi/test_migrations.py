@@ -0,0 +1,141 @@
+"""
+Smoke test for the PostgreSQL partition maintenance in migrations.py.
+
+Needs a PostgreSQL server: set TEST_DATABASE_URL (e.g.
+postgresql://postgres@localhost/postgres); without it the test is skipped.
+Everything runs in a throwaway schema. Checks that assistant_history is
+converted to monthly partitions with its rows intact, that startup never
+moves rows out of the default partition while the retention job does, and
+that retention rolls up and drops old months and trims the default partition.
+
+    TEST_DATABASE_URL=postgresql://... python test_migrations.py
+"""
+import sys
+import os
+import uuid
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sqlalchemy import create_engine, text
+
+import migrations
+from config import settings
+from database import Base
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+TABLE = "assistant_history"
+
+
+class _Schema:
+    """Creates every table in a fresh schema and drops it afterwards."""
+
+    def __enter__(self):
+        self.name = f"test_migrations_{uuid.uuid4().hex[:8]}"
+        self.admin = create_engine(TEST_DATABASE_URL)
+        with self.admin.begin() as conn:
+            conn.execute(text(f'CREATE SCHEMA "{self.name}"'))
+        self.engine = create_engine(TEST_DATABASE_URL, connect_args={"options": f"-csearch_path={self.name}"})
+        Base.metadata.create_all(self.engine)
+        return self.engine
+
+    def __exit__(self, *exc):
+        self.engine.dispose()
+        with self.admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA "{self.name}" CASCADE'))
+        self.admin.dispose()
+
+
+def _add(conn, created_at):
+    conn.execute(
+        text(
+            "INSERT INTO assistant_history (user_id, task_name, question, answer, response_time_ms, created_at) "
+            "VALUES ('alice', 'General', 'q', 'a', 100, :created_at)"
+        ),
+        {"created_at": created_at},
+    )
+
+
+def _count(conn, table, where="TRUE", **params):
+    return conn.execute(text(f'SELECT count(*) FROM "{table}" WHERE {where}'), params).scalar()
+
+
+def test_partition_default_and_retention():
+    if not TEST_DATABASE_URL:
+        print("   - TEST_DATABASE_URL not set; skipping PostgreSQL migration checks")
+        return
+
+    this_month = migrations._month_start(migrations.datetime.utcnow())
+    old = migrations._add_months(this_month, -14) + timedelta(days=3)
+    future_month = migrations._add_months(this_month, 3)
+    default = migrations.default_partition_name(TABLE)
+    future = migrations.partition_name(TABLE, future_month)
+
+    with _Schema() as engine:
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO users (id, email, name) VALUES ('alice', 'alice@example.com', 'Alice')"))
+            for created_at in (old, this_month + timedelta(days=1), future_month + timedelta(days=2)):
+                _add(conn, created_at)
+
+        # Conversion: months from the oldest row through one ahead, the rest in the default partition.
+        assert migrations.partition_table(engine, TABLE, months_ahead=1)
+        assert not migrations.partition_table(engine, TABLE, months_ahead=1)
+        with engine.begin() as conn:
+            assert migrations.is_partitioned(conn, TABLE)
+            assert _count(conn, TABLE) == 3 and _count(conn, default) == 1
+            assert migrations.list_partitions(conn, TABLE)[0][1] == migrations._month_start(old)
+
+        # Startup leaves the month with rows in the default partition alone.
+        original = settings.PARTITION_MONTHS_AHEAD
+        settings.PARTITION_MONTHS_AHEAD = 4
+        try:
+            migrations.apply_schema_upgrades(engine)
+        finally:
+            settings.PARTITION_MONTHS_AHEAD = original
+        with engine.begin() as conn:
+            assert not migrations._relation_exists(conn, future)
+            assert migrations._relation_exists(conn, migrations.partition_name(TABLE, migrations._add_months(this_month, 4)))
+            assert _count(conn, default) == 1
+
+        # The maintenance path moves the rows into their new month and reattaches the default.
+        with engine.begin() as conn:
+            migrations.ensure_monthly_partitions(conn, TABLE, months_ahead=4, move_default_rows=True)
+        with engine.begin() as conn:
+            assert _count(conn, future) == 1 and _count(conn, default) == 0 and _count(conn, TABLE) == 3
+            attached = conn.execute(
+                text("SELECT pg_get_expr(relpartbound, oid) FROM pg_class WHERE oid = to_regclass(:name)"),
+                {"name": default},
+            ).scalar()
+            assert attached == "DEFAULT", attached
+
+        # Retention drops the eight months before the cutoff and rolls them up.
+        assert migrations.apply_retention(engine, TABLE, keep_months=6) == 8
+        with engine.begin() as conn:
+            assert _count(conn, TABLE) == 2
+            assert migrations.list_partitions(conn, TABLE)[0][1] == migrations._add_months(this_month, -6)
+            assert _count(conn, "assistant_history_monthly", "month = :month", month=migrations._month_start(old)) == 1
+            # A late row for a dropped month lands in the default partition.
+            _add(conn, migrations._add_months(this_month, -10))
+            assert _count(conn, default) == 1
+
+        assert migrations.apply_retention(engine, TABLE, keep_months=6) == 0
+        with engine.begin() as conn:
+            assert _count(conn, default) == 0 and _count(conn, TABLE) == 2
+            rolled = conn.execute(
+                text("SELECT queries FROM assistant_history_monthly WHERE month = :month"),
+                {"month": migrations._add_months(this_month, -10)},
+            ).scalar()
+            assert rolled == 1
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Migrations test")
+    print("=" * 80)
+    for test in (test_partition_default_and_retention,):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Smoke test for per-stage timings and token usage in the v2 pipeline.
+
+Runs answer_llm2.answer_query with a fake Azure client (every completion
+reports usage) and an in-memory Qdrant, then checks the timings attached to
+the response, the Prometheus output and that /query-v2 only returns timings
+when asked for them.
+
+    python test_pipeline_instrumentation.py
+"""
+import sys
+import os
+import json
+import random
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from qdrant_client import QdrantClient, models
+
+from api_assistant import router
+from services import answer_llm2, metrics
+
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+DIMENSIONS = 8
+
+
+class _FakeChat:
+    def create(self, *, messages, **kwargs):
+        system = messages[0]["content"]
+        if "rewriter" in system:
+            content = json.dumps(["Section 420 IPC cheating", "punishment for cheating"])
+        elif "reranker" in system:
+            content = json.dumps([{"id": 0, "score": 0.9}, {"id": 1, "score": 0.8}])
+        elif "validator" in system:
+            content = "✅ Verified"
+        else:
+            content = "1️⃣ Section 420, Indian Penal Code, 1860"
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=len(content) // 4)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+class _FakeEmbeddings:
+    def create(self, *, model, input):
+        rng = random.Random(len(input))
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=[rng.uniform(-1, 1) for _ in range(DIMENSIONS)]) for i in range(len(input))]
+        )
+
+
+def _qdrant():
+    rng = random.Random(4)
+    client = QdrantClient(":memory:")
+    for collection in answer_llm2.COLLECTIONS:
+        client.create_collection(collection, vectors_config=models.VectorParams(size=DIMENSIONS, distance=models.Distance.COSINE))
+        client.upsert(
+            collection,
+            points=[
+                models.PointStruct(
+                    id=i,
+                    vector=[rng.uniform(-1, 1) for _ in range(DIMENSIONS)],
+                    payload={"page_content": f"clause {i}", "act_title": "Indian Penal Code"},
+                )
+                for i in range(20)
+            ],
+        )
+    return client
+
+
+def _patched(fn):
+    original = answer_llm2.llm, answer_llm2.qdrant
+    answer_llm2.llm = SimpleNamespace(chat=SimpleNamespace(completions=_FakeChat()), embeddings=_FakeEmbeddings())
+    answer_llm2.qdrant = _qdrant()
+    try:
+        return fn()
+    finally:
+        answer_llm2.llm, answer_llm2.qdrant = original
+
+
+def test_answer_carries_stage_timings():
+    response = _patched(lambda: answer_llm2.answer_query("What is the punishment for cheating?", top_k=3, threshold=0.0))
+    timings = response.timings
+    assert timings is not None
+    expected = {"rewrite_queries", "embed", "multi_search", "llm_rerank", "generate_answer", "validate_citations"}
+    assert expected <= set(timings.stages_ms), timings.stages_ms
+    assert timings.total_ms >= sum(timings.stages_ms.values()) - 1
+    assert timings.tokens["rewrite_queries"].prompt == 100
+    assert set(timings.tokens) == {"rewrite_queries", "llm_rerank", "generate_answer", "validate_citations"}
+
+    exposition = metrics.render()
+    assert 'rag_stage_seconds_count{pipeline="query-v2",stage="generate_answer"}' in exposition
+    assert 'rag_llm_tokens_total{pipeline="query-v2",stage="llm_rerank",kind="prompt"}' in exposition
+    print("stage ms:", timings.stages_ms)
+
+
+def test_endpoint_returns_timings_on_request():
+    def call():
+        with TestClient(app) as client:
+            plain = client.post("/api/assistant/query-v2", json={"query": "cheating", "threshold": 0.0})
+            timed = client.post("/api/assistant/query-v2", json={"query": "cheating", "threshold": 0.0, "include_timings": True})
+        return plain, timed
+
+    plain, timed = _patched(call)
+    assert plain.status_code == 200 and timed.status_code == 200, (plain.text, timed.text)
+    assert plain.json()["timings"] is None
+    assert "generate_answer" in timed.json()["timings"]["stages_ms"]
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Pipeline instrumentation test")
+    print("=" * 80)
+    for test in (test_answer_carries_stage_timings, test_endpoint_returns_timings_on_request):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
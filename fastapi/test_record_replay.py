@@ -0,0 +1,162 @@
+"""
+Smoke test for the benchmark record/replay fixtures.
+
+Records one answer_llm2.answer_query run against a fake Azure client and an
+in-memory Qdrant, then replays it with the real clients removed and checks
+the answer is identical. Also checks that a batched search recorded once
+replays as separate calls, that streamed completions keep their chunks, and
+that an unrecorded request fails loudly.
+
+    python test_record_replay.py
+"""
+import sys
+import os
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "benchmarks"))
+
+from openai.types import CreateEmbeddingResponse
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from qdrant_client import QdrantClient, models
+
+from record_replay import FixtureMiss, FixtureOpenAI, FixtureQdrant, FixtureSession, fixtures
+from services import answer_llm2
+
+DIMENSIONS = 8
+
+
+class _FakeAzure:
+    """Minimal Azure client returning real SDK response types."""
+
+    def __init__(self):
+        self.chat = self
+        self.completions = self
+        self.embeddings = _FakeEmbeddings()
+
+    def create(self, *, messages, stream=False, **kwargs):
+        system = messages[0]["content"]
+        if "rewriter" in system:
+            content = '["Section 420 IPC cheating", "punishment for cheating"]'
+        elif "reranker" in system:
+            content = '[{"id": 1, "score": 0.9}, {"id": 0, "score": 0.8}]'
+        elif "validator" in system:
+            content = "✅ Verified"
+        else:
+            content = "1️⃣ Section 420, Indian Penal Code, 1860"
+        if stream:
+            return iter(
+                ChatCompletionChunk.model_validate(
+                    {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m",
+                     "choices": [{"index": 0, "delta": {"content": part}}]}
+                )
+                for part in (content[:10], content[10:])
+            )
+        return ChatCompletion.model_validate(
+            {
+                "id": "c", "object": "chat.completion", "created": 0, "model": "m",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110},
+            }
+        )
+
+
+class _FakeEmbeddings:
+    def create(self, *, model, input):
+        rows = [[random.Random(text).uniform(-1, 1) for _ in range(DIMENSIONS)] for text in input]
+        return CreateEmbeddingResponse.model_validate(
+            {
+                "object": "list", "model": model,
+                "data": [{"object": "embedding", "index": i, "embedding": row} for i, row in enumerate(rows)],
+                "usage": {"prompt_tokens": 4 * len(rows), "total_tokens": 4 * len(rows)},
+            }
+        )
+
+
+def _qdrant():
+    rng = random.Random(4)
+    client = QdrantClient(":memory:")
+    for collection in answer_llm2.COLLECTIONS:
+        client.create_collection(collection, vectors_config=models.VectorParams(size=DIMENSIONS, distance=models.Distance.COSINE))
+        client.upsert(
+            collection,
+            points=[
+                models.PointStruct(
+                    id=i,
+                    vector=[rng.uniform(-1, 1) for _ in range(DIMENSIONS)],
+                    payload={"page_content": f"clause {i}", "act_title": "Indian Penal Code"},
+                )
+                for i in range(20)
+            ],
+        )
+    return client
+
+
+def _answer(query):
+    response = answer_llm2.answer_query(query, top_k=3, threshold=0.0)
+    return response.model_dump(exclude={"timings"})
+
+
+def test_replay_matches_recording():
+    original = answer_llm2.llm, answer_llm2.qdrant
+    path = os.path.join(tempfile.mkdtemp(), "pipeline.jsonl.gz")
+    try:
+        answer_llm2.llm, answer_llm2.qdrant = _FakeAzure(), _qdrant()
+        with fixtures(path, "record"):
+            recorded = _answer("What is the punishment for cheating?")
+
+        answer_llm2.llm = answer_llm2.qdrant = None
+        with fixtures(path, "replay", latency_scale=0) as session:
+            replayed = _answer("What is the punishment for cheating?")
+            assert session.calls["chat"] == 4 and session.calls["search_batch"] == 3
+            try:
+                answer_llm2.answer_query("An unrecorded question", top_k=3, threshold=0.0)
+            except RuntimeError as exc:
+                assert isinstance(exc.__cause__, FixtureMiss), repr(exc.__cause__)
+            else:
+                raise AssertionError("unrecorded embedding should fail")
+    finally:
+        answer_llm2.llm, answer_llm2.qdrant = original
+    assert replayed == recorded
+    assert replayed["sources"], replayed
+
+
+def test_batched_search_replays_per_request():
+    path = os.path.join(tempfile.mkdtemp(), "search.jsonl.gz")
+    collection = answer_llm2.COLLECTIONS[0]
+    requests = [models.SearchRequest(vector=[float(i == j) for j in range(DIMENSIONS)], limit=3, with_payload=True) for i in range(2)]
+
+    recording = FixtureSession(path, "record")
+    batched = FixtureQdrant(recording, _qdrant()).search_batch(collection_name=collection, requests=requests)
+    recording.save()
+
+    replay = FixtureQdrant(FixtureSession(path, "replay", latency_scale=0))
+    separate = [replay.search_batch(collection_name=collection, requests=[request])[0] for request in reversed(requests)]
+    assert [[p.id for p in points] for points in separate] == [[p.id for p in points] for points in reversed(batched)]
+
+
+def test_stream_replays_chunks():
+    path = os.path.join(tempfile.mkdtemp(), "stream.jsonl.gz")
+    messages = [{"role": "system", "content": "generator"}, {"role": "user", "content": "q"}]
+
+    recording = FixtureSession(path, "record")
+    recorded = [c.choices[0].delta.content for c in FixtureOpenAI(recording, _FakeAzure()).chat.completions.create(model="m", messages=messages, stream=True)]
+    recording.save()
+
+    client = FixtureOpenAI(FixtureSession(path, "replay", latency_scale=0))
+    replayed = [c.choices[0].delta.content for c in client.chat.completions.create(model="other", messages=messages, stream=True)]
+    assert replayed == recorded and len(replayed) == 2
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Record/replay fixtures test")
+    print("=" * 80)
+    for test in (test_replay_matches_recording, test_batched_search_replays_per_request, test_stream_replays_chunks):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Smoke test for coalesced Qdrant searches against an in-memory Qdrant.
+
+Runs concurrent searches through a SearchBatcher and checks that they match
+direct searches, that they share a few search_batch calls per collection,
+and that answer_llm2.multi_search still merges all collections.
+
+    python test_search_batcher.py
+"""
+import sys
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from qdrant_client import QdrantClient, models
+
+from services.search_batcher import SearchBatcher
+
+DIMENSIONS = 16
+
+
+def _vector(rng):
+    return [rng.uniform(-1, 1) for _ in range(DIMENSIONS)]
+
+
+def _client(collections, points=200, seed=5):
+    rng = random.Random(seed)
+    client = QdrantClient(":memory:")
+    for collection in collections:
+        client.create_collection(collection, vectors_config=models.VectorParams(size=DIMENSIONS, distance=models.Distance.COSINE))
+        client.upsert(
+            collection,
+            points=[models.PointStruct(id=i, vector=_vector(rng), payload={"collection": collection, "n": i}) for i in range(points)],
+        )
+    return client
+
+
+class _CountingClient:
+    """Wraps a client and records the size of every search_batch call."""
+
+    def __init__(self, client):
+        self.client = client
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def search_batch(self, collection_name, requests):
+        with self._lock:
+            self.batches.append((collection_name, len(requests)))
+        return self.client.search_batch(collection_name=collection_name, requests=requests)
+
+
+def test_concurrent_searches_coalesce():
+    counting = _CountingClient(_client(["acts"]))
+    batcher = SearchBatcher(lambda: counting, name="test", window_ms=10, max_requests=32)
+    rng = random.Random(11)
+    queries = [_vector(rng) for _ in range(64)]
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        batched = list(pool.map(lambda vector: batcher.search("acts", vector, 5), queries))
+
+    for vector, points in zip(queries, batched):
+        direct = counting.client.query_points("acts", query=vector, limit=5).points
+        assert [p.id for p in points] == [p.id for p in direct]
+        assert points[0].payload["collection"] == "acts"
+    assert len(counting.batches) < 16, counting.batches
+    print(f"64 searches -> {len(counting.batches)} search_batch calls")
+
+
+def test_multi_search_merges_collections():
+    from services import answer_llm2
+
+    original = answer_llm2.qdrant
+    answer_llm2.qdrant = _client(answer_llm2.COLLECTIONS, points=30)
+    try:
+        hits = answer_llm2.multi_search(_vector(random.Random(2)), top_k=4)
+    finally:
+        answer_llm2.qdrant = original
+    assert len(hits) == 4 * len(answer_llm2.COLLECTIONS)
+    assert {hit.collection for hit in hits} == set(answer_llm2.COLLECTIONS)
+    assert [hit.score for hit in hits] == sorted((hit.score for hit in hits), reverse=True)
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Qdrant search coalescing test")
+    print("=" * 80)
+    for test in (test_concurrent_searches_coalesce, test_multi_search_merges_collections):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Smoke test for single-flight coalescing of assistant queries.
+
+Replaces the v2 pipeline with a slow fake and sends a burst of identical
+/api/assistant/query-v2 requests: they must share one pipeline run, also
+when they differ only in whitespace, while a request with different
+parameters or different case runs on its own. Also checks that errors
+reach every waiter and that a cancelled waiter does not cancel the shared run.
+
+    python test_single_flight.py
+"""
+import sys
+import os
+import asyncio
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import httpx
+from fastapi import FastAPI
+
+from api_assistant import router
+from services import answer_llm2
+from services.single_flight import SingleFlight
+
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+
+def _fake_pipeline(calls):
+    lock = threading.Lock()
+
+    def answer_query(query, top_k=5, threshold=0.7, validate=True):
+        with lock:
+            calls.append((query, top_k))
+        time.sleep(0.2)
+        return answer_llm2.AnswerResponse(query=query.strip(), answer=f"answer to {query.strip()}", expanded_queries=[], sources=[])
+
+    return answer_query
+
+
+def test_identical_queries_share_one_run():
+    calls = []
+    original = answer_llm2.answer_query
+    answer_llm2.answer_query = _fake_pipeline(calls)
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            same = [
+                client.post("/api/assistant/query-v2", json={"query": query})
+                for query in ["What is Section 420 IPC?"] * 8 + ["  What is Section 420\n IPC? "] * 4
+            ]
+            different = client.post("/api/assistant/query-v2", json={"query": "What is Section 420 IPC?", "top_k": 9})
+            lowercase = client.post("/api/assistant/query-v2", json={"query": "what is section 420 ipc?"})
+            return await asyncio.gather(*same, different, lowercase)
+
+    try:
+        started = time.perf_counter()
+        responses = asyncio.run(burst())
+        elapsed = time.perf_counter() - started
+    finally:
+        answer_llm2.answer_query = original
+
+    assert all(response.status_code == 200 for response in responses), [r.text for r in responses]
+    assert len(calls) == 3, calls
+    assert sorted(top_k for _, top_k in calls) == [5, 5, 9]
+    # The pipeline sees the text it was keyed on, never another caller's spelling.
+    assert {query for query, _ in calls} == {"What is Section 420 IPC?", "what is section 420 ipc?"}
+    assert responses[-1].json()["answer"] == "answer to what is section 420 ipc?"
+    assert elapsed < 1.0, elapsed
+    print(f"14 requests -> {len(calls)} pipeline runs in {elapsed * 1000:.0f}ms")
+
+
+def test_errors_and_cancellation():
+    flights = SingleFlight("test")
+    runs = []
+
+    async def failing():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("pipeline down")
+
+    async def slow():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        results = await asyncio.gather(*(flights.run("k", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        quitter = asyncio.ensure_future(flights.run("s", slow))
+        stayer = asyncio.ensure_future(flights.run("s", slow))
+        await asyncio.sleep(0)
+        quitter.cancel()
+        assert await stayer == "done"
+        assert len(flights) == 0
+
+    asyncio.run(scenario())
+    assert len(runs) == 2
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Single-flight query coalescing test")
+    print("=" * 80)
+    for test in (test_errors_and_cancellation, test_identical_queries_share_one_run):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Smoke test for the streaming multipart parser behind /analysis/upload.
+
+Feeds hand-built multipart bodies through ``uploads.receive_upload`` in
+awkward chunkings and checks that the file and fields come out intact, that
+oversized uploads are cut off (413 from the endpoint), that large files roll
+over to disk, and that spooled temp files are removed when parsing fails.
+
+    python test_uploads.py
+"""
+import sys
+import os
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from api_assistant import router
+from config import settings
+from services import uploads
+
+BOUNDARY = "test-boundary-7MA4YWxk"
+
+
+def _body(parts):
+    """Build a multipart body from (name, value) or (name, filename, content) tuples."""
+    out = b""
+    for part in parts:
+        if len(part) == 2:
+            name, value = part
+            out += f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode()
+            out += value.encode() + b"\r\n"
+        else:
+            name, filename, content = part
+            out += (
+                f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                "Content-Type: application/octet-stream\r\n\r\n"
+            ).encode()
+            out += content + b"\r\n"
+    return out + f"--{BOUNDARY}--\r\n".encode()
+
+
+def _request(chunks):
+    async def receive():
+        for index, chunk in enumerate(chunks):
+            yield {"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1}
+
+    messages = receive()
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/assistant/analysis/upload",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())],
+    }
+    return Request(scope, messages.__anext__)
+
+
+def _split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)] or [b""]
+
+
+def _receive(chunks, max_bytes=1024 * 1024):
+    upload, fields = asyncio.run(uploads.receive_upload(_request(chunks), max_bytes=max_bytes))
+    try:
+        with upload.open_buffer() as view:
+            content = bytes(view)
+        return upload, content, fields
+    finally:
+        upload.close()
+
+
+def _expect(error, chunks, max_bytes=1024 * 1024):
+    try:
+        asyncio.run(uploads.receive_upload(_request(chunks), max_bytes=max_bytes))
+    except error as exc:
+        return exc
+    raise AssertionError(f"expected {error.__name__}")
+
+
+class _spool_limit:
+    """Lowers UPLOAD_SPOOL_BYTES and sends temp files to a private directory."""
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def __enter__(self):
+        self.saved = (uploads.UPLOAD_SPOOL_BYTES, tempfile.tempdir)
+        self.directory = tempfile.TemporaryDirectory()
+        uploads.UPLOAD_SPOOL_BYTES = self.limit
+        tempfile.tempdir = self.directory.name
+        return self
+
+    def files(self):
+        return os.listdir(self.directory.name)
+
+    def __exit__(self, *exc):
+        uploads.UPLOAD_SPOOL_BYTES, tempfile.tempdir = self.saved
+        self.directory.cleanup()
+
+
+def test_boundary_split_across_reads():
+    content = os.urandom(5000)
+    body = _body([("instructions", "Summarise the lease."), ("file", "lease.pdf", content), ("mode", "single")])
+    delimiter = body.index(f"\r\n--{BOUNDARY}".encode(), body.index(b"filename="))
+    # Cut inside the delimiter after the file at every offset, and also in tiny reads.
+    for cut in range(delimiter, delimiter + len(BOUNDARY) + 5):
+        upload, received, fields = _receive([body[:cut], body[cut:]])
+        assert received == content and upload.filename == "lease.pdf"
+        assert fields == {"instructions": "Summarise the lease.", "mode": "single"}
+    for size in (1, 7, 64):
+        _, received, fields = _receive(_split(body, size))
+        assert received == content and fields["mode"] == "single"
+
+
+def test_crlf_and_boundary_lookalikes_in_file_data():
+    content = b"line one\r\nline two\r\n\r\n--" + BOUNDARY[:-1].encode() + b"\r\n--not-it\r\n" + b"\r\n" * 50
+    body = _body([("file", "notes.txt", content)])
+    for size in (3, 11, len(body)):
+        upload, received, _ = _receive(_split(body, size))
+        assert received == content and upload.size == len(content)
+
+
+def test_missing_and_extra_fields():
+    _, _, fields = _receive([_body([("file", "a.txt", b"text")])])
+    assert fields == {}
+    assert "No file" in str(_expect(uploads.InvalidUploadError, [_body([("instructions", "x")])]))
+    two_files = _body([("file", "a.txt", b"a"), ("file", "b.txt", b"b")])
+    assert "exactly one file" in str(_expect(uploads.InvalidUploadError, [two_files]))
+    wrong_field = _body([("document", "a.txt", b"a")])
+    assert "exactly one file" in str(_expect(uploads.InvalidUploadError, [wrong_field]))
+    too_many = _body([(f"f{n}", "v") for n in range(uploads.MAX_FIELDS + 1)] + [("file", "a.txt", b"a")])
+    assert "Too many" in str(_expect(uploads.InvalidUploadError, [too_many]))
+    huge_field = _body([("instructions", "x" * (uploads.MAX_FIELD_BYTES + 1)), ("file", "a.txt", b"a")])
+    assert "too large" in str(_expect(uploads.InvalidUploadError, [huge_field]))
+
+
+def test_over_limit_stops_streaming():
+    chunks = _split(_body([("file", "big.pdf", b"x" * 10_000)]), 1000)
+    request = _request(chunks)
+    consumed = []
+    original = request.stream
+
+    async def stream():
+        async for chunk in original():
+            consumed.append(chunk)
+            yield chunk
+
+    request.stream = stream
+    try:
+        asyncio.run(uploads.receive_upload(request, max_bytes=4000))
+    except uploads.UploadTooLargeError as exc:
+        assert exc.limit == 4000
+    else:
+        raise AssertionError("expected UploadTooLargeError")
+    # The parser gives up on the read that crosses the limit, not at the end of the body.
+    assert len(consumed) == 5, len(consumed)
+
+
+def test_over_limit_endpoint_returns_413():
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    client = TestClient(app)
+    original = settings.MAX_UPLOAD_SIZE
+    settings.MAX_UPLOAD_SIZE = 2000
+    try:
+        body = _body([("file", "big.pdf", b"x" * 50_000)])
+        headers = {"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+        response = client.post("/api/assistant/analysis/upload", content=body, headers=headers)
+        assert response.status_code == 413, response.text
+
+        def chunked():
+            yield from _split(body, 1024)
+
+        response = client.post("/api/assistant/analysis/upload", content=chunked(), headers=headers)
+        assert response.status_code == 413, response.text
+    finally:
+        settings.MAX_UPLOAD_SIZE = original
+
+
+def test_large_upload_rolls_over_to_disk():
+    content = os.urandom(20_000)
+    with _spool_limit(4096) as spool:
+        upload, _ = asyncio.run(
+            uploads.receive_upload(_request(_split(_body([("file", "big.pdf", content)]), 1500)), max_bytes=100_000)
+        )
+        try:
+            assert upload.on_disk and upload.path and os.path.exists(upload.path)
+            assert upload.path.endswith(".pdf") and spool.files()
+            with upload.open_buffer() as view:
+                assert bytes(view) == content
+        finally:
+            upload.close()
+        assert upload.path is None and spool.files() == []
+
+    small, received, _ = _receive([_body([("file", "small.txt", b"tiny")])])
+    assert not small.on_disk and received == b"tiny"
+
+
+def test_temp_file_removed_on_error():
+    with _spool_limit(1024) as spool:
+        # Rolls over to disk, then runs past the size limit.
+        _expect(uploads.UploadTooLargeError, _split(_body([("file", "big.pdf", b"y" * 30_000)]), 2048), max_bytes=10_000)
+        assert spool.files() == []
+        # Rolls over to disk, then a second file part makes the body invalid.
+        body = _body([("file", "a.pdf", b"z" * 5000), ("file", "b.pdf", b"z")])
+        _expect(uploads.InvalidUploadError, _split(body, 2048))
+        assert spool.files() == []
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Streaming upload test")
+    print("=" * 80)
+    for test in (
+        test_boundary_split_across_reads,
+        test_crlf_and_boundary_lookalikes_in_file_data,
+        test_missing_and_extra_fields,
+        test_over_limit_stops_streaming,
+        test_over_limit_endpoint_returns_413,
+        test_large_upload_rolls_over_to_disk,
+        test_temp_file_removed_on_error,
+    ):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Smoke test for the hourly usage rollups and GET /api/assistant/stats.
+
+Runs against an in-memory SQLite database. Checks that history and credit
+rows fold into the rollups once, that a low-id row still inside the settle
+window holds the watermark back instead of being skipped, and that /stats
+needs a token and only shows other users' usage to admins.
+
+    python test_usage_stats.py
+"""
+import sys
+import os
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from api_assistant import router
+from config import settings
+from database import (
+    Base,
+    UserDB,
+    AssistantHistoryDB,
+    CreditPlanDB,
+    CreditUsageDB,
+    StatsWatermarkDB,
+    get_db,
+)
+from services import usage_stats
+
+
+def _make_session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    for user_id in ("alice", "bob"):
+        db.add(UserDB(id=user_id, email=f"{user_id}@example.com", name=user_id.title()))
+    db.flush()
+    return db
+
+
+def _history(db, user_id, created_at, response_time_ms=400):
+    db.add(
+        AssistantHistoryDB(
+            user_id=user_id, task_name="General", question="q", answer="a",
+            response_time_ms=response_time_ms, created_at=created_at,
+        )
+    )
+    db.commit()
+
+
+def _watermark(db, source):
+    return db.query(StatsWatermarkDB).filter(StatsWatermarkDB.source == source).one().last_id
+
+
+def test_rollup_counts_history_and_credits_once():
+    db = _make_session()
+    old = datetime.utcnow() - timedelta(hours=2)
+    for latency in (100, 400, 900):
+        _history(db, "alice", old, latency)
+    _history(db, "bob", old, 2500)
+    plan = CreditPlanDB()
+    db.add(plan)
+    db.flush()
+    db.add(CreditUsageDB(user_id="alice", credit_id=plan.credit_id, task="General", credit_reduct=3, created_at=old))
+    db.commit()
+
+    assert usage_stats.refresh_rollups(db) == 5
+    assert usage_stats.refresh_rollups(db) == 0
+
+    buckets = {b["key"]: b for b in usage_stats.get_stats(db, since=old - timedelta(hours=1), group_by="user")}
+    assert buckets["alice"]["requests"] == 3 and buckets["bob"]["requests"] == 1
+    assert buckets["alice"]["avg_ms"] == round((100 + 400 + 900) / 3, 1)
+    assert buckets["alice"]["credits_spent"] == 3 and buckets["bob"]["credits_spent"] == 0
+    by_task = usage_stats.get_stats(db, since=old - timedelta(hours=1), group_by="task")
+    assert [b["key"] for b in by_task] == ["General"] and by_task[0]["requests"] == 4
+
+
+def test_unsettled_low_id_holds_the_watermark():
+    db = _make_session()
+    now = datetime.utcnow()
+    # id 1 is still inside the settle window; id 2 settled long ago.
+    _history(db, "alice", now)
+    _history(db, "bob", now - timedelta(hours=1))
+
+    assert usage_stats.refresh_rollups(db) == 0
+    assert _watermark(db, "assistant_history") == 0
+
+    row = db.query(AssistantHistoryDB).filter(AssistantHistoryDB.user_id == "alice").one()
+    row.created_at = now - timedelta(minutes=5)
+    db.commit()
+    assert usage_stats.refresh_rollups(db) == 2
+    assert _watermark(db, "assistant_history") == 2
+    buckets = {b["key"]: b for b in usage_stats.get_stats(db, since=now - timedelta(hours=3), group_by="user")}
+    assert buckets["alice"]["requests"] == 1 and buckets["bob"]["requests"] == 1
+
+
+def _client(db):
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    app.dependency_overrides[get_db] = lambda: db
+    return TestClient(app)
+
+
+def _auth(email):
+    token = jwt.encode({"sub": email, "exp": datetime.utcnow() + timedelta(minutes=5)}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_stats_endpoint_requires_auth_and_scopes_to_caller():
+    db = _make_session()
+    old = datetime.utcnow() - timedelta(hours=2)
+    _history(db, "alice", old)
+    _history(db, "bob", old)
+    client = _client(db)
+
+    assert client.get("/api/assistant/stats").status_code in (401, 403)
+
+    own = client.get("/api/assistant/stats?group_by=user", headers=_auth("alice@example.com"))
+    assert own.status_code == 200, own.text
+    assert [b["key"] for b in own.json()["buckets"]] == ["alice"]
+    other = client.get("/api/assistant/stats?user_id=bob", headers=_auth("alice@example.com"))
+    assert other.status_code == 403
+
+    original = settings.ADMIN_EMAILS
+    settings.ADMIN_EMAILS = ["alice@example.com"]
+    try:
+        everyone = client.get("/api/assistant/stats?group_by=user", headers=_auth("alice@example.com"))
+        assert [b["key"] for b in everyone.json()["buckets"]] == ["alice", "bob"]
+        bob = client.get("/api/assistant/stats?user_id=bob", headers=_auth("alice@example.com"))
+        assert bob.status_code == 200 and bob.json()["buckets"][0]["requests"] == 1
+    finally:
+        settings.ADMIN_EMAILS = original
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Usage stats test")
+    print("=" * 80)
+    for test in (
+        test_rollup_counts_history_and_credits_once,
+        test_unsettled_low_id_holds_the_watermark,
+        test_stats_endpoint_requires_auth_and_scopes_to_caller,
+    ):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
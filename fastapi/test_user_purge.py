@@ -0,0 +1,125 @@
+"""
+Check that deleting a heavy user issues a constant number of SQL statements.
+
+Runs against an in-memory SQLite database with foreign keys enabled, so the
+ON DELETE CASCADE constraints do the work that the ORM used to do row by row.
+
+    python test_user_purge.py
+"""
+import sys
+import os
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+from database import (
+    Base,
+    UserDB,
+    UserInfoDB,
+    AssistantHistoryDB,
+    GeneralTaskHistoryDB,
+    DocumentAnalysisDB,
+    purge_user,
+)
+
+HISTORY_ROWS = 100_000
+USER_ID = "heavy-user"
+EMAIL = "heavy@example.com"
+
+
+def _make_session():
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def _enable_foreign_keys(dbapi_connection, _record):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    Base.metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine)()
+
+
+def _seed(db):
+    now = datetime.utcnow()
+    db.add(UserDB(id=USER_ID, email=EMAIL, name="Heavy User"))
+    db.add(UserDB(id="other-user", email="other@example.com", name="Other User"))
+    db.flush()
+    db.add(UserInfoDB(user_id=USER_ID))
+    db.add(DocumentAnalysisDB(token="t" * 32, result="{}"))
+    db.execute(
+        insert(AssistantHistoryDB),
+        [
+            {"user_id": USER_ID, "task_name": "General", "question": f"q{i}", "answer": "a", "created_at": now}
+            for i in range(HISTORY_ROWS)
+        ],
+    )
+    db.execute(
+        insert(AssistantHistoryDB),
+        [{"user_id": "other-user", "task_name": "General", "question": "q", "answer": "a", "created_at": now}],
+    )
+    db.add(GeneralTaskHistoryDB(user_id=USER_ID, token="g" * 32, task_name="General", query="q", answer="a"))
+    db.commit()
+
+
+class _StatementCounter:
+    def __init__(self, engine):
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+def _assert_children_cascaded(db):
+    assert db.query(UserDB).count() == 1
+    assert db.query(AssistantHistoryDB).count() == 1
+    assert db.query(AssistantHistoryDB).filter(AssistantHistoryDB.user_id == USER_ID).count() == 0
+    assert db.query(GeneralTaskHistoryDB).count() == 0
+    assert db.query(UserInfoDB).count() == 0
+
+
+def test_orm_delete_does_not_load_children():
+    engine, db = _make_session()
+    _seed(db)
+    user = db.get(UserDB, USER_ID)
+
+    counter = _StatementCounter(engine)
+    db.delete(user)
+    db.commit()
+
+    # SELECT for the expired user row, then a single DELETE FROM users.
+    assert len(counter.statements) <= 2, counter.statements
+    assert not any("assistant_history" in sql for sql in counter.statements), counter.statements
+    _assert_children_cascaded(db)
+
+
+def test_purge_user_statement_count():
+    engine, db = _make_session()
+    _seed(db)
+
+    counter = _StatementCounter(engine)
+    purged = purge_user(db, USER_ID)
+
+    # One lookup, one DELETE per table and one for orphaned snippets, regardless of history size.
+    assert len(counter.statements) == 5, counter.statements
+    assert purged["users"] == 1
+    _assert_children_cascaded(db)
+    # Analyses are shared by content, not owned by the user.
+    assert "document_analyses" not in purged
+    assert db.query(DocumentAnalysisDB).count() == 1
+    assert purge_user(db, USER_ID) == {}
+
+
+def main():
+    print("\n" + "=" * 80)
+    print(f"User purge test ({HISTORY_ROWS:,} history rows)")
+    print("=" * 80)
+    for test in (test_orm_delete_does_not_load_children, test_purge_user_statement_count):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
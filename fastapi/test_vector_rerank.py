@@ -0,0 +1,111 @@
+"""
+Smoke test for the array reranker in answer_llm.
+
+Checks that vector_rerank orders hits exactly like heuristic_rerank when
+they carry no vectors, that returned vectors and query rewrites drive the
+vector term, that MMR pushes near-duplicates down, and that qdrant_search
+returns point vectors when asked.
+
+    python test_vector_rerank.py
+"""
+import sys
+import os
+import random
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from qdrant_client import QdrantClient, models
+
+from services import answer_llm
+from services.answer_llm import Hit
+
+ACTS = ["Indian Evidence Act, 1872", "Code of Criminal Procedure, 1973", "Companies Act, 2013", "Indian Penal Code, 1860"]
+WORDS = "certificate electronic record admissible arrest bail quash board approval related party offence fine".split()
+
+
+def _hits(count, seed=7):
+    rng = random.Random(seed)
+    hits = []
+    for i in range(count):
+        payload = {
+            "doc_title": rng.choice(ACTS),
+            "section_number": str(rng.randint(1, 500)),
+            "section_heading": " ".join(rng.sample(WORDS, 2)),
+            "search_text": " ".join(rng.choice(WORDS) for _ in range(40)),
+            "unit_id": f"u{i}",
+        }
+        # Rounded scores make ties, which must keep their input order.
+        hits.append(Hit(score=round(rng.uniform(0.5, 0.9), 1), payload=payload))
+    return hits
+
+
+def _ids(hits):
+    return [hit.payload["unit_id"] for hit in hits]
+
+
+def test_matches_heuristic_without_vectors():
+    for query in ("Is an electronic record admissible without a certificate?", "arrest and bail under 482", "board approval"):
+        hits = _hits(120)
+        assert _ids(answer_llm.vector_rerank(query, hits, [[0.1, 0.2]])) == _ids(answer_llm.heuristic_rerank(query, hits))
+    assert answer_llm.vector_rerank("anything", []) == []
+
+
+def test_rewrites_score_returned_vectors():
+    hits = _hits(3)
+    for hit, vector in zip(hits, ([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])):
+        hit.vector = vector
+        hit.payload.update(search_text="", section_heading="", doc_title="")
+    original = _ids(answer_llm.vector_rerank("q", hits, [[1.0, 0.1, 0.0]]))
+    assert original[0] == "u0", original
+    # A rewrite matching the third chunk lifts it to the top.
+    rewritten = _ids(answer_llm.vector_rerank("q", hits, [[1.0, 0.1, 0.0], [0.0, 0.0, 1.0]]))
+    assert rewritten == ["u2", "u0", "u1"], rewritten
+
+
+def test_mmr_demotes_near_duplicates():
+    hits = _hits(3)
+    for hit, (score, vector) in zip(hits, ((0.9, [1.0, 0.0]), (0.89, [1.0, -0.01]), (0.7, [0.0, 1.0]))):
+        hit.score, hit.vector = score, vector
+        hit.payload.update(search_text="", section_heading="", doc_title="")
+    query_vectors = [[1.0, 0.3]]
+    assert _ids(answer_llm.vector_rerank("q", hits, query_vectors)) == ["u0", "u1", "u2"]
+    assert _ids(answer_llm.vector_rerank("q", hits, query_vectors, mmr_lambda=0.5, mmr_limit=2)) == ["u0", "u2", "u1"]
+
+
+def test_search_returns_vectors_on_request():
+    rng = random.Random(3)
+    client = QdrantClient(":memory:")
+    client.create_collection(answer_llm.QDRANT_COLLECTION, vectors_config=models.VectorParams(size=8, distance=models.Distance.COSINE))
+    client.upsert(
+        answer_llm.QDRANT_COLLECTION,
+        points=[models.PointStruct(id=i, vector=[rng.uniform(-1, 1) for _ in range(8)], payload={"n": i}) for i in range(40)],
+    )
+    original = answer_llm.qdrant
+    answer_llm.qdrant = client
+    try:
+        query = [rng.uniform(-1, 1) for _ in range(8)]
+        plain = answer_llm.qdrant_search(query, top_k=2)
+        with_vectors = answer_llm.qdrant_search(query, top_k=2, with_vectors=True)
+    finally:
+        answer_llm.qdrant = original
+    assert [hit.payload for hit in plain] == [hit.payload for hit in with_vectors]
+    assert all(hit.vector is None for hit in plain)
+    assert all(len(hit.vector) == 8 for hit in with_vectors)
+
+
+def main():
+    print("\n" + "=" * 80)
+    print("Vectorized reranker test")
+    print("=" * 80)
+    for test in (
+        test_matches_heuristic_without_vectors,
+        test_rewrites_score_returned_vectors,
+        test_mmr_demotes_near_duplicates,
+        test_search_returns_vectors_on_request,
+    ):
+        test()
+        print(f"   ✓ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()